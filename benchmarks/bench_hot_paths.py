@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+
+# Benchmark the database and ingest hot paths on synthetic libraries.
+# Each benchmark records the time spent in the hot path, the throughput in items per second, and
+# the peak memory allocated by the hot path. Results can be compared against a stored baseline to
+# catch performance regressions in `database.py` and `core.py`.
+#
+# Run from the repository root with the package installed, for example:
+#   python benchmarks/bench_hot_paths.py --sizes 10000 100000
+#   python benchmarks/bench_hot_paths.py --sizes 10000 --update-baseline
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from musicmanager.core import SpotifyManager
+from musicmanager.synthetic import SyntheticLibrary, SyntheticSpotify, chunked
+
+# Default location of the stored baseline.
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+# Number of items passed to each `insert_*` call.
+CHUNK_SIZE = 10000
+
+# Number of tracks already in the database for the populated insert benchmark, as a multiple of
+# the number of tracks inserted.
+POPULATED_FACTOR = 5
+
+
+class Measurement:
+    """
+    Accumulates the time and peak memory of the measured sections of one benchmark.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.seconds = 0.0
+        self.peak_bytes = 0
+
+    @contextlib.contextmanager
+    def measure(self):
+        """
+        Context to add the enclosed section to the measurement.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        yield
+        self.seconds += time.perf_counter() - start
+
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1] - before
+            self.peak_bytes = max(self.peak_bytes, peak)
+
+    def result(self):
+        """
+        Returns the measurement as a dictionary.
+        """
+        return {
+            "items": self.items,
+            "seconds": self.seconds,
+            "items_per_second": self.items / self.seconds if self.seconds else 0.0,
+            "peak_bytes": self.peak_bytes,
+        }
+
+
+def create_app(path):
+    """
+    Returns an application with a new database at the given path.
+    """
+    app = SpotifyManager(path)
+    app.db.create_tables()
+    return app
+
+
+def bench_inserts(app, library, results):
+    """
+    Benchmark the `insert_*` functions by loading the whole library in chunks. Adding the
+    inserted items to the search index, which is otherwise done on commit, is measured too.
+    """
+    for name, items, insert in [
+        ("insert_artists", library.iter_artists(), app.db.insert_artists),
+        ("insert_albums", library.iter_albums(), app.db.insert_albums),
+        ("insert_tracks", library.iter_tracks(), app.db.insert_tracks),
+    ]:
+        measurement = Measurement(0)
+        with app.db.transaction():
+            for chunk in chunked(items, CHUNK_SIZE):
+                with measurement.measure():
+                    insert(chunk)
+                measurement.items += len(chunk)
+            with measurement.measure():
+                app.db.index_queued_items()
+        results[name] = measurement.result()
+
+    # Rate every track, which goes through the upsert and the rating summary triggers.
+    measurement = Measurement(library.num_tracks)
+    with app.db.transaction():
+        for chunk in chunked(library.iter_tracks(), CHUNK_SIZE):
+            with measurement.measure():
+                app.db.insert_tracks(chunk, rating=1)
+        with measurement.measure():
+            app.db.index_queued_items()
+    results["insert_tracks_rated"] = measurement.result()
+
+
+def bench_populated_inserts(app, library, results):
+    """
+    Benchmark `insert_tracks` on a database that already holds a larger library, where keeping
+    the indexes and the search index up to date costs the most.
+    """
+    existing = SyntheticLibrary(POPULATED_FACTOR * library.num_tracks, seed=1)
+    with app.db.bulk_load():
+        for items, insert in [
+            (existing.iter_artists(), app.db.insert_artists),
+            (existing.iter_albums(), app.db.insert_albums),
+            (existing.iter_tracks(), app.db.insert_tracks),
+            (library.iter_artists(), app.db.insert_artists),
+            (library.iter_albums(), app.db.insert_albums),
+        ]:
+            for chunk in chunked(items, CHUNK_SIZE):
+                insert(chunk)
+
+    measurement = Measurement(library.num_tracks)
+    with app.db.transaction():
+        for chunk in chunked(library.iter_tracks(), CHUNK_SIZE):
+            with measurement.measure():
+                app.db.insert_tracks(chunk)
+        with measurement.measure():
+            app.db.index_queued_items()
+    results["insert_tracks_populated"] = measurement.result()
+
+
+def bench_loaders(app, library, results):
+    """
+    Benchmark the `get_*` loaders and `print_summary` on a populated database.
+    """
+    for name, items, load in [
+        ("get_artists", library.num_artists, app.db.get_artists),
+        ("get_albums", library.num_albums, app.db.get_albums),
+        ("get_tracks", library.num_tracks, app.db.get_tracks),
+    ]:
+        measurement = Measurement(items)
+        with measurement.measure():
+            load()
+        results[name] = measurement.result()
+
+    measurement = Measurement(library.num_tracks)
+    with contextlib.redirect_stdout(io.StringIO()):
+        with measurement.measure():
+            app.db.print_summary()
+    results["print_summary"] = measurement.result()
+
+
+def bench_fetch(app, library, results):
+    """
+    Benchmark `fetch_albums` and `fetch_tracks` against the synthetic API, starting from a
+    database that only has artists.
+    """
+    with app.db.transaction():
+        for chunk in chunked(library.iter_artists(), CHUNK_SIZE):
+            app.db.insert_artists(chunk)
+    app.api = SyntheticSpotify(library)
+
+    measurement = Measurement(library.num_albums)
+    with measurement.measure():
+        app.fetch_albums()
+    results["fetch_albums"] = measurement.result()
+
+    measurement = Measurement(library.num_tracks)
+    with measurement.measure():
+        app.fetch_tracks()
+    results["fetch_tracks"] = measurement.result()
+
+
+def run_size(size, directory):
+    """
+    Run all benchmarks for a library with the given number of tracks.
+    """
+    library = SyntheticLibrary(size)
+    results = {}
+
+    app = create_app(directory / f"library_{size}.db")
+    bench_inserts(app, library, results)
+    bench_loaders(app, library, results)
+
+    app = create_app(directory / f"populated_{size}.db")
+    bench_populated_inserts(app, library, results)
+
+    app = create_app(directory / f"fetch_{size}.db")
+    bench_fetch(app, library, results)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of messages for results that regressed from the baseline by more than the
+    tolerance, either in throughput or in peak memory.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+
+            minimum = expected["items_per_second"] * (1 - tolerance)
+            if result["items_per_second"] < minimum:
+                regressions.append(
+                    f"{name} at {size}: {result['items_per_second']:.0f} items/s is below "
+                    f"the baseline of {expected['items_per_second']:.0f} items/s"
+                )
+
+            maximum = expected["peak_bytes"] * (1 + tolerance)
+            if expected["peak_bytes"] and result["peak_bytes"] > maximum:
+                regressions.append(
+                    f"{name} at {size}: {result['peak_bytes']} peak bytes is above "
+                    f"the baseline of {expected['peak_bytes']} peak bytes"
+                )
+    return regressions
+
+
+def print_results(results):
+    """
+    Print a table of the results.
+    """
+    print(
+        f"{'size':>10} {'benchmark':<20} {'seconds':>10} {'items/s':>12} {'peak MiB':>10}"
+    )
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            print(
+                f"{size:>10} {name:<20} {result['seconds']:>10.3f} "
+                f"{result['items_per_second']:>12.0f} {result['peak_bytes'] / 2**20:>10.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark database and ingest hot paths"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="Number of tracks in each synthetic library, such as 10000 1000000 10000000",
+    )
+    parser.add_argument(
+        "--directory",
+        type=Path,
+        default=None,
+        help="Directory for the benchmark databases, which defaults to a temporary directory",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_PATH,
+        help="Path of the stored baseline",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed fractional regression from the baseline",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip tracing memory allocations, which otherwise slows down every benchmark",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Write the results as JSON to this path"
+    )
+    args = parser.parse_args()
+
+    if not args.no_memory:
+        tracemalloc.start()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.directory or Path(tmp)
+        directory.mkdir(parents=True, exist_ok=True)
+        for size in args.sizes:
+            results[str(size)] = run_size(size, directory)
+
+    print_results(results)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update_baseline:
+        baseline = (
+            json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        )
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}")
+        return 0
+
+    regressions = compare(
+        results, json.loads(args.baseline.read_text()), args.tolerance
+    )
+    for message in regressions:
+        print(f"REGRESSION: {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
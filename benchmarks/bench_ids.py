@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Benchmark the text and binary id formats on synthetic libraries.
+# A library is loaded into a database with text ids, which is then copied and migrated to binary
+# ids. Both databases are vacuumed, so the file sizes compare the pages that are in use, and the
+# same joins and lookups are timed on each.
+#
+# Run from the repository root with the package installed, for example:
+#   python benchmarks/bench_ids.py --sizes 10000 100000
+#   python benchmarks/bench_ids.py --sizes 1000000 --repeat 3
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from musicmanager.database import Database
+from musicmanager.synthetic import SyntheticLibrary, chunked
+
+# Number of items passed to each `insert_*` call.
+CHUNK_SIZE = 10000
+
+# Number of ids looked up by `get_tracks_by_id`, which stays below the variable limit.
+NUM_LOOKUPS = 500
+
+# Join of every track to its album and artist, which reads all of the id columns and indexes.
+JOIN_COMMAND = """
+SELECT COUNT()
+  FROM tracks
+  JOIN albums
+    ON albums.id = tracks.album_id
+  JOIN artists
+    ON artists.id = albums.artist_id
+"""
+
+
+def create_database(path, library):
+    """
+    Returns a database with text ids at the given path, filled with the library.
+    """
+    db = Database(path)
+    db.create_tables(id_format="text")
+    with db.bulk_load():
+        for chunk in chunked(library.iter_artists(), CHUNK_SIZE):
+            db.insert_artists(chunk)
+        for chunk in chunked(library.iter_albums(), CHUNK_SIZE):
+            db.insert_albums(chunk)
+        for chunk in chunked(library.iter_tracks(rated=True), CHUNK_SIZE):
+            for rating in (None, -1, 0, 1):
+                tracks = [track for track in chunk if track.rating == rating]
+                db.insert_tracks(tracks, rating=rating)
+    db._con.execute("VACUUM")
+    return db
+
+
+def best_time(function, repeat):
+    """
+    Returns the lowest wall time in seconds over the repeats of calling the function.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_queries(db, library, repeat):
+    """
+    Returns a dictionary of query names to their lowest time in seconds.
+    """
+    step = max(1, library.num_tracks // NUM_LOOKUPS)
+    track_ids = [library.track_id(i) for i in range(0, library.num_tracks, step)]
+    artist_ids = [library.artist_id(i) for i in range(min(100, library.num_artists))]
+
+    return {
+        "join": best_time(lambda: db._con.execute(JOIN_COMMAND).fetchone(), repeat),
+        "rating_scores": best_time(lambda: db.get_rating_scores(2), repeat),
+        "tracks_by_artist": best_time(
+            lambda: [list(db.query_tracks(id_)) for id_ in artist_ids], repeat
+        ),
+        "tracks_by_id": best_time(lambda: db.get_tracks_by_id(track_ids), repeat),
+        "get_tracks": best_time(db.get_tracks, repeat),
+    }
+
+
+def run_size(size, directory, repeat):
+    """
+    Returns the file size, migration time, and query times of each id format for one library
+    size.
+    """
+    library = SyntheticLibrary(size)
+    text_path = directory / f"ids_text_{size}.db"
+    binary_path = directory / f"ids_binary_{size}.db"
+    for path in (text_path, binary_path):
+        path.unlink(missing_ok=True)
+
+    text_db = create_database(text_path, library)
+    shutil.copyfile(text_path, binary_path)
+    binary_db = Database(binary_path)
+    start = time.perf_counter()
+    binary_db.migrate_ids("binary")
+    migrate_seconds = time.perf_counter() - start
+
+    return {
+        "text": {
+            "bytes": text_path.stat().st_size,
+            "queries": bench_queries(text_db, library, repeat),
+        },
+        "binary": {
+            "bytes": binary_path.stat().st_size,
+            "migrate_seconds": migrate_seconds,
+            "queries": bench_queries(binary_db, library, repeat),
+        },
+    }
+
+
+def print_results(size, result):
+    """
+    Print the comparison of the id formats for one library size.
+    """
+    text = result["text"]
+    binary = result["binary"]
+    print(f"{size} tracks")
+    ratio = binary["bytes"] / text["bytes"]
+    print(
+        f"  {'size':<18} {text['bytes']:>12} B {binary['bytes']:>12} B {ratio:>7.2f}x"
+    )
+    for name, seconds in text["queries"].items():
+        binary_seconds = binary["queries"][name]
+        ratio = binary_seconds / seconds if seconds else 0.0
+        print(
+            f"  {name:<18} {1000 * seconds:>11.1f} ms {1000 * binary_seconds:>11.1f} ms "
+            f"{ratio:>7.2f}x"
+        )
+    print(f"  migrated to binary in {binary['migrate_seconds']:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the id formats")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="Number of tracks in each synthetic library",
+    )
+    parser.add_argument(
+        "--directory",
+        type=Path,
+        default=None,
+        help="Directory for the benchmark databases, which defaults to a temporary directory",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of runs of each query, of which the fastest is reported",
+    )
+    args = parser.parse_args()
+
+    print(f"{'':<20} {'text':>14} {'binary':>14} {'ratio':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.directory or Path(tmp)
+        directory.mkdir(parents=True, exist_ok=True)
+        for size in args.sizes:
+            print_results(size, run_size(size, directory, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
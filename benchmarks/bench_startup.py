@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Benchmark the startup time of the command line interface.
+# Each command is run in a fresh interpreter, since startup cost is dominated by imports. The import
+# time of `musicmanager.core` is broken down by module with `python -X importtime`, and commands
+# that do not send requests are checked to not import heavy modules such as `requests`.
+#
+# Run from the repository root with the package installed, for example:
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --repeat 20 --top 15
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Modules that commands without requests, profiling, or analytics should never import.
+HEAVY_MODULES = (
+    "requests",
+    "urllib3",
+    "http.server",
+    "cProfile",
+    "pstats",
+    "numpy",
+    "pyarrow",
+)
+
+# Script that runs a command and prints the heavy modules it imported.
+CHECK_SCRIPT = """
+import sys
+from musicmanager.core import SpotifyManager
+try:
+    SpotifyManager(sys.argv[1]).run(sys.argv[2:])
+except SystemExit:
+    pass
+print(",".join(name for name in {modules!r} if name in sys.modules), file=sys.stderr)
+"""
+
+
+def python_env():
+    """
+    Returns the environment for child interpreters, which can import the package from the same
+    path as this interpreter.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+    return env
+
+
+def import_times(code, repeat):
+    """
+    Returns a dictionary of module names to the lowest cumulative import time in microseconds
+    over the repeats of running the code with `python -X importtime`.
+    """
+    times = {}
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            env=python_env(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            # Lines are formatted as "import time: self | cumulative | indented name".
+            _, cumulative, name = line[len("import time:") :].split("|")
+            module = name.strip()
+            times[module] = min(times.get(module, float("inf")), int(cumulative))
+    return times
+
+
+def command_time(database, argv, repeat):
+    """
+    Returns the lowest wall time in seconds over the repeats of running a command, and the heavy
+    modules it imported.
+    """
+    best = float("inf")
+    heavy = ""
+    script = CHECK_SCRIPT.format(modules=HEAVY_MODULES)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", script, str(database), *argv],
+            env=python_env(),
+            capture_output=True,
+            text=True,
+        )
+        best = min(best, time.perf_counter() - start)
+        heavy = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark command line startup")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of runs of each measurement, of which the fastest is reported",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest imports to list"
+    )
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="Fail if importing musicmanager.core takes longer than this",
+    )
+    args = parser.parse_args()
+
+    # Time a bare interpreter to separate its startup from the package.
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+    baseline = (time.perf_counter() - start) / args.repeat
+    print(f"Interpreter startup: {1000 * baseline:.1f} ms")
+
+    # Leave out modules that the interpreter imports on its own at startup.
+    startup = import_times("pass", 1)
+    times = import_times("import musicmanager.core", args.repeat)
+    total = times.get("musicmanager.core", 0) / 1000
+    print(f"Import musicmanager.core: {total:.1f} ms")
+    print(f"Slowest {args.top} imports by cumulative time:")
+    ranked = sorted(
+        [item for item in times.items() if item[0] not in startup],
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    for module, microseconds in ranked[: args.top]:
+        print(f"{microseconds / 1000:>10.1f} ms  {module}")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / "bench.db"
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                CHECK_SCRIPT.format(modules=()),
+                str(database),
+                "init",
+            ],
+            env=python_env(),
+            capture_output=True,
+            check=True,
+        )
+        for argv in [["--help"], ["show"], ["tracks", "--rated"]]:
+            seconds, heavy = command_time(database, argv, args.repeat)
+            print(f"{' '.join(argv):<16} {1000 * seconds:>8.1f} ms")
+            if heavy:
+                print(f"  imported heavy modules: {heavy}")
+                failed = True
+
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        print(f"Import time exceeds {args.max_import_ms} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,61 @@
 import argparse
+import json
 import logging
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 
-from musicmanager.database import Database
-from musicmanager.spotify import Spotify
+from musicmanager import metrics, profiling, recommend, similarity, tracing, transfer
+from musicmanager.database import (
+    ID_FORMATS,
+    JOURNAL_SCHEMA,
+    RUN_COUNTS,
+    SCHEMA,
+    Database,
+)
+from musicmanager.progress import Progress, format_duration
+
+# Largest number of tracks accepted by one audio features request.
+MAX_FEATURES_BATCH = 100
+
+# Largest number of artists accepted by one several artists request.
+MAX_ARTISTS_BATCH = 50
+
+# Largest number of tracks added or removed by one playlist items request.
+MAX_PLAYLIST_BATCH = 100
+
+# Factor applied to the priority of an artist without ratings when it is passed on to its related
+# artists, so the priority fades with each link away from rated artists.
+DISCOVER_DECAY = 0.5
+
+
+def add_api_arguments(subparser):
+    """
+    Add the arguments shared by commands that send requests to the Spotify API.
+    """
+    subparser.add_argument(
+        "--token",
+        type=str,
+        help="Spotify access token, which is required unless replaying",
+    )
+    subparser.add_argument(
+        "--api-url",
+        type=str,
+        help="Base URL of the Spotify API, which defaults to the Spotify Web API",
+    )
+    subparser.add_argument(
+        "--record",
+        type=str,
+        help="Save every request and response to a compressed archive at this path",
+    )
+    subparser.add_argument(
+        "--replay",
+        type=str,
+        help="Serve responses from an archive at this path without sending requests",
+    )
 
 
 class SpotifyManager:
@@ -14,17 +67,7 @@ class SpotifyManager:
         """
         Initialize the application.
         """
-        # Configure logger.
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
-
-        # Reduce severity of loggings from external imports.
-        logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
-
-        # Create the database interface. This opens a database connection automatically.
+        # Create the database interface. This opens a database connection on first use.
         self.db = Database(database_path)
 
         # The Spotify interface depends on parsing arguments for the token.
@@ -32,6 +75,56 @@ class SpotifyManager:
 
         # Command line arguments.
         parser = argparse.ArgumentParser(description="Spotify Manager")
+        parser.add_argument(
+            "--verbose",
+            "-v",
+            action="store_true",
+            help="Log debug messages for each request and item",
+        )
+        parser.add_argument(
+            "--profile",
+            type=str,
+            metavar="PATH",
+            help="Profile the command and write the profile to this path",
+        )
+        parser.add_argument(
+            "--profile-mode",
+            type=str,
+            choices=profiling.MODES,
+            default="cprofile",
+            help="Write pstats data with cProfile or collapsed stacks with a sampling profiler",
+        )
+        parser.add_argument(
+            "--profile-memory",
+            action="store_true",
+            help="Trace memory allocations and report the top allocation sites",
+        )
+        parser.add_argument(
+            "--profile-top",
+            type=int,
+            default=20,
+            help="Number of functions and allocation sites in the profile summary",
+        )
+        parser.add_argument(
+            "--metrics",
+            type=str,
+            metavar="PATH",
+            help="Write metrics in the Prometheus text format to this path, or '-' to print "
+            "them, at the end of the command",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            metavar="PORT",
+            help="Serve metrics in the Prometheus text format on this local port while the "
+            "command runs",
+        )
+        parser.add_argument(
+            "--trace",
+            type=str,
+            metavar="PATH",
+            help="Record spans of work and write them to this path in the Chrome trace format",
+        )
         subparsers = parser.add_subparsers(help="sub-command help", dest="subparser")
         self.parser = parser
 
@@ -43,12 +136,17 @@ class SpotifyManager:
             action="store_true",
             help="Set to drop and re-create any existing tables",
         )
+        subparser.add_argument(
+            "--id-format",
+            type=str,
+            choices=ID_FORMATS,
+            help="Store ids as text or as compact binary values, which keeps existing tables "
+            "in their format by default",
+        )
 
         # Add command.
         subparser = subparsers.add_parser("add", help="Add items to the database")
-        subparser.add_argument(
-            "--token", type=str, required=True, help="Spotify access token"
-        )
+        add_api_arguments(subparser)
         subparser.add_argument(
             "--playlist-id",
             type=str,
@@ -61,37 +159,612 @@ class SpotifyManager:
             help="Rate each track with the given rating",
         )
 
+        # Diff command.
+        subparser = subparsers.add_parser(
+            "diff",
+            help="Compare the tracks of a playlist with the database without adding them",
+        )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--playlist-id",
+            type=str,
+            required=True,
+            help="Spotify ID of the playlist to compare",
+        )
+        subparser.add_argument(
+            "--list",
+            type=str,
+            choices=["new", "present", "rated", "unrated"],
+            help="Also list the tracks of the playlist in this category",
+        )
+
         # Fetch command.
         subparser = subparsers.add_parser(
             "fetch",
             help="Fetch album data for known artists and track data for known albums",
         )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--budget",
+            type=int,
+            help="Largest number of artists and of albums to fetch, starting from those with "
+            "the most liked tracks",
+        )
+
+        # Fetch features command.
+        subparser = subparsers.add_parser(
+            "fetch-features",
+            help="Fetch audio features for tracks that do not have them yet",
+        )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of requests sent concurrently",
+        )
+        subparser.add_argument(
+            "--batch-size",
+            type=int,
+            choices=range(1, MAX_FEATURES_BATCH + 1),
+            default=MAX_FEATURES_BATCH,
+            metavar=f"[1-{MAX_FEATURES_BATCH}]",
+            help="Number of tracks per request",
+        )
+
+        # Refresh artists command.
+        subparser = subparsers.add_parser(
+            "refresh-artists",
+            help="Fetch the names, genres, popularity, and followers of known artists",
+        )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--max-age",
+            type=float,
+            default=7,
+            help="Number of days after which the metadata of an artist is fetched again",
+        )
+        subparser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of requests sent concurrently",
+        )
+        subparser.add_argument(
+            "--batch-size",
+            type=int,
+            choices=range(1, MAX_ARTISTS_BATCH + 1),
+            default=MAX_ARTISTS_BATCH,
+            metavar=f"[1-{MAX_ARTISTS_BATCH}]",
+            help="Number of artists per request",
+        )
+
+        # Export playlist command.
+        subparser = subparsers.add_parser(
+            "export-playlist",
+            help="Update a Spotify playlist to hold the liked or recommended tracks",
+        )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--playlist-id",
+            type=str,
+            required=True,
+            help="Spotify ID of the playlist to update, which must already exist",
+        )
+        subparser.add_argument(
+            "--source",
+            type=str,
+            choices=["liked", "recommendations"],
+            default="liked",
+            help="Tracks to put in the playlist",
+        )
+        subparser.add_argument(
+            "--limit",
+            type=int,
+            help="Largest number of tracks, which defaults to all liked tracks or the top 100 "
+            "recommendations",
+        )
         subparser.add_argument(
-            "--token", type=str, required=True, help="Spotify access token"
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of removal requests sent concurrently",
+        )
+
+        # Discover command.
+        subparser = subparsers.add_parser(
+            "discover",
+            help="Add artists related to known artists, starting from the best rated",
+        )
+        add_api_arguments(subparser)
+        subparser.add_argument(
+            "--depth",
+            type=int,
+            default=2,
+            help="Largest number of related artist links from the library to follow",
+        )
+        subparser.add_argument(
+            "--budget",
+            type=int,
+            default=100,
+            help="Largest number of artists whose related artists are fetched",
         )
 
         # Show command.
         subparsers.add_parser("show", help="Print database summary information")
 
+        # Rebuild command.
+        subparsers.add_parser(
+            "rebuild",
+            help="Rebuild the search index and rating summaries from the item tables",
+        )
+
+        # Migrate ids command.
+        subparser = subparsers.add_parser(
+            "migrate-ids", help="Convert the stored ids to another format"
+        )
+        subparser.add_argument(
+            "--format",
+            type=str,
+            choices=ID_FORMATS,
+            required=True,
+            help="Format to convert the ids to",
+        )
+
+        # Tracks command.
+        subparser = subparsers.add_parser("tracks", help="List tracks in the database")
+        subparser.add_argument(
+            "--artist",
+            type=str,
+            help="Only list tracks by the artist with this id or name",
+        )
+        group = subparser.add_mutually_exclusive_group()
+        group.add_argument(
+            "--rating",
+            type=int,
+            choices=[-1, 0, 1],
+            default=None,
+            help="Only list tracks with the given rating",
+        )
+        group.add_argument(
+            "--rated",
+            action="store_const",
+            const=True,
+            default=None,
+            help="Only list rated tracks",
+        )
+        group.add_argument(
+            "--unrated",
+            action="store_const",
+            const=False,
+            dest="rated",
+            help="Only list unrated tracks",
+        )
+
+        # Albums command.
+        subparser = subparsers.add_parser(
+            "albums", help="List albums in the database with their rating counts"
+        )
+        subparser.add_argument(
+            "--artist",
+            type=str,
+            help="Only list albums by the artist with this id or name",
+        )
+
+        # Artists command.
+        subparser = subparsers.add_parser(
+            "artists", help="List artists in the database with their rating counts"
+        )
+        subparser.add_argument(
+            "--top-rated",
+            action="store_true",
+            help="Only list artists with rated tracks, ordered from most to least liked",
+        )
+        subparser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of artists to list"
+        )
+
+        # Search command.
+        subparser = subparsers.add_parser(
+            "search", help="Search track, album, and artist names"
+        )
+        subparser.add_argument("text", type=str, help="Text to search for")
+        subparser.add_argument(
+            "--limit", type=int, default=20, help="Maximum number of results to list"
+        )
+
+        # Similar command.
+        subparser = subparsers.add_parser(
+            "similar",
+            help="List unrated tracks with audio features closest to a track or the liked tracks",
+        )
+        subparser.add_argument(
+            "track_id",
+            type=str,
+            nargs="?",
+            help="Spotify ID of the track to compare against, which defaults to all liked tracks",
+        )
+        subparser.add_argument(
+            "--limit", type=int, default=20, help="Maximum number of tracks to list"
+        )
+        subparser.add_argument(
+            "--include-rated", action="store_true", help="Also list rated tracks"
+        )
+        subparser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Load all features from the database instead of the feature cache",
+        )
+
+        # Recommend command.
+        subparser = subparsers.add_parser(
+            "recommend",
+            help="Score unrated tracks by the ratings of their album, artist, and similar tracks",
+        )
+        subparser.add_argument(
+            "--limit", type=int, default=20, help="Maximum number of tracks to list"
+        )
+        subparser.add_argument(
+            "--full",
+            action="store_true",
+            help="Score all unrated tracks instead of only those affected by rating changes",
+        )
+        subparser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Load all features from the database instead of the feature cache",
+        )
+
+        # Runs command.
+        subparser = subparsers.add_parser(
+            "runs", help="List recorded add and fetch runs with their throughput"
+        )
+        subparser.add_argument(
+            "--command",
+            type=str,
+            choices=[
+                "add",
+                "fetch",
+                "fetch-features",
+                "refresh-artists",
+                "export-playlist",
+                "discover",
+            ],
+            help="Only list runs of this command",
+        )
+        subparser.add_argument(
+            "--limit", type=int, default=20, help="Maximum number of runs to list"
+        )
+        subparser.add_argument(
+            "--weekly",
+            action="store_true",
+            help="List totals and throughput per week instead of individual runs",
+        )
+
+        # Changes command.
+        subparser = subparsers.add_parser(
+            "changes",
+            help="Stream changes to the tracks, albums, and artists as JSON Lines",
+        )
+        subparser.add_argument(
+            "--since",
+            type=int,
+            default=0,
+            metavar="SEQ",
+            help="Only stream changes with a sequence number above this one",
+        )
+        subparser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of changes to stream",
+        )
+        subparser.add_argument(
+            "--compact",
+            action="store_true",
+            help="Delete changes that are followed by a newer change of the same item and "
+            "kind of change instead of streaming",
+        )
+
+        # Serve command.
+        subparser = subparsers.add_parser(
+            "serve", help="Serve read-only queries of the library as a local JSON API"
+        )
+        subparser.add_argument(
+            "--host", type=str, default="127.0.0.1", help="Address to bind"
+        )
+        subparser.add_argument("--port", type=int, default=8080, help="Port to bind")
+        subparser.add_argument(
+            "--connections",
+            type=int,
+            default=4,
+            help="Number of read-only database connections shared by the requests",
+        )
+        subparser.add_argument(
+            "--cache-size",
+            type=int,
+            default=256,
+            help="Number of query responses kept until the database is written, or 0 to "
+            "disable caching",
+        )
+
+        # Export and import commands.
+        for name, help_ in [
+            ("export", "Export the library to one file per table"),
+            ("import", "Import the library into an empty database"),
+        ]:
+            subparser = subparsers.add_parser(name, help=help_)
+            subparser.add_argument(
+                "directory", type=str, help="Directory containing the table files"
+            )
+            subparser.add_argument(
+                "--format",
+                type=str,
+                choices=transfer.FORMATS,
+                default="jsonl",
+                help="File format of the table files",
+            )
+            subparser.add_argument(
+                "--chunk-size",
+                type=int,
+                default=transfer.CHUNK_SIZE,
+                help="Number of rows to read or write at a time",
+            )
+
     def run(self, argv=None):
         args = self.parser.parse_args(argv)
 
-        # Execute the parsed command.
+        # Configure logging once the arguments are known.
+        self.configure_logging(verbose=args.verbose)
+
+        server = None
+        if args.metrics_port is not None:
+            server = metrics.REGISTRY.serve(args.metrics_port)
+
+        tracer = None
+        if args.trace is not None:
+            tracer = tracing.Tracer()
+            tracing.set_tracer(tracer)
+
+        try:
+            # Execute the parsed command, optionally under the profiler.
+            with tracing.span("command", name=args.subparser):
+                if args.profile is not None or args.profile_memory:
+                    profiling.profile(
+                        lambda: self.dispatch(args),
+                        path=args.profile,
+                        mode=args.profile_mode,
+                        memory=args.profile_memory,
+                        top=args.profile_top,
+                    )
+                else:
+                    self.dispatch(args)
+        finally:
+            if tracer is not None:
+                tracing.set_tracer(None)
+                tracer.write(args.trace)
+
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+            if args.metrics == "-":
+                sys.stdout.write(metrics.REGISTRY.render())
+            elif args.metrics is not None:
+                metrics.REGISTRY.write(args.metrics)
+
+    def configure_logging(self, verbose=False):
+        """
+        Configure the logger to show info messages, or debug messages when `verbose` is set.
+        """
+        logging.basicConfig(
+            format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+        logging.getLogger().setLevel(logging.DEBUG if verbose else logging.INFO)
+
+        # Reduce severity of loggings from external imports.
+        logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
+
+    def dispatch(self, args):
+        """
+        Execute the command given by the parsed arguments.
+        """
         if args.subparser == "init":
-            self.db.create_tables(force=args.force)
+            try:
+                self.db.create_tables(force=args.force, id_format=args.id_format)
+            except ValueError as ex:
+                logging.error(ex)
         elif args.subparser == "add":
-            self.api = Spotify(args.token)
-            self.insert_items_from_playlist(args.playlist_id, rating=args.rating)
+            self.api = self.create_api(args)
+            try:
+                self.record_run(
+                    "add",
+                    lambda: self.insert_items_from_playlist(
+                        args.playlist_id, rating=args.rating
+                    ),
+                )
+            finally:
+                self.api.close()
+        elif args.subparser == "diff":
+            self.api = self.create_api(args)
+            try:
+                self.print_diff(args.playlist_id, category=args.list)
+            finally:
+                self.api.close()
         elif args.subparser == "fetch":
-            self.api = Spotify(args.token)
-            self.fetch_albums()
-            self.fetch_tracks()
+            self.api = self.create_api(args)
+            try:
+                self.record_run("fetch", lambda: self.fetch(budget=args.budget))
+            finally:
+                self.api.close()
+        elif args.subparser == "fetch-features":
+            self.api = self.create_api(args)
+            try:
+                self.record_run(
+                    "fetch-features",
+                    lambda: self.fetch_features(
+                        workers=args.workers, batch_size=args.batch_size
+                    ),
+                )
+            finally:
+                self.api.close()
+        elif args.subparser == "refresh-artists":
+            self.api = self.create_api(args)
+            try:
+                self.record_run(
+                    "refresh-artists",
+                    lambda: self.refresh_artists(
+                        max_age=args.max_age,
+                        workers=args.workers,
+                        batch_size=args.batch_size,
+                    ),
+                )
+            finally:
+                self.api.close()
+        elif args.subparser == "export-playlist":
+            self.api = self.create_api(args)
+            try:
+                self.record_run(
+                    "export-playlist",
+                    lambda: self.export_playlist(
+                        args.playlist_id,
+                        source=args.source,
+                        limit=args.limit,
+                        workers=args.workers,
+                    ),
+                )
+            finally:
+                self.api.close()
+        elif args.subparser == "discover":
+            self.api = self.create_api(args)
+            try:
+                self.record_run(
+                    "discover",
+                    lambda: self.discover(max_depth=args.depth, budget=args.budget),
+                )
+            finally:
+                self.api.close()
         elif args.subparser == "show":
             self.db.print_summary()
+        elif args.subparser == "rebuild":
+            with self.db.transaction():
+                self.db.rebuild()
+        elif args.subparser == "migrate-ids":
+            self.migrate_ids(args.format)
+        elif args.subparser == "tracks":
+            self.print_tracks(args.artist, rating=args.rating, rated=args.rated)
+        elif args.subparser == "albums":
+            self.print_albums(args.artist)
+        elif args.subparser == "artists":
+            self.print_artists(top_rated=args.top_rated, limit=args.limit)
+        elif args.subparser == "search":
+            self.print_search(args.text, limit=args.limit)
+        elif args.subparser == "similar":
+            self.print_similar(
+                args.track_id,
+                limit=args.limit,
+                include_rated=args.include_rated,
+                cache=not args.no_cache,
+            )
+        elif args.subparser == "recommend":
+            self.print_recommendations(
+                limit=args.limit, full=args.full, cache=not args.no_cache
+            )
+        elif args.subparser == "runs":
+            if args.weekly:
+                self.print_run_trends(args.command)
+            else:
+                self.print_runs(args.command, limit=args.limit)
+        elif args.subparser == "changes":
+            if args.compact:
+                self.compact_changes()
+            else:
+                self.print_changes(since=args.since, limit=args.limit)
+        elif args.subparser == "serve":
+            self.serve(
+                host=args.host,
+                port=args.port,
+                connections=args.connections,
+                cache_size=args.cache_size,
+            )
+        elif args.subparser == "export":
+            transfer.export_library(
+                self.db, args.directory, args.format, chunk_size=args.chunk_size
+            )
+        elif args.subparser == "import":
+            try:
+                transfer.import_library(
+                    self.db, args.directory, args.format, chunk_size=args.chunk_size
+                )
+            except RuntimeError as ex:
+                logging.error(ex)
         else:
             # Default to print help.
             self.parser.print_help()
 
+    def create_api(self, args):
+        """
+        Create the Spotify interface from the parsed arguments of a command that sends requests.
+        """
+        if args.token is None and args.replay is None:
+            self.parser.error("the --token argument is required unless replaying")
+
+        # Import here, since requests is slow to import and only needed by these commands.
+        from musicmanager.spotify import API_URL, Spotify
+
+        api_url = args.api_url if args.api_url is not None else API_URL
+        return Spotify(
+            args.token, api_url=api_url, record=args.record, replay=args.replay
+        )
+
+    def get_run_counts(self):
+        """
+        Returns the current totals of the counts recorded for each run. The totals are read from
+        the metrics registry, so a run records the changes made by this process while it runs.
+        """
+        return {
+            "num_requests": metrics.REQUESTS.value(),
+            "num_bytes": metrics.RESPONSE_BYTES.value(),
+            "num_rate_limited": metrics.REQUESTS.value(status=429),
+            "num_items_fetched": metrics.ITEMS_FETCHED.value(),
+            "num_rows_inserted": sum(
+                metrics.ROWS_INSERTED.value(table=table) for table in SCHEMA
+            ),
+            "num_failures": metrics.FAILURES.value(),
+        }
+
+    def record_run(self, command, func):
+        """
+        Call a function that sends requests and record it in the runs table, including whether
+        it completed, failed, or was interrupted.
+        """
+        with self.db.transaction():
+            self.db.create_auxiliary_tables()
+            run_id = self.db.insert_run(command, time.time())
+
+        before = self.get_run_counts()
+        status = "failed"
+        try:
+            func()
+            status = "completed"
+        except KeyboardInterrupt:
+            status = "interrupted"
+            raise
+        finally:
+            after = self.get_run_counts()
+            counts = {name: after[name] - before[name] for name in RUN_COUNTS}
+            time_finished = time.time()
+            with self.db.transaction():
+                self.db.update_run(run_id, time_finished, status, counts)
+
+            logging.info(
+                f"Run {run_id} {status}: {counts['num_items_fetched']} items fetched, "
+                f"{counts['num_rows_inserted']} rows inserted, {counts['num_requests']} "
+                f"requests, {counts['num_failures']} failures, "
+                f"{counts['num_rate_limited']} rate limited"
+            )
+
     def insert_items_from_playlist(self, playlist_id, rating=None):
         """
         Get tracks from a playlist and insert data from tracks, albums, and artists into the
@@ -101,46 +774,479 @@ class SpotifyManager:
             logging.error("Spotify interface is not initialized")
             return
 
-        playlist = self.api.get_playlist(playlist_id)
+        # Tracks already in the library are skipped unless they are rated, since their album and
+        # artist were inserted along with them.
+        skip = partial(self.db.known_ids, "tracks") if rating is None else None
+        playlist = self.api.get_playlist(playlist_id, skip_track_ids=skip)
+        if playlist is None:
+            logging.error(f"Could not fetch playlist {repr(playlist_id)}")
+            metrics.FAILURES.inc(kind="playlist")
+            return
 
         with self.db.transaction():
             self.db.insert_tracks(playlist.tracks, rating=rating)
             self.db.insert_albums(playlist.albums)
             self.db.insert_artists(playlist.artists)
 
-    def fetch_albums(self):
+    def fetch(self, budget=None):
         """
-        Fetch all albums from known artists and insert into the database.
+        Fetch albums for known artists, then tracks for known albums. With a budget, at most
+        that many of the most valuable artists and albums are fetched.
         """
-        artists = self.db.get_artists()
-        for artist in artists:
-            # Skip artists that have previously been fetched.
-            # TODO: Implement a timeout.
-            if artist.time_fetched > 0:
-                continue
+        self.fetch_albums(budget=budget)
+        self.fetch_tracks(budget=budget)
 
+    def fetch_albums(self, budget=None):
+        """
+        Fetch all albums from known artists and insert into the database, starting from the
+        artists with the most liked tracks. With a budget, at most that many artists are
+        fetched. Artists that fail are skipped and fetched again by the next run.
+        """
+        # Skip artists that have previously been fetched.
+        # TODO: Implement a timeout.
+        artists = self.db.get_artists_to_fetch(limit=budget)
+
+        progress = Progress(len(artists), "Fetching albums")
+        for artist in artists:
             # Get album data and add it to the database.
-            albums = self.api.get_artist_albums(artist)
-            with self.db.transaction():
-                self.db.insert_albums(albums)
-                self.db.update_artist_time_fetched(artist)
+            with tracing.span("artist", id=artist.id, name=artist.name):
+                albums = self.api.get_artist_albums(artist)
+                if albums is None:
+                    logging.warning(f"Could not fetch albums for artist {artist.id}")
+                    metrics.FAILURES.inc(kind="artist")
+                else:
+                    with tracing.span("transaction"), self.db.transaction():
+                        self.db.insert_albums(albums)
+                        self.db.update_artist_time_fetched(artist)
+            progress.update()
+        progress.close()
 
-    def fetch_tracks(self):
+    def fetch_tracks(self, budget=None):
         """
-        Fetch all tracks from known albums and insert into the database.
+        Fetch all tracks from known albums and insert into the database, starting from the
+        albums of the artists with the most liked tracks. With a budget, at most that many
+        albums are fetched. Albums that fail are skipped and fetched again by the next run.
         """
-        albums = self.db.get_albums()
+        # Skip albums that have previously been fetched.
+        # TODO: Implement a timeout.
+        albums = self.db.get_albums_to_fetch(limit=budget)
+
+        progress = Progress(len(albums), "Fetching tracks")
         for album in albums:
-            # Skip albums that have previously been fetched.
-            # TODO: Implement a timeout.
-            if album.time_fetched > 0:
+            # Get track data and add it to the database.
+            with tracing.span("album", id=album.id, name=album.name):
+                tracks = self.api.get_album_tracks(album)
+                if tracks is None:
+                    logging.warning(f"Could not fetch tracks for album {album.id}")
+                    metrics.FAILURES.inc(kind="album")
+                else:
+                    with tracing.span("transaction"), self.db.transaction():
+                        self.db.insert_tracks(tracks)
+                        self.db.update_album_time_fetched(album)
+            progress.update()
+        progress.close()
+
+    def fetch_batches(self, batches, request, write, workers=4):
+        """
+        Pipeline batch requests on a thread pool. Up to twice `workers` requests are in flight
+        at once, while this thread reads the next batches and writes the results in order.
+        `request` is called with each batch on the pool and `write` with the batch and its
+        result on this thread, so database access stays on one connection.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for batch in batches:
+                future = executor.submit(request, batch)
+                pending.append((batch, future))
+                if len(pending) >= 2 * workers:
+                    batch, future = pending.popleft()
+                    write(batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                write(batch, future.result())
+
+    def fetch_features(self, workers=4, batch_size=MAX_FEATURES_BATCH):
+        """
+        Fetch audio features for tracks without them and insert into the database. Each request
+        covers a batch of up to `batch_size` tracks, and requests are pipelined with
+        `fetch_batches`. Batches that fail are skipped and fetched again by the next run.
+        """
+        total = self.db.count_tracks_without_features()
+        progress = Progress(total, "Fetching audio features")
+
+        def request(batch):
+            with tracing.span("batch", size=len(batch)):
+                return self.api.get_audio_features(batch)
+
+        def write(batch, features):
+            if features is None:
+                logging.warning(
+                    f"Could not fetch audio features for {len(batch)} tracks"
+                )
+                metrics.FAILURES.inc(len(batch), kind="audio_features")
+            else:
+                with tracing.span("transaction"), self.db.transaction():
+                    self.db.insert_audio_features(features)
+            progress.update(len(batch))
+
+        batches = self.db.iter_tracks_without_features(batch_size)
+        self.fetch_batches(batches, request, write, workers=workers)
+        progress.close()
+
+    def refresh_artists(self, max_age=7, workers=4, batch_size=MAX_ARTISTS_BATCH):
+        """
+        Fetch the name, genres, popularity, and followers of artists without metadata or with
+        metadata older than `max_age` days, and insert into the database. Each request covers a
+        batch of up to `batch_size` artists, and requests are pipelined with `fetch_batches`.
+        Artists whose metadata changed get their albums fetched again by the next fetch, while
+        unchanged artists are skipped. Batches that fail are skipped and fetched again by the
+        next run.
+        """
+        with self.db.transaction():
+            self.db.create_auxiliary_tables()
+
+        before = int(time.time() - max_age * 24 * 60 * 60)
+        total = self.db.count_artists_to_refresh(before)
+        progress = Progress(total, "Refreshing artists")
+
+        def request(batch):
+            with tracing.span("batch", size=len(batch)):
+                return self.api.get_artists(batch)
+
+        def write(batch, artists):
+            if artists is None:
+                logging.warning(f"Could not fetch metadata for {len(batch)} artists")
+                metrics.FAILURES.inc(len(batch), kind="artist_metadata")
+            else:
+                with tracing.span("transaction"), self.db.transaction():
+                    self.db.insert_artist_metadata(artists)
+            progress.update(len(batch))
+
+        batches = self.db.iter_artists_to_refresh(before, batch_size)
+        self.fetch_batches(batches, request, write, workers=workers)
+        progress.close()
+
+    def export_playlist(self, playlist_id, source="liked", limit=None, workers=4):
+        """
+        Update a Spotify playlist to hold the liked tracks or the best recommendations. Only the
+        difference is written: tracks that are no longer wanted are removed and wanted tracks
+        that are missing are appended, in batches of up to 100 tracks. Tracks that are kept are
+        not moved, so only an export to an empty playlist is in order, with the liked tracks in
+        the order they were added or the recommendations from best to worst. Removals do not depend on each other, so they are sent
+        concurrently with `fetch_batches`. Additions are appended in order one batch at a time,
+        since concurrent appends could land out of order, and stop at the first failure.
+        """
+        if source == "liked":
+            wanted = [track.id for track in self.db.query_tracks(rating=1)]
+            if limit is not None:
+                wanted = wanted[:limit]
+        else:
+            recommend.update_recommendations(self.db)
+            rows = self.db.query_recommendations(limit=100 if limit is None else limit)
+            wanted = [row[0] for row in rows]
+
+        current = self.api.get_playlist_track_ids(playlist_id)
+        if current is None:
+            logging.error(f"Could not fetch playlist {repr(playlist_id)}")
+            metrics.FAILURES.inc(kind="playlist")
+            return
+
+        # Compare as sets, so tracks that are already in the playlist are not written again.
+        wanted_ids = set(wanted)
+        current_ids = set(current)
+        removals = [id_ for id_ in dict.fromkeys(current) if id_ not in wanted_ids]
+        additions = [id_ for id_ in wanted if id_ not in current_ids]
+        logging.info(
+            f"Playlist {playlist_id} keeps {len(wanted_ids & current_ids)} tracks, "
+            f"adding {len(additions)} and removing {len(removals)}"
+        )
+
+        def batches(ids):
+            for start in range(0, len(ids), MAX_PLAYLIST_BATCH):
+                yield ids[start : start + MAX_PLAYLIST_BATCH]
+
+        progress = Progress(len(removals) + len(additions), "Exporting playlist")
+
+        def request(batch):
+            with tracing.span("batch", size=len(batch), method="DELETE"):
+                return self.api.remove_playlist_tracks(playlist_id, batch)
+
+        def write(batch, snapshot_id):
+            if snapshot_id is None:
+                logging.warning(
+                    f"Could not remove {len(batch)} tracks from the playlist"
+                )
+                metrics.FAILURES.inc(len(batch), kind="playlist_write")
+            progress.update(len(batch))
+
+        self.fetch_batches(batches(removals), request, write, workers=workers)
+
+        for batch in batches(additions):
+            with tracing.span("batch", size=len(batch), method="POST"):
+                snapshot_id = self.api.add_playlist_tracks(playlist_id, batch)
+            if snapshot_id is None:
+                logging.warning(f"Could not add {len(batch)} tracks to the playlist")
+                metrics.FAILURES.inc(len(batch), kind="playlist_write")
+                break
+            progress.update(len(batch))
+        progress.close()
+
+    def discover(self, max_depth=2, budget=100):
+        """
+        Fetch related artists of known artists and insert them into the database. Artists wait
+        in a frontier that persists across runs, ranked by the ratings of the artists that led
+        to them, and the highest ranked artist is crawled next. Related artists of rated artists
+        get the score of that artist added to their priority, while those of unrated artists get
+        a decayed share of its priority. Only artists fewer than `max_depth` links from the
+        library are crawled, and at most `budget` artists are crawled per run. Artists that fail
+        are skipped and crawled again by the next run.
+        """
+        with self.db.transaction():
+            self.db.create_auxiliary_tables()
+            seeded = self.db.seed_frontier(recommend.PRIOR)
+        logging.debug(f"Added {seeded} library artists to the frontier")
+
+        failed = set()
+        progress = Progress(budget, "Discovering artists")
+        for _ in range(budget):
+            head = self.db.get_frontier_head(max_depth, exclude=failed)
+            if head is None:
+                break
+            artist, depth, priority = head
+
+            # Get the related artists and add them to the database and the frontier.
+            with tracing.span("artist", id=artist.id, name=artist.name, depth=depth):
+                related = self.api.get_related_artists(artist)
+                if related is None:
+                    logging.warning(f"Could not fetch related artists for {artist.id}")
+                    metrics.FAILURES.inc(kind="related_artists")
+                    failed.add(artist.id)
+                else:
+                    score = self.db.get_artist_score(artist.id, recommend.PRIOR)
+                    weight = DISCOVER_DECAY * priority if score is None else score
+                    with tracing.span("transaction"), self.db.transaction():
+                        self.db.insert_artists(related)
+                        self.db.push_frontier(related, depth + 1, weight)
+                        self.db.mark_artist_crawled(artist, depth, len(related))
+            progress.update()
+        progress.close()
+
+    def print_diff(self, playlist_id, category=None):
+        """
+        Print how many tracks, albums, and artists of a playlist are new to the database, and
+        how many of its tracks are already rated or unrated. This is what adding the playlist
+        would insert. With a category, also print one tab-separated line per track of the
+        playlist in that category with the id, rating, and name.
+        """
+        playlist = self.api.get_playlist(playlist_id)
+        if playlist is None:
+            logging.error(f"Could not fetch playlist {repr(playlist_id)}")
+            return
+
+        with self.db.transaction():
+            counts, tracks = self.db.diff_playlist(playlist, category=category)
+
+        num_present = counts["num_tracks"] - counts["num_new_tracks"]
+        summary = (
+            f"{counts['num_tracks']} tracks\n"
+            f"    {counts['num_new_tracks']} new\n"
+            f"    {num_present} in library\n"
+            f"        {counts['num_rated_tracks']} rated\n"
+            f"        {counts['num_unrated_tracks']} unrated\n"
+            f"{counts['num_albums']} albums\n"
+            f"    {counts['num_new_albums']} new\n"
+            f"{counts['num_artists']} artists\n"
+            f"    {counts['num_new_artists']} new\n"
+        )
+        print(summary, end="")
+
+        for track in tracks:
+            rating = "" if track.rating is None else track.rating
+            print(f"{track.id}\t{rating}\t{track.name}")
+
+    def migrate_ids(self, id_format):
+        """
+        Convert the stored ids to the given format and log the change in database size.
+        """
+        size = self.db.database_path.stat().st_size
+        if not self.db.migrate_ids(id_format):
+            logging.info(f"Ids are already stored as {id_format}")
+            return
+
+        new_size = self.db.database_path.stat().st_size
+        logging.info(
+            f"Converted ids to {id_format}, database size {size} -> {new_size} bytes"
+        )
+
+    def print_tracks(self, artist=None, rating=None, rated=None):
+        """
+        Print one tab-separated line per matching track with the id, rating, and name.
+        """
+        for track in self.db.query_tracks(artist, rating=rating, rated=rated):
+            rating_ = "" if track.rating is None else track.rating
+            print(f"{track.id}\t{rating_}\t{track.name}")
+
+    def print_albums(self, artist=None):
+        """
+        Print one tab-separated line per matching album with the id, track count, liked,
+        neutral, and disliked counts, and name.
+        """
+        for album, summary in self.db.query_albums(artist):
+            print(
+                f"{album.id}\t{summary.num_tracks}\t{summary.num_liked}\t"
+                f"{summary.num_neutral}\t{summary.num_disliked}\t{album.name}"
+            )
+
+    def print_artists(self, top_rated=False, limit=None):
+        """
+        Print one tab-separated line per artist with the id, track count, liked, neutral, and
+        disliked counts, and name.
+        """
+        for artist, summary in self.db.query_artists(top_rated=top_rated, limit=limit):
+            print(
+                f"{artist.id}\t{summary.num_tracks}\t{summary.num_liked}\t"
+                f"{summary.num_neutral}\t{summary.num_disliked}\t{artist.name}"
+            )
+
+    def print_search(self, text, limit=20):
+        """
+        Print one tab-separated line per search result, from best to worst match, with the kind
+        of item, its id and name, and the names of the album and artist it belongs to.
+        """
+        for item, album, artist in self.db.search(text, limit=limit):
+            kind = type(item).__name__.lower()
+            album_name = "" if album is None else album.name
+            artist_name = "" if artist is None else artist.name
+            print(f"{kind}\t{item.id}\t{item.name}\t{album_name}\t{artist_name}")
+
+    def print_similar(self, track_id=None, limit=20, include_rated=False, cache=True):
+        """
+        Print one tab-separated line per similar track, from nearest to farthest, with the id,
+        distance, rating, name, and the names of its album and artist.
+        """
+        path = similarity.cache_path(self.db) if cache else None
+        index = similarity.FeatureIndex.load(self.db, path)
+        try:
+            results = similarity.similar_tracks(
+                self.db, index, track_id, limit=limit, include_rated=include_rated
+            )
+        except ValueError as ex:
+            logging.error(ex)
+            return
+
+        details = self.db.get_tracks_by_id(id_ for id_, _ in results)
+        for id_, distance in results:
+            # Skip features of tracks that are no longer in the database.
+            if id_ not in details:
                 continue
+            track, album, artist = details[id_]
+            rating = "" if track.rating is None else track.rating
+            album_name = "" if album is None else album.name
+            artist_name = "" if artist is None else artist.name
+            print(
+                f"{id_}\t{distance:.3f}\t{rating}\t{track.name}\t{album_name}\t{artist_name}"
+            )
 
-            # Get track data and add it to the database.
-            tracks = self.api.get_album_tracks(album)
-            with self.db.transaction():
-                self.db.insert_tracks(tracks)
-                self.db.update_album_time_fetched(album)
+    def print_recommendations(self, limit=20, full=False, cache=True):
+        """
+        Update the scores of unrated tracks and print one tab-separated line per track, from best
+        to worst, with the id, score, album score, artist score, similarity score, name, and the
+        names of its album and artist.
+        """
+        recommend.update_recommendations(self.db, full=full, cache=cache)
+
+        results = self.db.query_recommendations(limit=limit)
+        details = self.db.get_tracks_by_id(row[0] for row in results)
+        for id_, score, album_score, artist_score, similarity_score in results:
+            if id_ not in details:
+                continue
+            track, album, artist = details[id_]
+            similarity_ = "" if similarity_score is None else f"{similarity_score:.3f}"
+            album_name = "" if album is None else album.name
+            artist_name = "" if artist is None else artist.name
+            print(
+                f"{id_}\t{score:.3f}\t{album_score:.3f}\t{artist_score:.3f}\t{similarity_}\t"
+                f"{track.name}\t{album_name}\t{artist_name}"
+            )
+
+    def print_runs(self, command=None, limit=20):
+        """
+        Print one tab-separated line per run, from newest to oldest, with the id, command, start
+        time, status, duration, items fetched per second, items fetched, rows inserted,
+        requests, failures, and rate limited requests.
+        """
+        for run in self.db.query_runs(command, limit=limit):
+            started = datetime.fromtimestamp(run.time_started).isoformat(" ", "seconds")
+            duration = "" if run.duration is None else format_duration(run.duration)
+            rate = "" if run.items_per_second is None else f"{run.items_per_second:.1f}"
+            print(
+                f"{run.id}\t{run.command}\t{started}\t{run.status}\t{duration}\t{rate}\t"
+                f"{run.num_items_fetched}\t{run.num_rows_inserted}\t{run.num_requests}\t"
+                f"{run.num_failures}\t{run.num_rate_limited}"
+            )
+
+    def print_run_trends(self, command=None):
+        """
+        Print one tab-separated line per week and command, from newest to oldest, with the week,
+        command, number of runs, items fetched per second, items fetched, rows inserted,
+        requests, failures, and rate limited requests.
+        """
+        for week, command_, num_runs, duration, *sums in self.db.query_run_trends(
+            command
+        ):
+            counts = dict(zip(RUN_COUNTS, sums))
+            rate = counts["num_items_fetched"] / duration if duration else 0.0
+            print(
+                f"{week}\t{command_}\t{num_runs}\t{rate:.1f}\t"
+                f"{counts['num_items_fetched']}\t{counts['num_rows_inserted']}\t"
+                f"{counts['num_requests']}\t{counts['num_failures']}\t"
+                f"{counts['num_rate_limited']}"
+            )
+
+    def print_changes(self, since=0, limit=None):
+        """
+        Print one JSON object per change with a sequence number above `since`, in order. The
+        keys are the columns of the journal of changes.
+        """
+        columns = list(JOURNAL_SCHEMA["changes"])
+        for rows in self.db.iter_changes(since=since, limit=limit):
+            lines = [json.dumps(dict(zip(columns, row))) + "\n" for row in rows]
+            sys.stdout.writelines(lines)
+
+    def compact_changes(self):
+        """
+        Compact the journal of changes and log the number of entries deleted.
+        """
+        with self.db.transaction():
+            num_deleted = self.db.compact_changes()
+        logging.info(f"Deleted {num_deleted} superseded changes")
+
+    def serve(self, host="127.0.0.1", port=8080, connections=4, cache_size=256):
+        """
+        Serve read-only queries of the library over HTTP until interrupted. The database is
+        switched to write-ahead logging first, so commands writing to it do not block the
+        queries and the queries do not block them.
+        """
+        # Import here, since the HTTP server is only needed by this command.
+        from musicmanager.server import QueryServer
+
+        mode = self.db.enable_wal()
+        if mode != "wal":
+            logging.warning(f"Could not enable write-ahead logging, mode is {mode}")
+
+        server = QueryServer(
+            (host, port),
+            self.db.database_path,
+            connections=connections,
+            cache_size=cache_size,
+        )
+        logging.info(f"Serving queries at {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
 
 
 def main():
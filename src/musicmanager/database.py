@@ -1,9 +1,610 @@
+import json
+import re
 import sqlite3
+import string
 import time
 from contextlib import contextmanager
 from pathlib import Path
 
-from musicmanager.item import Album, Artist, Track
+from musicmanager import metrics, tracing
+from musicmanager.item import Album, Artist, RatingSummary, Run, Track
+from musicmanager.optional import import_optional
+
+# Largest number of ids bound to one lookup, which stays below the variable limit of older SQLite
+# versions.
+MAX_VARIABLES = 500
+
+# Column definitions for each table.
+SCHEMA = {
+    "tracks": {
+        "id": "text NOT NULL PRIMARY KEY",
+        "name": "text NOT NULL",
+        "album_id": "text NOT NULL",
+        "rating": "int DEFAULT NULL CHECK (rating IN (NULL, -1, 0, 1))",
+    },
+    "albums": {
+        "id": "text NOT NULL PRIMARY KEY",
+        "name": "text NOT NULL",
+        "artist_id": "text NOT NULL",
+        "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
+    },
+    "artists": {
+        "id": "text NOT NULL PRIMARY KEY",
+        "name": "text NOT NULL",
+        "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
+    },
+}
+
+# Rating counts columns shared by the summary tables. The generated columns are computed when
+# read, and the score orders groups from most to least liked.
+_RATING_COUNTS = {
+    "num_tracks": "int NOT NULL DEFAULT 0",
+    "num_liked": "int NOT NULL DEFAULT 0",
+    "num_neutral": "int NOT NULL DEFAULT 0",
+    "num_disliked": "int NOT NULL DEFAULT 0",
+    "num_rated": "int GENERATED ALWAYS AS (num_liked + num_neutral + num_disliked) VIRTUAL",
+    "score": "int GENERATED ALWAYS AS (num_liked - num_disliked) VIRTUAL",
+    "mean_rating": (
+        "real GENERATED ALWAYS AS ("
+        "CAST(num_liked - num_disliked AS real) / NULLIF(num_liked + num_neutral + num_disliked, 0)"
+        ") VIRTUAL"
+    ),
+}
+
+# Column definitions for tables derived from the item tables. These are maintained by triggers
+# and can be rebuilt at any time.
+DERIVED_SCHEMA = {
+    "album_ratings": {
+        "album_id": "text NOT NULL PRIMARY KEY",
+        **_RATING_COUNTS,
+    },
+    "artist_ratings": {
+        "artist_id": "text NOT NULL PRIMARY KEY",
+        **_RATING_COUNTS,
+    },
+    # Rowids of items inserted since the search index was last updated. Writing to the full-text
+    # index from a trigger flushes it on every row, so inserts are queued here instead and added
+    # to the index in one statement per kind before each commit.
+    "search_queue": {
+        "kind": "text NOT NULL",
+        "item_rowid": "int NOT NULL",
+    },
+}
+
+# Column definitions for tables that enrich items with data fetched by separate requests. A row
+# with NULL values records that the data was requested but is not available, so it is not
+# requested again. These are created when missing and are never rebuilt.
+ENRICHMENT_SCHEMA = {
+    "audio_features": {
+        "track_id": "text NOT NULL PRIMARY KEY",
+        "danceability": "real",
+        "energy": "real",
+        "key": "int",
+        "loudness": "real",
+        "mode": "int",
+        "speechiness": "real",
+        "acousticness": "real",
+        "instrumentalness": "real",
+        "liveness": "real",
+        "valence": "real",
+        "tempo": "real",
+        "duration_ms": "int",
+        "time_signature": "int",
+        "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
+    },
+    # Genres are stored as a JSON array of strings.
+    "artist_metadata": {
+        "artist_id": "text NOT NULL PRIMARY KEY",
+        "name": "text",
+        "genres": "text",
+        "popularity": "int",
+        "followers": "int",
+        "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
+    },
+}
+
+# Audio feature columns in the order of the table schema.
+AUDIO_FEATURES = [
+    column
+    for column in ENRICHMENT_SCHEMA["audio_features"]
+    if column not in ("track_id", "time_fetched")
+]
+
+# Column definitions for tables that cache results computed from the other tables. These are
+# created when missing, and clearing them only costs computing the results again.
+CACHE_SCHEMA = {
+    "recommendations": {
+        "track_id": "text NOT NULL PRIMARY KEY",
+        "score": "real NOT NULL",
+        "album_score": "real NOT NULL",
+        "artist_score": "real NOT NULL",
+        "similarity_score": "real",
+        "neighbor_radius": "real",
+        "time_scored": "int NOT NULL DEFAULT 0",
+    },
+    # Rated tracks whose rating or features changed since the recommendations were scored.
+    "rating_changes": {
+        "track_id": "text NOT NULL PRIMARY KEY",
+        "album_id": "text NOT NULL",
+    },
+    # Mean and standard deviation of each feature used to standardize the similarity search
+    # when the recommendations were scored.
+    "feature_scaling": {
+        "feature": "text NOT NULL PRIMARY KEY",
+        "mean": "real NOT NULL",
+        "std": "real NOT NULL",
+    },
+}
+
+# Column definitions for tables that hold the state of crawls across runs. These are created when
+# missing and are never rebuilt.
+CRAWL_SCHEMA = {
+    # Artists waiting to have their related artists fetched, ranked by the ratings of the artists
+    # that led to them. The depth is the number of related artist links from the library.
+    "frontier": {
+        "artist_id": "text NOT NULL PRIMARY KEY",
+        "name": "text NOT NULL",
+        "depth": "int NOT NULL CHECK (depth >= 0)",
+        "priority": "real NOT NULL",
+        "time_added": "int NOT NULL DEFAULT 0",
+    },
+    # Artists whose related artists were fetched, which are never added to the frontier again.
+    "crawled_artists": {
+        "artist_id": "text NOT NULL PRIMARY KEY",
+        "depth": "int NOT NULL CHECK (depth >= 0)",
+        "num_related": "int NOT NULL DEFAULT 0",
+        "time_crawled": "int NOT NULL DEFAULT 0",
+    },
+}
+
+# Column definitions for tables that record the history of the application rather than items.
+# These are created when missing and are never rebuilt.
+HISTORY_SCHEMA = {
+    "runs": {
+        "id": "integer PRIMARY KEY",
+        "command": "text NOT NULL",
+        "time_started": "real NOT NULL",
+        "time_finished": "real DEFAULT NULL",
+        "status": "text NOT NULL DEFAULT 'running'",
+        "num_requests": "int NOT NULL DEFAULT 0",
+        "num_bytes": "int NOT NULL DEFAULT 0",
+        "num_rate_limited": "int NOT NULL DEFAULT 0",
+        "num_items_fetched": "int NOT NULL DEFAULT 0",
+        "num_rows_inserted": "int NOT NULL DEFAULT 0",
+        "num_failures": "int NOT NULL DEFAULT 0",
+    },
+}
+
+# Column definitions for the journal of changes to the item tables, which is appended to by
+# triggers so other systems can copy only what changed. Sequence numbers only ever increase,
+# even when old entries are compacted away. This is created when missing and is never rebuilt.
+JOURNAL_SCHEMA = {
+    # The value is the rating of tracks and the time fetched of albums and artists. Insert
+    # entries have every column of the item, while update and rename entries only have the
+    # value or the name.
+    "changes": {
+        "seq": "integer PRIMARY KEY AUTOINCREMENT",
+        "kind": "text NOT NULL",
+        "item_id": "text NOT NULL",
+        "operation": "text NOT NULL CHECK (operation IN ('insert', 'update', 'rename'))",
+        "name": "text",
+        "parent_id": "text",
+        "value": "int",
+        "time_changed": "int NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS int))",
+    },
+}
+
+# Kind, parent id column, and value column of the changes recorded for each item table.
+CHANGE_COLUMNS = {
+    "tracks": ("track", "album_id", "rating"),
+    "albums": ("album", "artist_id", "time_fetched"),
+    "artists": ("artist", None, "time_fetched"),
+}
+
+# Counts recorded for each run.
+RUN_COUNTS = [
+    "num_requests",
+    "num_bytes",
+    "num_rate_limited",
+    "num_items_fetched",
+    "num_rows_inserted",
+    "num_failures",
+]
+
+# Columns of each table that hold Spotify ids.
+ID_COLUMNS = {
+    "tracks": ["id", "album_id"],
+    "albums": ["id", "artist_id"],
+    "artists": ["id"],
+    "album_ratings": ["album_id"],
+    "artist_ratings": ["artist_id"],
+    "audio_features": ["track_id"],
+    "artist_metadata": ["artist_id"],
+    "recommendations": ["track_id"],
+    "rating_changes": ["track_id", "album_id"],
+    "frontier": ["artist_id"],
+    "crawled_artists": ["artist_id"],
+    "changes": ["item_id", "parent_id"],
+}
+
+# Formats in which ids can be stored. Text ids are stored as given. Binary ids are stored as
+# BLOBs, which makes every row, index, and join key of the id columns smaller.
+ID_FORMATS = ("text", "binary")
+
+# Declared type of the id columns in the binary format. The name gives the columns BLOB affinity
+# and selects the converter that decodes them when read.
+BINARY_ID_TYPE = "blob_id"
+
+# Characters of Spotify base62 ids in the order of their values.
+BASE62 = string.digits + string.ascii_lowercase + string.ascii_uppercase
+_BASE62_VALUES = {char: value for value, char in enumerate(BASE62)}
+
+# Pairs of base62 characters in the order of their values, which halves the divisions when
+# decoding ids.
+_BASE62_PAIRS = [first + second for first in BASE62 for second in BASE62]
+
+
+def encode_id(id_):
+    """
+    Returns the binary form of an id. Spotify ids, which are 22 base62 characters for a 128-bit
+    number, become the 16 bytes of the number. Other ids become their UTF-8 bytes followed by
+    0xff bytes, which never occur in UTF-8, to a length other than 16. None is returned
+    unchanged for columns that allow NULL.
+    """
+    if id_ is None:
+        return None
+
+    if len(id_) == 22:
+        value = 0
+        for char in id_:
+            digit = _BASE62_VALUES.get(char)
+            if digit is None:
+                break
+            value = value * 62 + digit
+        else:
+            if value < 1 << 128:
+                return value.to_bytes(16, "big")
+
+    data = id_.encode()
+    return data + b"\xff" * (2 if len(data) == 15 else 1)
+
+
+def decode_id(value):
+    """
+    Returns the id of a value read from an id column. Values that are not binary are returned
+    unchanged, since text ids are stored as given.
+    """
+    if not isinstance(value, bytes):
+        return value
+
+    if len(value) == 16:
+        number = int.from_bytes(value, "big")
+        pairs = []
+        for _ in range(11):
+            number, digits = divmod(number, len(_BASE62_PAIRS))
+            pairs.append(_BASE62_PAIRS[digits])
+        return "".join(reversed(pairs))
+    return value.rstrip(b"\xff").decode()
+
+
+# Decode binary ids when read, so items always have text ids.
+sqlite3.register_converter(BINARY_ID_TYPE, decode_id)
+
+
+def id_schema(table, schema, id_format):
+    """
+    Returns the column definitions of a table with the id columns declared for the id format.
+    """
+    if id_format == "text":
+        return schema
+    id_columns = ID_COLUMNS.get(table, [])
+    return {
+        column: (
+            BINARY_ID_TYPE + datatype[len("text") :]
+            if column in id_columns
+            else datatype
+        )
+        for column, datatype in schema.items()
+    }
+
+
+# Secondary indexes keyed by name. These cover the joins from artists to albums to tracks, so
+# relational queries never need to scan a whole table.
+INDEXES = {
+    "tracks_album_id_rating": "tracks (album_id, rating)",
+    "albums_artist_id": "albums (artist_id)",
+    "artists_name": "artists (name)",
+    "artist_ratings_score": "artist_ratings (score DESC, num_liked DESC)",
+    "recommendations_score": "recommendations (score DESC)",
+    "frontier_priority": "frontier (priority DESC)",
+}
+
+# Full-text index over the names of all tracks, albums, and artists. The kind and id columns are
+# stored but not tokenized, so each match can be joined back to its table.
+SEARCH_TABLE = """
+CREATE VIRTUAL TABLE search_index
+                USING fts5(name, kind UNINDEXED, item_id UNINDEXED,
+                           tokenize = 'unicode61 remove_diacritics 2')
+"""
+
+# The kind stored in the search index for the items of each table.
+SEARCH_KINDS = {
+    "tracks": "track",
+    "albums": "album",
+    "artists": "artist",
+}
+
+
+def _search_triggers(table, kind):
+    """
+    Returns the triggers that keep the search index in sync with the given table. Inserted
+    items are queued and added to the index by `Database.index_queued_items`.
+    """
+    return {
+        f"{table}_search_insert": f"""
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO search_queue (kind, item_rowid)
+                 VALUES ('{kind}', new.rowid);
+        END
+        """,
+        f"{table}_search_update": f"""
+        AFTER UPDATE OF name ON {table}
+        BEGIN
+            UPDATE search_index
+               SET name = new.name
+             WHERE kind = '{kind}'
+               AND item_id = old.id;
+        END
+        """,
+        f"{table}_search_delete": f"""
+        AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM search_index
+                  WHERE kind = '{kind}'
+                    AND item_id = old.id;
+        END
+        """,
+    }
+
+
+def _change_triggers(table):
+    """
+    Returns the triggers that record the inserts, value updates, and renames of the given table
+    in the journal of changes.
+    """
+    kind, parent, value = CHANGE_COLUMNS[table]
+    parent = "NULL" if parent is None else f"new.{parent}"
+    return {
+        f"{table}_changes_insert": f"""
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO changes (kind, item_id, operation, name, parent_id, value)
+                 VALUES ('{kind}', new.id, 'insert', new.name, {parent}, new.{value});
+        END
+        """,
+        f"{table}_changes_update": f"""
+        AFTER UPDATE OF {value} ON {table}
+         WHEN old.{value} IS NOT new.{value}
+        BEGIN
+            INSERT INTO changes (kind, item_id, operation, value)
+                 VALUES ('{kind}', new.id, 'update', new.{value});
+        END
+        """,
+        f"{table}_changes_rename": f"""
+        AFTER UPDATE OF name ON {table}
+         WHEN old.name IS NOT new.name
+        BEGIN
+            INSERT INTO changes (kind, item_id, operation, name)
+                 VALUES ('{kind}', new.id, 'rename', new.name);
+        END
+        """,
+    }
+
+
+# Upsert clause that adds the inserted rating counts to an existing summary row.
+_ADD_RATING_COUNTS = """
+            SET num_tracks = num_tracks + excluded.num_tracks,
+                num_liked = num_liked + excluded.num_liked,
+                num_neutral = num_neutral + excluded.num_neutral,
+                num_disliked = num_disliked + excluded.num_disliked
+"""
+
+# Update clause that moves a track from the count of its old rating to its new rating.
+_CHANGE_RATING_COUNTS = """
+            SET num_liked = num_liked + IFNULL(new.rating > 0, 0) - IFNULL(old.rating > 0, 0),
+                num_neutral = num_neutral + IFNULL(new.rating = 0, 0) - IFNULL(old.rating = 0, 0),
+                num_disliked = num_disliked + IFNULL(new.rating < 0, 0) - IFNULL(old.rating < 0, 0)
+"""
+
+# Triggers that keep the album and artist rating summaries in sync with the tracks and albums
+# tables. Artist counts include a track once both the track and its album are in the database,
+# so the order in which tracks and albums are inserted does not matter.
+_RATING_TRIGGERS = {
+    "tracks_ratings_insert": f"""
+    AFTER INSERT ON tracks
+    BEGIN
+        INSERT INTO album_ratings (album_id, num_tracks, num_liked, num_neutral, num_disliked)
+             VALUES (new.album_id,
+                     1,
+                     IFNULL(new.rating > 0, 0),
+                     IFNULL(new.rating = 0, 0),
+                     IFNULL(new.rating < 0, 0))
+        ON CONFLICT (album_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+        INSERT INTO artist_ratings (artist_id, num_tracks, num_liked, num_neutral, num_disliked)
+             SELECT artist_id,
+                    1,
+                    IFNULL(new.rating > 0, 0),
+                    IFNULL(new.rating = 0, 0),
+                    IFNULL(new.rating < 0, 0)
+               FROM albums
+              WHERE id = new.album_id
+        ON CONFLICT (artist_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+    END
+    """,
+    "tracks_ratings_update": f"""
+    AFTER UPDATE OF rating ON tracks
+     WHEN old.rating IS NOT new.rating
+    BEGIN
+        UPDATE album_ratings {_CHANGE_RATING_COUNTS}
+         WHERE album_id = new.album_id;
+        UPDATE artist_ratings {_CHANGE_RATING_COUNTS}
+         WHERE artist_id = (SELECT artist_id FROM albums WHERE id = new.album_id);
+    END
+    """,
+    "tracks_ratings_delete": f"""
+    AFTER DELETE ON tracks
+    BEGIN
+        INSERT INTO album_ratings (album_id, num_tracks, num_liked, num_neutral, num_disliked)
+             VALUES (old.album_id,
+                     -1,
+                     -IFNULL(old.rating > 0, 0),
+                     -IFNULL(old.rating = 0, 0),
+                     -IFNULL(old.rating < 0, 0))
+        ON CONFLICT (album_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+        INSERT INTO artist_ratings (artist_id, num_tracks, num_liked, num_neutral, num_disliked)
+             SELECT artist_id,
+                    -1,
+                    -IFNULL(old.rating > 0, 0),
+                    -IFNULL(old.rating = 0, 0),
+                    -IFNULL(old.rating < 0, 0)
+               FROM albums
+              WHERE id = old.album_id
+        ON CONFLICT (artist_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+    END
+    """,
+    "albums_ratings_insert": f"""
+    AFTER INSERT ON albums
+    BEGIN
+        INSERT INTO artist_ratings (artist_id, num_tracks, num_liked, num_neutral, num_disliked)
+             SELECT new.artist_id,
+                    num_tracks,
+                    num_liked,
+                    num_neutral,
+                    num_disliked
+               FROM album_ratings
+              WHERE album_id = new.id
+        ON CONFLICT (artist_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+    END
+    """,
+    "albums_ratings_delete": f"""
+    AFTER DELETE ON albums
+    BEGIN
+        INSERT INTO artist_ratings (artist_id, num_tracks, num_liked, num_neutral, num_disliked)
+             SELECT old.artist_id,
+                    -num_tracks,
+                    -num_liked,
+                    -num_neutral,
+                    -num_disliked
+               FROM album_ratings
+              WHERE album_id = old.id
+        ON CONFLICT (artist_id)
+                 DO UPDATE {_ADD_RATING_COUNTS};
+    END
+    """,
+}
+
+
+# Triggers that track which recommendations are out of date. Tracks that become rated or get
+# features are dropped from the recommendations, and rated tracks that change are recorded so the
+# unrated tracks they influence can be scored again.
+_RECOMMENDATION_TRIGGERS = {
+    "tracks_recommendations_insert": """
+    AFTER INSERT ON tracks
+     WHEN new.rating IS NOT NULL
+    BEGIN
+        INSERT INTO rating_changes (track_id, album_id)
+             VALUES (new.id, new.album_id)
+        ON CONFLICT (track_id)
+                 DO NOTHING;
+    END
+    """,
+    "tracks_recommendations_update": """
+    AFTER UPDATE OF rating ON tracks
+     WHEN old.rating IS NOT new.rating
+    BEGIN
+        INSERT INTO rating_changes (track_id, album_id)
+             VALUES (new.id, new.album_id)
+        ON CONFLICT (track_id)
+                 DO NOTHING;
+        DELETE FROM recommendations
+              WHERE track_id = new.id;
+    END
+    """,
+    "tracks_recommendations_delete": """
+    AFTER DELETE ON tracks
+    BEGIN
+        INSERT INTO rating_changes (track_id, album_id)
+             VALUES (old.id, old.album_id)
+        ON CONFLICT (track_id)
+                 DO NOTHING;
+        DELETE FROM recommendations
+              WHERE track_id = old.id;
+    END
+    """,
+    "audio_features_recommendations_insert": """
+    AFTER INSERT ON audio_features
+    BEGIN
+        INSERT INTO rating_changes (track_id, album_id)
+             SELECT id,
+                    album_id
+               FROM tracks
+              WHERE id = new.track_id
+                AND rating IS NOT NULL
+        ON CONFLICT (track_id)
+                 DO NOTHING;
+        DELETE FROM recommendations
+              WHERE track_id = new.track_id;
+    END
+    """,
+}
+
+# Triggers that apply refreshed artist metadata to the artists table. New names replace the
+# names from playlist items, and an artist whose name or genres changed has its albums fetched
+# again, while unchanged artists are skipped. Popularity and followers are left out, since they
+# move with nearly every refresh.
+_METADATA_TRIGGERS = {
+    "artist_metadata_insert": """
+    AFTER INSERT ON artist_metadata
+     WHEN new.name IS NOT NULL
+    BEGIN
+        UPDATE artists
+           SET name = new.name
+         WHERE id = new.artist_id
+           AND name IS NOT new.name;
+    END
+    """,
+    "artist_metadata_update": """
+    AFTER UPDATE ON artist_metadata
+     WHEN new.name IS NOT NULL
+      AND (old.name IS NOT new.name
+           OR old.genres IS NOT new.genres)
+    BEGIN
+        UPDATE artists
+           SET name = new.name,
+               time_fetched = 0
+         WHERE id = new.artist_id;
+    END
+    """,
+}
+
+# Triggers keyed by name. These keep derived tables in sync with changes to the item tables.
+TRIGGERS = {
+    **_search_triggers("tracks", "track"),
+    **_search_triggers("albums", "album"),
+    **_search_triggers("artists", "artist"),
+    **_RATING_TRIGGERS,
+    **_RECOMMENDATION_TRIGGERS,
+    **_METADATA_TRIGGERS,
+    **_change_triggers("tracks"),
+    **_change_triggers("albums"),
+    **_change_triggers("artists"),
+}
 
 
 class Database:
@@ -11,22 +612,101 @@ class Database:
     Interface to the database.
     """
 
-    def __init__(self, database_path=None):
+    def __init__(self, database_path=None, read_only=False):
         """
-        Initialize by opening a database connection.
+        Initialize the interface. The database connection is opened on first use, so commands
+        that never touch the database do not pay for it. A read-only interface opens a
+        connection that refuses writes and may be shared between threads, one at a time.
         """
         # Use the default path if one is not given.
         if database_path is None:
             database_path = "~/.music_manager.db"
 
-        # Open the connection.
-        self.database_path = Path(database_path).expanduser().resolve()
-        self._con = sqlite3.connect(self.database_path, isolation_level=None)
+        # Keep the name of an in-memory database as is, since resolving it would turn it into a
+        # file in the working directory.
+        if database_path == ":memory:":
+            self.database_path = Path(database_path)
+        else:
+            self.database_path = Path(database_path).expanduser().resolve()
+        self.read_only = read_only
+        self._connection = None
+
+        # Format of the stored ids, read from the database on first use.
+        self._id_format = None
 
         # Cursor for interacting with the database.
         # This is controlled by the `transaction` context.
         self._active_cursor = None
 
+    @property
+    def _con(self):
+        """
+        Returns the database connection, opening it on first use.
+        """
+        if self._connection is None:
+            if self.read_only:
+                self._connection = sqlite3.connect(
+                    f"{self.database_path.as_uri()}?mode=ro",
+                    uri=True,
+                    isolation_level=None,
+                    detect_types=sqlite3.PARSE_DECLTYPES,
+                    check_same_thread=False,
+                )
+            else:
+                self._connection = sqlite3.connect(
+                    self.database_path,
+                    isolation_level=None,
+                    detect_types=sqlite3.PARSE_DECLTYPES,
+                )
+        return self._connection
+
+    def close(self):
+        """
+        Close the database connection if it is open. It is opened again on next use.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def enable_wal(self):
+        """
+        Switch the database to write-ahead logging, which lets readers keep reading while a
+        writer commits. The mode is stored in the database file, so it holds for every later
+        connection. Returns the journal mode now in use.
+        """
+        return self._con.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+
+    def data_version(self):
+        """
+        Returns the data version of the connection, which changes whenever another connection
+        commits a change to the database.
+        """
+        return self._con.execute("PRAGMA data_version").fetchone()[0]
+
+    @property
+    def id_format(self):
+        """
+        Returns the format of the stored ids, which is read from the declared type of the ids
+        of the tracks table. Databases without tables use text ids.
+        """
+        if self._id_format is None:
+            rows = self._con.execute("PRAGMA table_info(tracks)").fetchall()
+            types = {row[1]: row[2].lower() for row in rows}
+            self._id_format = "binary" if types.get("id") == BINARY_ID_TYPE else "text"
+        return self._id_format
+
+    def _id_encoder(self):
+        """
+        Returns the function that converts ids to their stored form for command parameters.
+        """
+        return encode_id if self.id_format == "binary" else str
+
+    def _id_type(self):
+        """
+        Returns the declared type of id columns of temporary tables.
+        """
+        return BINARY_ID_TYPE if self.id_format == "binary" else "text"
+
     def _execute(self, *args, **kwargs):
         """
         Execute a command with the active cursor.
@@ -53,18 +733,27 @@ class Database:
     def transaction(self):
         """
         Context to create explicit transactions. This helps keep the database in a known state in
-        the case of exceptions, since some actions are otherwise automatically committed.
+        the case of exceptions, since some actions are otherwise automatically committed. Items
+        inserted by the transaction are added to the search index before it is committed.
         """
         self._active_cursor = self._con.cursor()
         try:
             # Start a transaction.
             self._execute("BEGIN")
             yield
+            self.index_queued_items()
             # Complete the transaction.
-            self._execute("COMMIT")
+            with tracing.span("commit"):
+                start = time.perf_counter()
+                self._execute("COMMIT")
+                metrics.COMMIT_DURATION.observe(time.perf_counter() - start)
+            metrics.TRANSACTIONS.inc(result="commit")
         except Exception as ex:
-            # Undo the changes on failure.
+            # Undo the changes on failure. The id format may have been changed by the
+            # transaction, so it is read again on next use.
             self._execute("ROLLBACK")
+            metrics.TRANSACTIONS.inc(result="rollback")
+            self._id_format = None
             raise ex
         finally:
             self._active_cursor.close()
@@ -98,57 +787,414 @@ class Database:
         if name in self.get_tables():
             self._execute(f"DROP TABLE {name}")
 
-    def create_tables(self, force=False):
-        """
-        Create tables for storing item information.
-        """
-        schema = {
-            "tracks": {
-                "id": "text NOT NULL PRIMARY KEY",
-                "name": "text NOT NULL",
-                "album_id": "text NOT NULL",
-                "rating": "int DEFAULT NULL CHECK (rating IN (NULL, -1, 0, 1))",
-            },
-            "albums": {
-                "id": "text NOT NULL PRIMARY KEY",
-                "name": "text NOT NULL",
-                "artist_id": "text NOT NULL",
-                "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
-            },
-            "artists": {
-                "id": "text NOT NULL PRIMARY KEY",
-                "name": "text NOT NULL",
-                "time_fetched": "int NOT NULL DEFAULT 0 CHECK (time_fetched >= 0)",
-            },
-        }
+    def create_tables(self, force=False, id_format=None):
+        """
+        Create tables for storing item information. New item tables store ids in the given
+        format, or as text by default. A ValueError is raised if the existing tables store ids
+        in another format, since converting them is done by `migrate_ids`.
+        """
+        if id_format is not None and id_format not in ID_FORMATS:
+            raise ValueError(f"Unknown id format {repr(id_format)}")
 
         with self.transaction():
             # Get a list of existing tables.
             tables = self.get_tables()
 
+            # Keep the id format of existing item tables.
+            if "tracks" in tables and not force:
+                if id_format is not None and id_format != self.id_format:
+                    raise ValueError(
+                        f"Database stores {self.id_format} ids, migrate them to change the "
+                        "format"
+                    )
+            else:
+                self._id_format = id_format or "text"
+
             # Drop tables to recreate on force.
             if force:
                 self.drop_table("tracks")
                 self.drop_table("albums")
                 self.drop_table("artists")
+                for name in DERIVED_SCHEMA:
+                    self.drop_table(name)
+                for name in [
+                    *ENRICHMENT_SCHEMA,
+                    *CACHE_SCHEMA,
+                    *CRAWL_SCHEMA,
+                    *HISTORY_SCHEMA,
+                    *JOURNAL_SCHEMA,
+                ]:
+                    self.drop_table(name)
+                self.drop_table("search_index")
 
             # Create the tracks table.
             if "tracks" not in tables or force:
-                self.create_table_from_schema("tracks", schema["tracks"])
+                self.create_table_from_schema("tracks", SCHEMA["tracks"])
 
             # Create the albums table.
             if "albums" not in tables or force:
-                self.create_table_from_schema("albums", schema["albums"])
+                self.create_table_from_schema("albums", SCHEMA["albums"])
 
             # Create the artists table.
             if "artists" not in tables or force:
-                self.create_table_from_schema("artists", schema["artists"])
+                self.create_table_from_schema("artists", SCHEMA["artists"])
+
+            # Create any missing enrichment, cache, crawl, history, and journal tables.
+            self.create_auxiliary_tables()
+
+            # Create any missing derived tables. These are filled from existing items below, which
+            # upgrades databases created before the derived tables were added.
+            rebuild = False
+            for name, schema in DERIVED_SCHEMA.items():
+                if name not in tables or force:
+                    self.create_table_from_schema(name, schema)
+                    rebuild = True
+
+            # Create the search index.
+            if "search_index" not in tables or force:
+                self._execute(SEARCH_TABLE)
+                rebuild = True
+
+            if rebuild:
+                self.rebuild()
+
+            # Create any missing indexes and triggers. Dropping a table also drops its indexes
+            # and triggers.
+            self.create_indexes()
+            self.create_triggers()
+
+    def create_auxiliary_tables(self):
+        """
+        Create any missing enrichment, cache, crawl, history, and journal tables. This also
+        upgrades databases created before one of these tables was added.
+        """
+        tables = self.get_tables()
+        schemas = {
+            **ENRICHMENT_SCHEMA,
+            **CACHE_SCHEMA,
+            **CRAWL_SCHEMA,
+            **HISTORY_SCHEMA,
+            **JOURNAL_SCHEMA,
+        }
+        for name, schema in schemas.items():
+            if name not in tables:
+                self.create_table_from_schema(name, schema)
+
+    def create_indexes(self):
+        """
+        Create the secondary indexes used by the relational queries if they do not exist.
+        """
+        for name, columns in INDEXES.items():
+            self._execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+    def create_triggers(self):
+        """
+        Create the triggers that maintain derived tables, replacing existing ones so that
+        databases created with older definitions are upgraded.
+        """
+        for name, body in TRIGGERS.items():
+            self._execute(f"DROP TRIGGER IF EXISTS {name}")
+            self._execute(f"CREATE TRIGGER {name} {body}")
+
+    def drop_indexes(self):
+        """
+        Drop the secondary indexes if they exist.
+        """
+        for name in INDEXES:
+            self._execute(f"DROP INDEX IF EXISTS {name}")
+
+    def drop_triggers(self):
+        """
+        Drop the triggers that maintain derived tables if they exist.
+        """
+        for name in TRIGGERS:
+            self._execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context for loading many rows at once in a single transaction. Secondary indexes and
+        triggers are dropped while loading and rebuilt in one pass at the end, which is much
+        faster than maintaining them row by row. The loaded rows are recorded in the journal of
+        changes at the end.
+        """
+        with self.transaction():
+            last_rowids = {
+                table: self._con.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[
+                    0
+                ]
+                for table in CHANGE_COLUMNS
+            }
+            self.drop_indexes()
+            self.drop_triggers()
+            yield
+            self.rebuild()
+            self.record_inserts(last_rowids)
+            self.create_indexes()
+            self.create_triggers()
+
+    def rebuild(self):
+        """
+        Rebuild all derived tables from the tracks, albums, and artists tables. The cached
+        recommendations are cleared, since changes made without triggers are not tracked.
+        """
+        self.rebuild_search_index()
+        self.rebuild_rating_summaries()
+        self.clear_recommendations()
+
+    def record_inserts(self, last_rowids):
+        """
+        Record the rows of each item table with a rowid above the given last rowid as inserted
+        in the journal of changes, for rows inserted while the triggers were dropped.
+        """
+        for table, (kind, parent, value) in CHANGE_COLUMNS.items():
+            cmd = f"""
+              INSERT INTO changes (kind, item_id, operation, name, parent_id, value)
+                   SELECT '{kind}',
+                          id,
+                          'insert',
+                          name,
+                          {"NULL" if parent is None else parent},
+                          {value}
+                     FROM {table}
+                    WHERE rowid > ?
+                 ORDER BY rowid
+            """
+            self._execute(cmd, (last_rowids.get(table) or 0,))
+
+    def iter_changes(self, since=0, limit=None, chunk_size=10000):
+        """
+        Yield lists of up to `chunk_size` entries of the journal of changes with a sequence
+        number above `since`, in order, stopping after `limit` entries. Each entry is a tuple
+        ordered like the columns of the journal schema. Batches are read with keyset pagination
+        on the sequence number, so entries appended while reading are included.
+        """
+        columns = ", ".join(JOURNAL_SCHEMA["changes"])
+        cmd = f"""
+          SELECT {columns}
+            FROM changes
+           WHERE seq > ?
+        ORDER BY seq
+           LIMIT ?
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            rows = self._con.execute(cmd, (since, size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            since = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def compact_changes(self, until=None):
+        """
+        Delete entries of the journal of changes up to the sequence number `until`, or all
+        entries, that are followed by a newer entry of the same item and operation. Replaying
+        the journal from the start still gives the latest state of every item, so readers at
+        any position are not affected. Returns the number of entries deleted.
+        """
+        cmd = """
+        DELETE FROM changes
+              WHERE (? IS NULL OR seq <= ?)
+                AND seq NOT IN (  SELECT MAX(seq)
+                                    FROM changes
+                                GROUP BY kind, item_id, operation)
+        """
+        cursor = self._execute(cmd, (until, until))
+        return cursor.rowcount
+
+    def clear_recommendations(self):
+        """
+        Clear the cached recommendations and the tracked rating changes, so all unrated tracks
+        are scored again. This does nothing for databases without the recommendation tables.
+        """
+        if "recommendations" in self.get_tables():
+            self._execute("DELETE FROM recommendations")
+            self._execute("DELETE FROM rating_changes")
+
+    def index_queued_items(self):
+        """
+        Add the items queued by the insert triggers to the search index and clear the queue.
+        This does nothing when the queue is empty or missing.
+        """
+        if "search_queue" not in self.get_tables():
+            return
+        if self._con.execute("SELECT 1 FROM search_queue LIMIT 1").fetchone() is None:
+            return
+
+        for table, kind in SEARCH_KINDS.items():
+            cmd = f"""
+            INSERT INTO search_index (name, kind, item_id)
+                 SELECT name,
+                        '{kind}',
+                        id
+                   FROM {table}
+                  WHERE rowid IN (SELECT item_rowid
+                                    FROM search_queue
+                                   WHERE kind = '{kind}')
+            """
+            self._execute(cmd)
+        self._execute("DELETE FROM search_queue")
+
+    def rebuild_search_index(self):
+        """
+        Clear the search index and fill it again from the tracks, albums, and artists tables.
+        """
+        self._execute("DELETE FROM search_queue")
+        self._execute("DELETE FROM search_index")
+        for table, kind in SEARCH_KINDS.items():
+            cmd = f"""
+            INSERT INTO search_index (name, kind, item_id)
+                 SELECT name,
+                        '{kind}',
+                        id
+                   FROM {table}
+            """
+            self._execute(cmd)
+
+    def rebuild_rating_summaries(self):
+        """
+        Clear the album and artist rating summaries and aggregate them again from the tracks.
+        """
+        self._execute("DELETE FROM album_ratings")
+        self._execute("DELETE FROM artist_ratings")
+
+        cmd = """
+          INSERT INTO album_ratings (album_id, num_tracks, num_liked, num_neutral, num_disliked)
+               SELECT album_id,
+                      COUNT(),
+                      SUM(IFNULL(rating > 0, 0)),
+                      SUM(IFNULL(rating = 0, 0)),
+                      SUM(IFNULL(rating < 0, 0))
+                 FROM tracks
+             GROUP BY album_id
+        """
+        self._execute(cmd)
+
+        # Artists are aggregated from their albums, so tracks of albums that are not in the
+        # database yet are not counted for any artist. This matches the incremental triggers.
+        cmd = """
+          INSERT INTO artist_ratings (artist_id, num_tracks, num_liked, num_neutral, num_disliked)
+               SELECT albums.artist_id,
+                      SUM(album_ratings.num_tracks),
+                      SUM(album_ratings.num_liked),
+                      SUM(album_ratings.num_neutral),
+                      SUM(album_ratings.num_disliked)
+                 FROM album_ratings
+                 JOIN albums
+                   ON albums.id = album_ratings.album_id
+             GROUP BY albums.artist_id
+        """
+        self._execute(cmd)
+
+    def migrate_ids(self, id_format):
+        """
+        Convert the id columns of all tables to the given id format. Each table is copied with
+        its rowids, so caches keyed by rowid stay valid, and the search index is rebuilt. The
+        database is vacuumed afterwards to release the freed pages. Returns False if the ids are
+        already in the format.
+        """
+        if id_format not in ID_FORMATS:
+            raise ValueError(f"Unknown id format {repr(id_format)}")
+        if id_format == self.id_format:
+            return False
+
+        self._con.create_function("encode_id", 1, encode_id, deterministic=True)
+        self._con.create_function("decode_id", 1, decode_id, deterministic=True)
+        convert = "encode_id" if id_format == "binary" else "decode_id"
+        schemas = {
+            **SCHEMA,
+            **DERIVED_SCHEMA,
+            **ENRICHMENT_SCHEMA,
+            **CACHE_SCHEMA,
+            **CRAWL_SCHEMA,
+            **JOURNAL_SCHEMA,
+        }
+
+        with self.transaction():
+            tables = self.get_tables()
+            self.drop_indexes()
+            self.drop_triggers()
+            self._execute("DROP TABLE IF EXISTS temp.score_ids")
+
+            self._id_format = id_format
+            for table, id_columns in ID_COLUMNS.items():
+                if table not in tables:
+                    continue
+                columns = [
+                    column
+                    for column, datatype in schemas[table].items()
+                    if "GENERATED" not in datatype
+                ]
+                values = [
+                    f"{convert}({column})" if column in id_columns else column
+                    for column in columns
+                ]
+                self._execute(f"ALTER TABLE {table} RENAME TO {table}_migrated")
+                self.create_table_from_schema(table, schemas[table])
+                cmd = f"""
+                INSERT INTO {table} (rowid, {', '.join(columns)})
+                     SELECT rowid, {', '.join(values)}
+                       FROM {table}_migrated
+                """
+                self._execute(cmd)
+                self._execute(f"DROP TABLE {table}_migrated")
+
+            if "search_index" in tables:
+                self.rebuild_search_index()
+            self.create_indexes()
+            self.create_triggers()
+
+        self._con.execute("VACUUM")
+        return True
+
+    def known_ids(self, table, ids):
+        """
+        Returns the set of the given ids that are in one of the item tables, including those
+        inserted by the active transaction. Only the given ids are looked up, through the
+        primary key, so the cost follows the number of ids rather than the size of the table.
+        """
+        ids = list(ids)
+        encode = self._id_encoder()
+        known = set()
+        for start in range(0, len(ids), MAX_VARIABLES):
+            chunk = ids[start : start + MAX_VARIABLES]
+            placeholders = ", ".join("?" for _ in chunk)
+            cmd = f"""
+            SELECT id
+              FROM {table}
+             WHERE id IN ({placeholders})
+            """
+            known.update(
+                row[0] for row in self._con.execute(cmd, list(map(encode, chunk)))
+            )
+        return known
+
+    def _new_items(self, table, items):
+        """
+        Returns a list of the items whose ids are not in an item table. Items given more than
+        once in the list are left to the conflict clause of the insert.
+        """
+        known = self.known_ids(table, (item.id for item in items))
+        if not known:
+            return items
+        new = [item for item in items if item.id not in known]
+        metrics.ROWS_SKIPPED.inc(len(items) - len(new), table=table)
+        return new
 
     def insert_tracks(self, tracks, rating=None):
         """
-        Insert data into the tracks table from a list of Track objects.
+        Insert data into the tracks table from a list of Track objects. Without a rating, tracks
+        that are already known are skipped before reaching the database.
         """
+        encode = self._id_encoder()
         if rating is None:
+            tracks = self._new_items("tracks", list(tracks))
+            if not tracks:
+                return
+
             # Insert the track without setting the rating.
             cmd = """
             INSERT INTO tracks (id, name, album_id)
@@ -156,7 +1202,10 @@ class Database:
             ON CONFLICT (id)
                      DO NOTHING
             """
-            data = [(track.id, track.name, track.album_id) for track in tracks]
+            data = [
+                (encode(track.id), track.name, encode(track.album_id))
+                for track in tracks
+            ]
         else:
             # Insert the track and set the rating.
             cmd = """
@@ -166,34 +1215,68 @@ class Database:
                      DO UPDATE
                     SET rating = excluded.rating
             """
-            data = [(track.id, track.name, track.album_id, rating) for track in tracks]
-        self._executemany(cmd, data)
+            data = [
+                (encode(track.id), track.name, encode(track.album_id), rating)
+                for track in tracks
+            ]
+            last = self._con.execute("SELECT MAX(rowid) FROM tracks").fetchone()[0] or 0
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="tracks")
+        num_inserted = cursor.rowcount
+        if rating is not None:
+            # The upsert counts updated rows as written, so new rows are counted by their
+            # rowids, which are always above the largest rowid before the insert.
+            cmd = """
+            SELECT COUNT()
+              FROM tracks
+             WHERE rowid > ?
+            """
+            num_inserted = self._con.execute(cmd, (last,)).fetchone()[0]
+        metrics.ROWS_INSERTED.inc(num_inserted, table="tracks")
 
     def insert_albums(self, albums):
         """
-        Insert data into the albums table from a list of Album objects.
+        Insert data into the albums table from a list of Album objects. Albums that are already
+        known are skipped before reaching the database.
         """
+        albums = self._new_items("albums", list(albums))
+        if not albums:
+            return
+
         cmd = """
         INSERT INTO albums (id, name, artist_id)
              VALUES (?, ?, ?)
         ON CONFLICT (id)
                  DO NOTHING
         """
-        data = [(album.id, album.name, album.artist_id) for album in albums]
-        self._executemany(cmd, data)
+        encode = self._id_encoder()
+        data = [
+            (encode(album.id), album.name, encode(album.artist_id)) for album in albums
+        ]
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="albums")
+        metrics.ROWS_INSERTED.inc(cursor.rowcount, table="albums")
 
     def insert_artists(self, artists):
         """
-        Insert data into the artists table from a list of Artist objects.
+        Insert data into the artists table from a list of Artist objects. Artists that are
+        already known are skipped before reaching the database.
         """
+        artists = self._new_items("artists", list(artists))
+        if not artists:
+            return
+
         cmd = """
         INSERT INTO artists (id, name)
              VALUES (?, ?)
         ON CONFLICT (id)
                  DO NOTHING
         """
-        data = [(artist.id, artist.name) for artist in artists]
-        self._executemany(cmd, data)
+        encode = self._id_encoder()
+        data = [(encode(artist.id), artist.name) for artist in artists]
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="artists")
+        metrics.ROWS_INSERTED.inc(cursor.rowcount, table="artists")
 
     def update_album_time_fetched(self, album):
         """
@@ -201,12 +1284,13 @@ class Database:
         """
         timestamp = int(time.time())
 
-        cmd = f"""
+        cmd = """
         UPDATE albums
-           SET time_fetched = {timestamp}
-         WHERE albums.id = '{album.id}'
+           SET time_fetched = ?
+         WHERE albums.id = ?
         """
-        self._execute(cmd)
+        cursor = self._execute(cmd, (timestamp, self._id_encoder()(album.id)))
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="albums")
 
     def update_artist_time_fetched(self, artist):
         """
@@ -214,12 +1298,474 @@ class Database:
         """
         timestamp = int(time.time())
 
-        cmd = f"""
+        cmd = """
         UPDATE artists
-           SET time_fetched = {timestamp}
-         WHERE artists.id = '{artist.id}'
+           SET time_fetched = ?
+         WHERE artists.id = ?
         """
-        self._execute(cmd)
+        cursor = self._execute(cmd, (timestamp, self._id_encoder()(artist.id)))
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="artists")
+
+    def insert_audio_features(self, features):
+        """
+        Insert or replace rows in the audio features table from a dictionary of track ids to a
+        dictionary of features, or to None for tracks without features.
+        """
+        timestamp = int(time.time())
+
+        columns = ", ".join(["track_id", *AUDIO_FEATURES, "time_fetched"])
+        placeholders = ", ".join("?" for _ in range(len(AUDIO_FEATURES) + 2))
+        cmd = f"""
+        INSERT OR REPLACE INTO audio_features ({columns})
+                       VALUES ({placeholders})
+        """
+        encode = self._id_encoder()
+        data = [
+            (
+                encode(track_id),
+                *((values or {}).get(name) for name in AUDIO_FEATURES),
+                timestamp,
+            )
+            for track_id, values in features.items()
+        ]
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="audio_features")
+
+    def insert_artist_metadata(self, metadata):
+        """
+        Insert or update rows in the artist metadata table from a dictionary of artist ids to
+        the artist object returned by the API, or to None for artists that were not found.
+        """
+        timestamp = int(time.time())
+
+        cmd = """
+        INSERT INTO artist_metadata (artist_id, name, genres, popularity, followers, time_fetched)
+             VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (artist_id)
+                 DO UPDATE
+                SET name = excluded.name,
+                    genres = excluded.genres,
+                    popularity = excluded.popularity,
+                    followers = excluded.followers,
+                    time_fetched = excluded.time_fetched
+        """
+        encode = self._id_encoder()
+        data = []
+        for artist_id, item in metadata.items():
+            item = item or {}
+            genres = item.get("genres")
+            followers = item.get("followers") or {}
+            data.append(
+                (
+                    encode(artist_id),
+                    item.get("name"),
+                    None if genres is None else json.dumps(sorted(genres)),
+                    item.get("popularity"),
+                    followers.get("total"),
+                    timestamp,
+                )
+            )
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="artist_metadata")
+
+    def insert_recommendations(self, rows):
+        """
+        Insert or replace rows in the recommendations table. Each row is a tuple of the track id,
+        score, album score, artist score, similarity score, and neighbor radius.
+        """
+        timestamp = int(time.time())
+
+        cmd = """
+        INSERT OR REPLACE INTO recommendations (track_id,
+                                                score,
+                                                album_score,
+                                                artist_score,
+                                                similarity_score,
+                                                neighbor_radius,
+                                                time_scored)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        encode = self._id_encoder()
+        data = [(encode(row[0]), *row[1:], timestamp) for row in rows]
+        cursor = self._executemany(cmd, data)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table="recommendations")
+
+    def get_rating_changes(self):
+        """
+        Returns a list of the ids of rated tracks that changed since the recommendations were
+        scored.
+        """
+        cmd = """
+        SELECT track_id
+          FROM rating_changes
+        """
+        return [row[0] for row in self._con.execute(cmd)]
+
+    def delete_rating_changes(self):
+        """
+        Forget the tracked rating changes once the recommendations are up to date.
+        """
+        self._execute("DELETE FROM rating_changes")
+
+    def get_feature_scaling(self):
+        """
+        Returns a dictionary of feature names to a tuple of the mean and standard deviation
+        stored by `set_feature_scaling`.
+        """
+        cmd = """
+        SELECT feature,
+               mean,
+               std
+          FROM feature_scaling
+        """
+        return {row[0]: (row[1], row[2]) for row in self._con.execute(cmd)}
+
+    def set_feature_scaling(self, scaling):
+        """
+        Replace the stored feature scaling with a dictionary of feature names to a tuple of the
+        mean and standard deviation.
+        """
+        self._execute("DELETE FROM feature_scaling")
+        cmd = """
+        INSERT INTO feature_scaling (feature, mean, std)
+             VALUES (?, ?, ?)
+        """
+        self._executemany(cmd, [(name, *values) for name, values in scaling.items()])
+
+    def get_recommendation_candidates(self):
+        """
+        Returns a list of the ids of unrated tracks whose recommendation is missing or out of
+        date because a track of the same album or artist changed.
+        """
+        cmd = """
+        SELECT id
+          FROM tracks
+         WHERE rating IS NULL
+           AND (id NOT IN (SELECT track_id FROM recommendations)
+                OR album_id IN (SELECT album_id FROM rating_changes)
+                OR album_id IN (SELECT id
+                                  FROM albums
+                                 WHERE artist_id IN (SELECT albums.artist_id
+                                                       FROM rating_changes
+                                                       JOIN albums
+                                                         ON albums.id = rating_changes.album_id)))
+        """
+        return [row[0] for row in self._con.execute(cmd)]
+
+    def get_neighbor_radii(self):
+        """
+        Returns a list of tuples of the track id and neighbor radius of each recommendation with
+        a similarity score.
+        """
+        cmd = """
+        SELECT track_id,
+               neighbor_radius
+          FROM recommendations
+         WHERE neighbor_radius IS NOT NULL
+        """
+        return self._con.execute(cmd).fetchall()
+
+    def get_rating_scores(self, prior, track_ids=None):
+        """
+        Returns a list of tuples of the id, album score, and artist score of unrated tracks,
+        optionally only of the given tracks. Each score is the number of liked minus disliked
+        tracks divided by the number of rated tracks plus `prior`, which pulls the scores of
+        groups with few ratings toward neutral.
+        """
+        cmd = """
+           SELECT tracks.id,
+                  IFNULL(album_ratings.score / (album_ratings.num_rated + ?), 0.0),
+                  IFNULL(artist_ratings.score / (artist_ratings.num_rated + ?), 0.0)
+             FROM tracks
+        LEFT JOIN album_ratings
+               ON album_ratings.album_id = tracks.album_id
+        LEFT JOIN albums
+               ON albums.id = tracks.album_id
+        LEFT JOIN artist_ratings
+               ON artist_ratings.artist_id = albums.artist_id
+            WHERE tracks.rating IS NULL
+        """
+        prior = float(prior)
+        if track_ids is None:
+            return self._con.execute(cmd, (prior, prior)).fetchall()
+
+        # Join the ids from a temporary table, since there can be more than the variable limit.
+        encode = self._id_encoder()
+        self._execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS score_ids (id {self._id_type()} PRIMARY KEY)"
+        )
+        self._execute("DELETE FROM temp.score_ids")
+        self._executemany(
+            "INSERT OR IGNORE INTO temp.score_ids (id) VALUES (?)",
+            ((encode(id_),) for id_ in track_ids),
+        )
+        cmd += "AND tracks.id IN (SELECT id FROM temp.score_ids)"
+        rows = self._con.execute(cmd, (prior, prior)).fetchall()
+        self._execute("DELETE FROM temp.score_ids")
+        return rows
+
+    def diff_playlist(self, playlist, category=None):
+        """
+        Compare the items of a playlist with the database. The ids are loaded into temporary
+        tables and joined with the item tables, so the comparison is a few set operations in
+        SQLite. Returns a dictionary of the number of tracks, albums, and artists in the
+        playlist and of those that are new, and the number of tracks in the library that are
+        rated and unrated. With a category of "new", "present", "rated", or "unrated", also
+        returns a list of the Track objects of the playlist in that category, with their
+        ratings, and otherwise an empty list.
+        """
+        encode = self._id_encoder()
+        id_type = self._id_type()
+        self._execute(
+            f"CREATE TEMP TABLE diff_tracks (id {id_type} PRIMARY KEY, name text, "
+            f"album_id {id_type})"
+        )
+        self._execute(f"CREATE TEMP TABLE diff_albums (id {id_type} PRIMARY KEY)")
+        self._execute(f"CREATE TEMP TABLE diff_artists (id {id_type} PRIMARY KEY)")
+        try:
+            self._executemany(
+                "INSERT INTO temp.diff_tracks (id, name, album_id) VALUES (?, ?, ?)",
+                (
+                    (encode(track.id), track.name, encode(track.album_id))
+                    for track in playlist.tracks
+                ),
+            )
+            self._executemany(
+                "INSERT INTO temp.diff_albums (id) VALUES (?)",
+                ((encode(album.id),) for album in playlist.albums),
+            )
+            self._executemany(
+                "INSERT INTO temp.diff_artists (id) VALUES (?)",
+                ((encode(artist.id),) for artist in playlist.artists),
+            )
+
+            cmd = """
+               SELECT COUNT(),
+                      COUNT() - COUNT(tracks.id),
+                      COUNT(tracks.rating),
+                      COUNT(tracks.id) - COUNT(tracks.rating)
+                 FROM temp.diff_tracks
+            LEFT JOIN tracks
+                   ON tracks.id = diff_tracks.id
+            """
+            num_tracks, num_new_tracks, num_rated, num_unrated = self._execute(
+                cmd
+            ).fetchone()
+
+            cmd = """
+               SELECT COUNT(),
+                      COUNT() - COUNT(albums.id)
+                 FROM temp.diff_albums
+            LEFT JOIN albums
+                   ON albums.id = diff_albums.id
+            """
+            num_albums, num_new_albums = self._execute(cmd).fetchone()
+
+            cmd = """
+               SELECT COUNT(),
+                      COUNT() - COUNT(artists.id)
+                 FROM temp.diff_artists
+            LEFT JOIN artists
+                   ON artists.id = diff_artists.id
+            """
+            num_artists, num_new_artists = self._execute(cmd).fetchone()
+
+            conditions = {
+                "new": "tracks.id IS NULL",
+                "present": "tracks.id IS NOT NULL",
+                "rated": "tracks.rating IS NOT NULL",
+                "unrated": "tracks.id IS NOT NULL AND tracks.rating IS NULL",
+            }
+            tracks = []
+            if category is not None:
+                cmd = f"""
+                   SELECT diff_tracks.id,
+                          diff_tracks.name,
+                          diff_tracks.album_id,
+                          tracks.rating
+                     FROM temp.diff_tracks
+                LEFT JOIN tracks
+                       ON tracks.id = diff_tracks.id
+                    WHERE {conditions[category]}
+                 ORDER BY diff_tracks.rowid
+                """
+                tracks = [
+                    Track(id_, name, album_id, rating=rating)
+                    for id_, name, album_id, rating in self._execute(cmd)
+                ]
+        finally:
+            self._execute("DROP TABLE temp.diff_tracks")
+            self._execute("DROP TABLE temp.diff_albums")
+            self._execute("DROP TABLE temp.diff_artists")
+
+        counts = {
+            "num_tracks": num_tracks,
+            "num_new_tracks": num_new_tracks,
+            "num_rated_tracks": num_rated,
+            "num_unrated_tracks": num_unrated,
+            "num_albums": num_albums,
+            "num_new_albums": num_new_albums,
+            "num_artists": num_artists,
+            "num_new_artists": num_new_artists,
+        }
+        return counts, tracks
+
+    def query_recommendations(self, limit=20):
+        """
+        Returns a list of tuples of the track id, score, album score, artist score, and
+        similarity score of the best recommendations, from best to worst.
+        """
+        cmd = """
+          SELECT track_id,
+                 score,
+                 album_score,
+                 artist_score,
+                 similarity_score
+            FROM recommendations
+        ORDER BY score DESC
+           LIMIT ?
+        """
+        return self._con.execute(cmd, (limit,)).fetchall()
+
+    def seed_frontier(self, prior):
+        """
+        Add artists of the library that have not been crawled to the frontier at depth 0. The
+        priority of each is the number of liked minus disliked tracks divided by the number of
+        rated tracks plus `prior`, or 0 for artists without ratings. Returns the number of
+        artists added.
+        """
+        timestamp = int(time.time())
+
+        cmd = """
+             INSERT INTO frontier (artist_id, name, depth, priority, time_added)
+                  SELECT artists.id,
+                         artists.name,
+                         0,
+                         IFNULL(artist_ratings.score / (artist_ratings.num_rated + ?), 0.0),
+                         ?
+                    FROM artists
+               LEFT JOIN artist_ratings
+                      ON artist_ratings.artist_id = artists.id
+                   WHERE artists.id NOT IN (SELECT artist_id FROM crawled_artists)
+        ON CONFLICT (artist_id)
+                      DO NOTHING
+        """
+        cursor = self._execute(cmd, (float(prior), timestamp))
+        return cursor.rowcount
+
+    def push_frontier(self, artists, depth, priority):
+        """
+        Add artists that have not been crawled to the frontier. The priority is added to the
+        priority of artists already in the frontier, so artists related to several rated artists
+        rank higher, and the lowest depth is kept.
+        """
+        timestamp = int(time.time())
+
+        cmd = """
+             INSERT INTO frontier (artist_id, name, depth, priority, time_added)
+                  SELECT ?, ?, ?, ?, ?
+                   WHERE ? NOT IN (SELECT artist_id FROM crawled_artists)
+        ON CONFLICT (artist_id)
+                      DO UPDATE
+                     SET priority = priority + excluded.priority,
+                         depth = MIN(depth, excluded.depth)
+        """
+        encode = self._id_encoder()
+        data = [
+            (
+                encode(artist.id),
+                artist.name,
+                depth,
+                priority,
+                timestamp,
+                encode(artist.id),
+            )
+            for artist in artists
+        ]
+        self._executemany(cmd, data)
+
+    def get_frontier_head(self, max_depth, exclude=()):
+        """
+        Returns a tuple of the Artist object, depth, and priority of the highest priority artist
+        in the frontier with a depth below `max_depth`, or None if there is none. Artists with
+        ids in `exclude` are skipped.
+        """
+        encode = self._id_encoder()
+        exclude = [encode(id_) for id_ in exclude]
+        placeholders = ", ".join("?" for _ in exclude)
+        cmd = f"""
+          SELECT artist_id,
+                 name,
+                 depth,
+                 priority
+            FROM frontier
+           WHERE depth < ?
+             AND artist_id NOT IN ({placeholders})
+        ORDER BY priority DESC,
+                 rowid
+           LIMIT 1
+        """
+        row = self._con.execute(cmd, (max_depth, *exclude)).fetchone()
+        if row is None:
+            return None
+        id_, name, depth, priority = row
+        return Artist(id_, name), depth, priority
+
+    def mark_artist_crawled(self, artist, depth, num_related):
+        """
+        Move an artist from the frontier to the crawled artists.
+        """
+        timestamp = int(time.time())
+
+        cmd = """
+        INSERT OR REPLACE INTO crawled_artists (artist_id, depth, num_related, time_crawled)
+                       VALUES (?, ?, ?, ?)
+        """
+        artist_id = self._id_encoder()(artist.id)
+        self._execute(cmd, (artist_id, depth, num_related, timestamp))
+        self._execute("DELETE FROM frontier WHERE artist_id = ?", (artist_id,))
+
+    def get_artist_score(self, artist_id, prior):
+        """
+        Returns the number of liked minus disliked tracks of an artist divided by the number of
+        rated tracks plus `prior`, or None if the artist has no rated tracks.
+        """
+        cmd = """
+        SELECT score / (num_rated + ?)
+          FROM artist_ratings
+         WHERE artist_id = ?
+           AND num_rated > 0
+        """
+        params = (float(prior), self._id_encoder()(artist_id))
+        row = self._con.execute(cmd, params).fetchone()
+        return None if row is None else row[0]
+
+    def insert_run(self, command, time_started):
+        """
+        Insert a run that has started into the runs table and return its id.
+        """
+        cmd = """
+        INSERT INTO runs (command, time_started)
+             VALUES (?, ?)
+        """
+        cursor = self._execute(cmd, (command, time_started))
+        return cursor.lastrowid
+
+    def update_run(self, run_id, time_finished, status, counts):
+        """
+        Update a run in the runs table when it finishes. The counts are a dictionary with a
+        value for each name in `RUN_COUNTS`.
+        """
+        assignments = ",\n               ".join(f"{name} = ?" for name in RUN_COUNTS)
+        cmd = f"""
+        UPDATE runs
+           SET time_finished = ?,
+               status = ?,
+               {assignments}
+         WHERE id = ?
+        """
+        params = [time_finished, status, *(counts[name] for name in RUN_COUNTS), run_id]
+        self._execute(cmd, params)
 
     def get_tracks(self):
         """
@@ -277,10 +1823,705 @@ class Database:
 
         return artists
 
+    def get_artists_to_fetch(self, limit=None):
+        """
+        Returns a list of Artist objects for artists whose albums have not been fetched, from
+        most to least valuable. Artists are ordered by their number of liked tracks, then by
+        their number of liked minus disliked tracks, then from most to least recently added.
+        """
+        cmd = """
+           SELECT artists.id,
+                  artists.name,
+                  artists.time_fetched
+             FROM artists
+        LEFT JOIN artist_ratings
+               ON artist_ratings.artist_id = artists.id
+            WHERE artists.time_fetched = 0
+         ORDER BY IFNULL(artist_ratings.num_liked, 0) DESC,
+                  IFNULL(artist_ratings.score, 0) DESC,
+                  artists.rowid DESC
+        """
+        params = []
+        if limit is not None:
+            cmd += "LIMIT ?"
+            params.append(limit)
+
+        return [
+            Artist(id_, name, time_fetched=time_fetched)
+            for id_, name, time_fetched in self._con.execute(cmd, params)
+        ]
+
+    def get_albums_to_fetch(self, limit=None):
+        """
+        Returns a list of Album objects for albums whose tracks have not been fetched, from most
+        to least valuable. Albums are ordered by the number of liked tracks of their artist and
+        then of the album itself, then by the number of liked minus disliked tracks of their
+        artist, then from most to least recently added.
+        """
+        cmd = """
+           SELECT albums.id,
+                  albums.name,
+                  albums.artist_id,
+                  albums.time_fetched
+             FROM albums
+        LEFT JOIN album_ratings
+               ON album_ratings.album_id = albums.id
+        LEFT JOIN artist_ratings
+               ON artist_ratings.artist_id = albums.artist_id
+            WHERE albums.time_fetched = 0
+         ORDER BY IFNULL(artist_ratings.num_liked, 0) DESC,
+                  IFNULL(album_ratings.num_liked, 0) DESC,
+                  IFNULL(artist_ratings.score, 0) DESC,
+                  albums.rowid DESC
+        """
+        params = []
+        if limit is not None:
+            cmd += "LIMIT ?"
+            params.append(limit)
+
+        return [
+            Album(id_, name, artist_id, time_fetched=time_fetched)
+            for id_, name, artist_id, time_fetched in self._con.execute(cmd, params)
+        ]
+
+    def count_rows(self, table):
+        """
+        Returns the number of rows in a table.
+        """
+        return self._con.execute(f"SELECT COUNT() FROM {table}").fetchone()[0]
+
+    def iter_rows(self, table, chunk_size=10000):
+        """
+        Yield lists of up to `chunk_size` rows from one of the item tables. Each row is a tuple
+        ordered like the columns of the table schema. Only one chunk is held in memory at a time.
+        """
+        columns = ", ".join(SCHEMA[table])
+        cur = self._con.cursor()
+        try:
+            cur.execute(f"SELECT {columns} FROM {table} ORDER BY rowid")
+            while rows := cur.fetchmany(chunk_size):
+                yield rows
+        finally:
+            cur.close()
+
+    def insert_rows(self, table, rows):
+        """
+        Insert rows into one of the item tables. Each row is a sequence of values ordered like
+        the columns of the table schema, with text ids.
+        """
+        if self.id_format == "binary":
+            id_columns = [column in ID_COLUMNS[table] for column in SCHEMA[table]]
+            rows = (
+                [
+                    encode_id(value) if is_id else value
+                    for is_id, value in zip(id_columns, row)
+                ]
+                for row in rows
+            )
+
+        columns = ", ".join(SCHEMA[table])
+        placeholders = ", ".join("?" for _ in SCHEMA[table])
+        cmd = f"""
+        INSERT INTO {table} ({columns})
+             VALUES ({placeholders})
+        """
+        cursor = self._executemany(cmd, rows)
+        metrics.ROWS_WRITTEN.inc(cursor.rowcount, table=table)
+        metrics.ROWS_INSERTED.inc(cursor.rowcount, table=table)
+
+    def count_tracks_without_features(self):
+        """
+        Returns the number of tracks without a row in the audio features table.
+        """
+        cmd = """
+           SELECT COUNT()
+             FROM tracks
+        LEFT JOIN audio_features
+               ON audio_features.track_id = tracks.id
+            WHERE audio_features.track_id IS NULL
+        """
+        return self._con.execute(cmd).fetchone()[0]
+
+    def iter_tracks_without_features(self, batch_size=100):
+        """
+        Yield lists of up to `batch_size` ids of tracks without a row in the audio features
+        table. Batches are read with keyset pagination on the rowid, so each batch is one index
+        range scan and tracks that are still missing features after their batch, such as when a
+        request fails, are not returned again.
+        """
+        cmd = """
+           SELECT tracks.rowid,
+                  tracks.id
+             FROM tracks
+        LEFT JOIN audio_features
+               ON audio_features.track_id = tracks.id
+            WHERE audio_features.track_id IS NULL
+              AND tracks.rowid > ?
+         ORDER BY tracks.rowid
+            LIMIT ?
+        """
+        after = 0
+        while rows := self._con.execute(cmd, (after, batch_size)).fetchall():
+            yield [id_ for _, id_ in rows]
+            after = rows[-1][0]
+
+    def count_artists_to_refresh(self, before):
+        """
+        Returns the number of artists without metadata or with metadata fetched before the
+        `before` Unix timestamp.
+        """
+        cmd = """
+           SELECT COUNT()
+             FROM artists
+        LEFT JOIN artist_metadata
+               ON artist_metadata.artist_id = artists.id
+            WHERE IFNULL(artist_metadata.time_fetched, 0) < ?
+        """
+        return self._con.execute(cmd, (before,)).fetchone()[0]
+
+    def iter_artists_to_refresh(self, before, batch_size=50):
+        """
+        Yield lists of up to `batch_size` ids of artists without metadata or with metadata
+        fetched before the `before` Unix timestamp. Batches are read with keyset pagination on
+        the rowid like `iter_tracks_without_features`.
+        """
+        cmd = """
+           SELECT artists.rowid,
+                  artists.id
+             FROM artists
+        LEFT JOIN artist_metadata
+               ON artist_metadata.artist_id = artists.id
+            WHERE IFNULL(artist_metadata.time_fetched, 0) < ?
+              AND artists.rowid > ?
+         ORDER BY artists.rowid
+            LIMIT ?
+        """
+        after = 0
+        while rows := self._con.execute(cmd, (before, after, batch_size)).fetchall():
+            yield [id_ for _, id_ in rows]
+            after = rows[-1][0]
+
+    def get_artist_metadata(self, artist_id):
+        """
+        Returns a dictionary of the name, genres, popularity, and followers of an artist, or
+        None if the artist has no metadata.
+        """
+        cmd = """
+        SELECT name,
+               genres,
+               popularity,
+               followers
+          FROM artist_metadata
+         WHERE artist_id = ?
+        """
+        row = self._con.execute(cmd, (self._id_encoder()(artist_id),)).fetchone()
+        if row is None:
+            return None
+        name, genres, popularity, followers = row
+        return {
+            "name": name,
+            "genres": None if genres is None else json.loads(genres),
+            "popularity": popularity,
+            "followers": followers,
+        }
+
+    def get_column_types(self, table):
+        """
+        Returns a dictionary of column names to a tuple of the declared type and whether NULL
+        values are allowed, in table order.
+        """
+        rows = self._con.execute(f"PRAGMA table_info({table})").fetchall()
+        if not rows:
+            raise ValueError(f"Table {repr(table)} does not exist")
+        return {row[1]: (row[2].lower(), not row[3] and not row[5]) for row in rows}
+
+    def load_arrays(self, table, columns=None, chunk_size=10000):
+        """
+        Load columns of a table into NumPy arrays without creating item objects. Returns a tuple
+        of two dictionaries keyed by column name. The first holds one array per column. The second
+        holds the dictionary for each text column, whose array holds int32 codes into it, with -1
+        for NULL. Integer columns that allow NULL are loaded as float64 with NaN for NULL.
+        """
+        np = import_optional("numpy", "Loading arrays")
+
+        types = self.get_column_types(table)
+        if columns is None:
+            columns = list(types)
+        for column in columns:
+            if column not in types:
+                raise ValueError(f"Table {repr(table)} has no column {repr(column)}")
+
+        # Preallocate the arrays from the row count, so chunks are copied in place.
+        num_rows = self.count_rows(table)
+        arrays = {}
+        lookups = {}
+        for column in columns:
+            datatype, nullable = types[column]
+            if datatype.startswith("int") and not nullable:
+                dtype = np.int64
+            elif datatype.startswith("int") or datatype.startswith("real"):
+                dtype = np.float64
+            else:
+                dtype = np.int32
+                lookups[column] = {None: -1}
+            arrays[column] = np.empty(num_rows, dtype=dtype)
+
+        cmd = f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid"
+        cur = self._con.cursor()
+        offset = 0
+        try:
+            cur.execute(cmd)
+            while offset < num_rows and (rows := cur.fetchmany(chunk_size)):
+                rows = rows[: num_rows - offset]
+                end = offset + len(rows)
+                for column, values in zip(columns, zip(*rows)):
+                    if column in lookups:
+                        # Dictionary encode the text values. New values get the next code.
+                        lookup = lookups[column]
+                        values = [lookup.setdefault(v, len(lookup) - 1) for v in values]
+                    arrays[column][offset:end] = values
+                offset = end
+        finally:
+            cur.close()
+
+        # Trim the arrays in case rows were deleted after counting.
+        arrays = {column: array[:offset] for column, array in arrays.items()}
+
+        dictionaries = {}
+        for column, lookup in lookups.items():
+            del lookup[None]
+            dictionaries[column] = np.array(list(lookup), dtype=object)
+
+        return arrays, dictionaries
+
+    def count_audio_features(self, columns=None, until=None):
+        """
+        Returns the number of rows in the audio features table with values for all of the given
+        feature columns, optionally only counting rows with a rowid up to `until`.
+        """
+        cmd = f"""
+        SELECT COUNT()
+          FROM audio_features
+         WHERE {self._features_present(columns)}
+           AND (? IS NULL OR rowid <= ?)
+        """
+        return self._con.execute(cmd, (until, until)).fetchone()[0]
+
+    def get_audio_feature_track_ids(self, rowids):
+        """
+        Returns a dictionary of the given rowids of the audio features table to the id of the
+        track in that row, for the rowids that exist.
+        """
+        rowids = list(rowids)
+        placeholders = ", ".join("?" for _ in rowids)
+        cmd = f"""
+        SELECT rowid,
+               track_id
+          FROM audio_features
+         WHERE rowid IN ({placeholders})
+        """
+        return dict(self._con.execute(cmd, rowids).fetchall())
+
+    def load_audio_features(self, columns=None, after=0, chunk_size=10000):
+        """
+        Load the audio features of tracks with values for all of the given feature columns into
+        NumPy arrays in rowid order. Only rows with a rowid above `after` are loaded, so a copy
+        loaded earlier can be extended with new rows. Returns a tuple of the int64 rowids, the
+        track ids, and a float64 matrix with one column per feature.
+        """
+        np = import_optional("numpy", "Loading audio features")
+
+        columns = AUDIO_FEATURES if columns is None else columns
+        cmd = f"""
+          SELECT rowid,
+                 track_id,
+                 {', '.join(columns)}
+            FROM audio_features
+           WHERE {self._features_present(columns)}
+             AND rowid > ?
+        ORDER BY rowid
+        """
+        rowids = []
+        ids = []
+        chunks = []
+        cur = self._con.cursor()
+        try:
+            cur.execute(cmd, (after,))
+            while rows := cur.fetchmany(chunk_size):
+                rowids.extend(row[0] for row in rows)
+                ids.extend(row[1] for row in rows)
+                chunks.append(np.array([row[2:] for row in rows], dtype=np.float64))
+        finally:
+            cur.close()
+
+        features = np.concatenate(chunks) if chunks else np.empty((0, len(columns)))
+        return np.array(rowids, dtype=np.int64), np.array(ids, dtype=str), features
+
+    def _features_present(self, columns=None):
+        """
+        Returns a condition on the audio features table that the given feature columns all have
+        values. Unknown columns are rejected, since they are formatted into the command.
+        """
+        columns = AUDIO_FEATURES if columns is None else columns
+        for column in columns:
+            if column not in AUDIO_FEATURES:
+                raise ValueError(f"Unknown audio feature {repr(column)}")
+        return " AND ".join(f"{column} IS NOT NULL" for column in columns)
+
+    def get_feature_ratings(self):
+        """
+        Returns a list of tuples of the audio features rowid and rating of each rated track.
+        """
+        cmd = """
+        SELECT audio_features.rowid,
+               tracks.rating
+          FROM tracks
+          JOIN audio_features
+            ON audio_features.track_id = tracks.id
+         WHERE tracks.rating IS NOT NULL
+        """
+        return self._con.execute(cmd).fetchall()
+
+    def load_arrow(self, table, columns=None, chunk_size=10000):
+        """
+        Load columns of a table into an Arrow table through `load_arrays`. Text columns become
+        dictionary arrays and NULL values become Arrow nulls. Numeric arrays without NULL values
+        are wrapped without copying.
+        """
+        np = import_optional("numpy", "Loading Arrow tables")
+        pa = import_optional("pyarrow", "Loading Arrow tables")
+
+        arrays, dictionaries = self.load_arrays(table, columns, chunk_size=chunk_size)
+        types = self.get_column_types(table)
+
+        data = {}
+        for column, array in arrays.items():
+            datatype = types[column][0]
+            if column in dictionaries:
+                indices = pa.array(array, mask=array < 0)
+                dictionary = pa.array(dictionaries[column], type=pa.string())
+                data[column] = pa.DictionaryArray.from_arrays(indices, dictionary)
+            elif datatype.startswith("int") and array.dtype == np.float64:
+                # Restore integers from the NaN placeholders used for NULL.
+                mask = np.isnan(array)
+                data[column] = pa.array(
+                    np.nan_to_num(array).astype(np.int64), mask=mask
+                )
+            elif array.dtype == np.float64:
+                data[column] = pa.array(array, mask=np.isnan(array))
+            else:
+                data[column] = pa.array(array)
+
+        return pa.table(data)
+
+    def resolve_artist_ids(self, artist):
+        """
+        Returns a list of artist ids matching the given artist id or name. The input is returned
+        as the only id if no artist matches, so albums of artists missing from the artists table
+        can still be selected by id.
+        """
+        cmd = """
+        SELECT id
+          FROM artists
+         WHERE id = :id
+            OR name = :name
+        """
+        params = {"id": self._id_encoder()(artist), "name": artist}
+        rows = self._con.execute(cmd, params).fetchall()
+        artist_ids = [row[0] for row in rows]
+        return artist_ids or [artist]
+
+    def query_tracks(self, artist=None, rating=None, rated=None):
+        """
+        Yield Track objects in the order they were added, optionally filtered by artist id or
+        name and by rating. The rating selects tracks with exactly that rating, while `rated`
+        selects either all rated or all unrated tracks. Rows are streamed from the database
+        rather than loaded into a list.
+        """
+        conditions = []
+        params = []
+
+        if artist is not None:
+            # Select the tracks of the artist through the albums table. The indexes on
+            # `albums.artist_id` and `tracks.album_id` keep this from scanning either table.
+            artist_ids = self.resolve_artist_ids(artist)
+            placeholders = ", ".join("?" for _ in artist_ids)
+            conditions.append(
+                f"album_id IN (SELECT id FROM albums WHERE artist_id IN ({placeholders}))"
+            )
+            params.extend(map(self._id_encoder(), artist_ids))
+
+        if rating is not None:
+            conditions.append("rating = ?")
+            params.append(rating)
+
+        if rated is True:
+            conditions.append("rating IS NOT NULL")
+        elif rated is False:
+            conditions.append("rating IS NULL")
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Order by rowid explicitly, since an index chosen for the filters would otherwise set
+        # the order.
+        cmd = f"""
+          SELECT id,
+                 name,
+                 album_id,
+                 rating
+            FROM tracks
+          {where}
+        ORDER BY tracks.rowid
+        """
+        for id_, name, album_id, rating_ in self._con.execute(cmd, params):
+            yield Track(id_, name, album_id, rating=rating_)
+
+    def query_albums(self, artist=None):
+        """
+        Yield tuples of an Album object and a RatingSummary of its tracks, optionally filtered
+        by artist id or name. The counts are read from the album rating summaries.
+        """
+        if artist is not None:
+            artist_ids = self.resolve_artist_ids(artist)
+            placeholders = ", ".join("?" for _ in artist_ids)
+            where = f"WHERE albums.artist_id IN ({placeholders})"
+            params = list(map(self._id_encoder(), artist_ids))
+        else:
+            where = ""
+            params = []
+
+        cmd = f"""
+           SELECT albums.id,
+                  albums.name,
+                  albums.artist_id,
+                  albums.time_fetched,
+                  IFNULL(album_ratings.num_tracks, 0),
+                  IFNULL(album_ratings.num_liked, 0),
+                  IFNULL(album_ratings.num_neutral, 0),
+                  IFNULL(album_ratings.num_disliked, 0)
+             FROM albums
+        LEFT JOIN album_ratings
+               ON album_ratings.album_id = albums.id
+           {where}
+        """
+        for row in self._con.execute(cmd, params):
+            id_, name, artist_id, time_fetched, *counts = row
+            album = Album(id_, name, artist_id, time_fetched=time_fetched)
+            yield album, RatingSummary(*counts)
+
+    def query_artists(self, top_rated=False, limit=None):
+        """
+        Yield tuples of an Artist object and a RatingSummary of its tracks. When `top_rated` is
+        set, only artists with rated tracks are returned, ordered by the number of liked minus
+        disliked tracks and then by the number of liked tracks. The counts are read from the
+        artist rating summaries, so ranking walks an index instead of aggregating all tracks.
+        """
+        if top_rated:
+            cmd = """
+              SELECT artists.id,
+                     artists.name,
+                     artists.time_fetched,
+                     artist_ratings.num_tracks,
+                     artist_ratings.num_liked,
+                     artist_ratings.num_neutral,
+                     artist_ratings.num_disliked
+                FROM artist_ratings
+                JOIN artists
+                  ON artists.id = artist_ratings.artist_id
+               WHERE artist_ratings.num_rated > 0
+            ORDER BY artist_ratings.score DESC,
+                     artist_ratings.num_liked DESC
+            """
+        else:
+            cmd = """
+               SELECT artists.id,
+                      artists.name,
+                      artists.time_fetched,
+                      IFNULL(artist_ratings.num_tracks, 0),
+                      IFNULL(artist_ratings.num_liked, 0),
+                      IFNULL(artist_ratings.num_neutral, 0),
+                      IFNULL(artist_ratings.num_disliked, 0)
+                 FROM artists
+            LEFT JOIN artist_ratings
+                   ON artist_ratings.artist_id = artists.id
+            """
+
+        params = []
+        if limit is not None:
+            cmd += "LIMIT ?"
+            params.append(limit)
+
+        for row in self._con.execute(cmd, params):
+            id_, name, time_fetched, *counts = row
+            artist = Artist(id_, name, time_fetched=time_fetched)
+            yield artist, RatingSummary(*counts)
+
+    def query_runs(self, command=None, limit=None):
+        """
+        Yield Run objects from the runs table from newest to oldest, optionally only for one
+        command.
+        """
+        columns = ", ".join(HISTORY_SCHEMA["runs"])
+        cmd = f"""
+        SELECT {columns}
+          FROM runs
+        """
+        params = []
+        if command is not None:
+            cmd += "WHERE command = ?\n"
+            params.append(command)
+        cmd += "ORDER BY id DESC\n"
+        if limit is not None:
+            cmd += "LIMIT ?"
+            params.append(limit)
+
+        for row in self._con.execute(cmd, params):
+            yield Run(*row)
+
+    def query_run_trends(self, command=None):
+        """
+        Yield tuples summarizing the finished runs of each week and command, from newest to
+        oldest. Each tuple has the week as `YYYY-WW`, the command, the number of runs, the
+        summed duration in seconds, and the summed counts in the order of `RUN_COUNTS`.
+        """
+        sums = ",\n                 ".join(f"SUM({name})" for name in RUN_COUNTS)
+        cmd = f"""
+          SELECT strftime('%Y-%W', time_started, 'unixepoch') AS week,
+                 command,
+                 COUNT(),
+                 SUM(time_finished - time_started),
+                 {sums}
+            FROM runs
+           WHERE time_finished IS NOT NULL
+             AND (? IS NULL OR command = ?)
+        GROUP BY week, command
+        ORDER BY week DESC, command
+        """
+        yield from self._con.execute(cmd, (command, command))
+
+    def get_tracks_by_id(self, ids):
+        """
+        Returns a dictionary of track ids to a tuple of the Track object and the Album and
+        Artist objects it belongs to, for the given ids found in the database. The album or
+        artist is None when it is not in the database. The ids are looked up in chunks, so any
+        number of ids can be given.
+        """
+        ids = list(map(self._id_encoder(), ids))
+        results = {}
+        for start in range(0, len(ids), MAX_VARIABLES):
+            chunk = ids[start : start + MAX_VARIABLES]
+            placeholders = ", ".join("?" for _ in chunk)
+            cmd = f"""
+               SELECT tracks.id,
+                      tracks.name,
+                      tracks.album_id,
+                      tracks.rating,
+                      albums.id,
+                      albums.name,
+                      albums.artist_id,
+                      albums.time_fetched,
+                      artists.id,
+                      artists.name,
+                      artists.time_fetched
+                 FROM tracks
+            LEFT JOIN albums
+                   ON albums.id = tracks.album_id
+            LEFT JOIN artists
+                   ON artists.id = albums.artist_id
+                WHERE tracks.id IN ({placeholders})
+            """
+            for row in self._con.execute(cmd, chunk):
+                track = Track(row[0], row[1], row[2], rating=row[3])
+
+                album = None
+                if row[4] is not None:
+                    album = Album(row[4], row[5], row[6], time_fetched=row[7])
+
+                artist = None
+                if row[8] is not None:
+                    artist = Artist(row[8], row[9], time_fetched=row[10])
+
+                results[track.id] = (track, album, artist)
+        return results
+
+    def search(self, text, limit=20):
+        """
+        Yield the best matches for the given text from the names of all tracks, albums, and
+        artists, ordered by relevance. Each result is a tuple of the matching item and the Album
+        and Artist objects it belongs to. The album is None for album and artist matches, and the
+        artist is None for artist matches or when the related item is not in the database.
+        """
+        # Match each word of the text as a prefix. Quoting the words prevents any characters in
+        # the text from being interpreted as query syntax.
+        words = re.findall(r"\w+", text)
+        if not words:
+            return
+        query = " ".join(f'"{word}"*' for word in words)
+
+        # Rank and limit within the full-text index before joining the related items.
+        cmd = """
+           SELECT matches.kind,
+                  matches.item_id,
+                  matches.name,
+                  tracks.album_id,
+                  tracks.rating,
+                  albums.id,
+                  albums.name,
+                  albums.artist_id,
+                  albums.time_fetched,
+                  artists.id,
+                  artists.name,
+                  artists.time_fetched
+             FROM (  SELECT kind,
+                            item_id,
+                            name,
+                            rank
+                       FROM search_index
+                      WHERE search_index MATCH ?
+                   ORDER BY rank
+                      LIMIT ?) AS matches
+        LEFT JOIN tracks
+               ON matches.kind = 'track'
+              AND tracks.id = matches.item_id
+        LEFT JOIN albums
+               ON albums.id = CASE matches.kind
+                                   WHEN 'track' THEN tracks.album_id
+                                   WHEN 'album' THEN matches.item_id
+                              END
+        LEFT JOIN artists
+               ON artists.id = CASE matches.kind
+                                    WHEN 'artist' THEN matches.item_id
+                                    ELSE albums.artist_id
+                               END
+         ORDER BY matches.rank
+        """
+        for row in self._con.execute(cmd, (query, limit)):
+            kind, id_, name, album_id, rating = row[:5]
+            # Ids read through the full-text index have no declared type to decode them by.
+            id_ = decode_id(id_)
+
+            album = None
+            if row[5] is not None:
+                album = Album(row[5], row[6], row[7], time_fetched=row[8])
+
+            artist = None
+            if row[9] is not None:
+                artist = Artist(row[9], row[10], time_fetched=row[11])
+
+            if kind == "track":
+                yield Track(id_, name, album_id, rating=rating), album, artist
+            elif kind == "album":
+                yield album, None, artist
+            else:
+                yield artist, None, None
+
     def create_table_from_schema(self, name, schema):
         """
-        Create a table from the given schema. This assumes the table does not exist.
+        Create a table from the given schema, with any id columns in the id format of the
+        database. This assumes the table does not exist.
         """
+        schema = id_schema(name, schema, self.id_format)
+
         # Get the parameters from the schema.
         parameters = [f"{column} {datatype}" for column, datatype in schema.items()]
 
@@ -292,9 +2533,9 @@ class Database:
         """
         self._execute(cmd)
 
-    def print_summary(self):
+    def get_summary(self):
         """
-        Print database summary information.
+        Returns a dictionary of the numbers of tracks by rating, albums, and artists.
         """
         cmd = """
         SELECT COUNT()
@@ -349,21 +2590,42 @@ class Database:
         """
         num_artists = self._con.execute(cmd).fetchone()[0]
 
+        return {
+            "num_tracks": num_tracks,
+            "num_rated_tracks": num_rated_tracks,
+            "num_liked_tracks": num_liked_tracks,
+            "num_neutral_tracks": num_neutral_tracks,
+            "num_disliked_tracks": num_disliked_tracks,
+            "num_unrated_tracks": num_unrated_tracks,
+            "num_albums": num_albums,
+            "num_artists": num_artists,
+        }
+
+    def print_summary(self):
+        """
+        Print database summary information.
+        """
+        counts = self.get_summary()
         summary = (
-            f"{num_tracks} tracks\n"
-            f"    {num_rated_tracks} rated\n"
-            f"        {num_liked_tracks} liked\n"
-            f"        {num_neutral_tracks} neutral\n"
-            f"        {num_disliked_tracks} disliked\n"
-            f"    {num_unrated_tracks} unrated\n"
-            f"{num_albums} albums\n"
-            f"{num_artists} artists\n"
+            f"{counts['num_tracks']} tracks\n"
+            f"    {counts['num_rated_tracks']} rated\n"
+            f"        {counts['num_liked_tracks']} liked\n"
+            f"        {counts['num_neutral_tracks']} neutral\n"
+            f"        {counts['num_disliked_tracks']} disliked\n"
+            f"    {counts['num_unrated_tracks']} unrated\n"
+            f"{counts['num_albums']} albums\n"
+            f"{counts['num_artists']} artists\n"
         )
         print(summary, end="")
 
         # Check accuracy by summing up each value.
-        assert num_tracks == num_rated_tracks + num_unrated_tracks
         assert (
-            num_rated_tracks
-            == num_liked_tracks + num_neutral_tracks + num_disliked_tracks
+            counts["num_tracks"]
+            == counts["num_rated_tracks"] + counts["num_unrated_tracks"]
+        )
+        assert (
+            counts["num_rated_tracks"]
+            == counts["num_liked_tracks"]
+            + counts["num_neutral_tracks"]
+            + counts["num_disliked_tracks"]
         )
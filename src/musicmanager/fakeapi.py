@@ -0,0 +1,780 @@
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from musicmanager.item import Album, Artist, Track
+from musicmanager.synthetic import SyntheticLibrary
+from musicmanager.transfer import read_jsonl
+
+# Largest page size accepted by the paginated endpoints, matching the Spotify Web API.
+MAX_LIMIT = 50
+
+# Largest number of ids accepted by the batch endpoints, matching the Spotify Web API.
+MAX_IDS = 100
+
+# Largest number of ids accepted by the several artists endpoint, matching the Spotify Web API.
+MAX_ARTIST_IDS = 50
+
+# Genres given to generated artists.
+GENRES = [
+    "deathcore",
+    "metalcore",
+    "djent",
+    "progressive metal",
+    "hardcore",
+    "nu metal",
+]
+
+
+class SyntheticCatalog:
+    """
+    Catalog served from a SyntheticLibrary. Playlists are consecutive runs of tracks named
+    `playlist0`, `playlist1`, and so on, each with `playlist_size` tracks.
+    """
+
+    def __init__(self, library, playlist_size=100):
+        self.library = library
+        self.playlist_size = playlist_size
+
+        # Map ids back to indexes, since ids are one-way hashes.
+        self._artist_indexes = {
+            library.artist_id(index): index for index in range(library.num_artists)
+        }
+        self._album_indexes = {
+            library.album_id(index): index for index in range(library.num_albums)
+        }
+
+        # Map track ids back to indexes on first use, since only playlist writes need it.
+        self._track_indexes = None
+
+    def playlist_tracks(self, playlist_id):
+        """
+        Returns the range of track keys in a playlist, or None if it does not exist.
+        """
+        match = re.fullmatch(r"playlist(\d+)", playlist_id)
+        if match is None:
+            return None
+        start = int(match.group(1)) * self.playlist_size
+        if start >= self.library.num_tracks:
+            return None
+        return range(start, min(start + self.playlist_size, self.library.num_tracks))
+
+    def artist_albums(self, artist_id):
+        """
+        Returns a sequence of album keys of an artist, or None if it does not exist.
+        """
+        index = self._artist_indexes.get(artist_id)
+        if index is None:
+            return None
+        return self.library.album_indexes(index)
+
+    def artist(self, artist_id):
+        """
+        Returns the Artist object for an artist id, or None if it does not exist.
+        """
+        index = self._artist_indexes.get(artist_id)
+        if index is None:
+            return None
+        return self.library.artist(index)
+
+    def related_artists(self, artist_id):
+        """
+        Returns a list of Artist objects related to an artist, or None if it does not exist.
+        """
+        index = self._artist_indexes.get(artist_id)
+        if index is None:
+            return None
+        indexes = self.library.related_artist_indexes(index)
+        return [self.library.artist(i) for i in indexes]
+
+    def album_tracks(self, album_id):
+        """
+        Returns a sequence of track keys of an album, or None if it does not exist.
+        """
+        index = self._album_indexes.get(album_id)
+        if index is None:
+            return None
+        return self.library.track_indexes(index)
+
+    def album_key(self, album_id):
+        """
+        Returns the key of an album by id, or None if it does not exist.
+        """
+        return self._album_indexes.get(album_id)
+
+    def track_key(self, track_id):
+        """
+        Returns the key of a track by id, or None if it does not exist.
+        """
+        if self._track_indexes is None:
+            self._track_indexes = {
+                self.library.track_id(index): index
+                for index in range(self.library.num_tracks)
+            }
+        return self._track_indexes.get(track_id)
+
+    def track(self, key):
+        """
+        Returns a tuple of the Track, Album, and Artist objects for a track key.
+        """
+        track = self.library.track(key)
+        album = self.album(key // self.library.tracks_per_album)
+        return track, album, self.artist_of(album)
+
+    def album(self, key):
+        """
+        Returns the Album object for an album key.
+        """
+        return self.library.album(key)
+
+    def artist_of(self, album):
+        """
+        Returns the Artist object of an album.
+        """
+        index = self._artist_indexes[album.artist_id]
+        return self.library.artist(index)
+
+
+class RecordedCatalog:
+    """
+    Catalog served from a library exported in the JSON Lines format. There are two playlists:
+    `library` with every track and `liked` with every liked track.
+    """
+
+    def __init__(self, directory):
+        directory = Path(directory)
+
+        def read(table):
+            path = directory / f"{table}.jsonl"
+            return [row for rows in read_jsonl(path, table, 10000) for row in rows]
+
+        self._artists = {}
+        for id_, name, _ in read("artists"):
+            self._artists[id_] = Artist(id_, name)
+
+        self._albums = {}
+        self._artist_albums = {}
+        for id_, name, artist_id, _ in read("albums"):
+            self._albums[id_] = Album(id_, name, artist_id)
+            self._artist_albums.setdefault(artist_id, []).append(id_)
+
+        self._tracks = {}
+        self._album_tracks = {}
+        self._playlists = {"library": [], "liked": []}
+        for id_, name, album_id, rating in read("tracks"):
+            self._tracks[id_] = Track(id_, name, album_id)
+            self._album_tracks.setdefault(album_id, []).append(id_)
+            self._playlists["library"].append(id_)
+            if rating is not None and rating > 0:
+                self._playlists["liked"].append(id_)
+
+    def playlist_tracks(self, playlist_id):
+        """
+        Returns a list of track ids in a playlist, or None if it does not exist.
+        """
+        return self._playlists.get(playlist_id)
+
+    def artist_albums(self, artist_id):
+        """
+        Returns a list of album ids of an artist, or None if it does not exist.
+        """
+        if artist_id not in self._artists:
+            return None
+        return self._artist_albums.get(artist_id, [])
+
+    def artist(self, artist_id):
+        """
+        Returns the Artist object for an artist id, or None if it does not exist.
+        """
+        return self._artists.get(artist_id)
+
+    def related_artists(self, artist_id):
+        """
+        Returns a list of Artist objects related to an artist, or None if it does not exist.
+        Exports have no relations, so artists are related to none.
+        """
+        if artist_id not in self._artists:
+            return None
+        return []
+
+    def album_tracks(self, album_id):
+        """
+        Returns a list of track ids of an album, or None if it does not exist.
+        """
+        if album_id not in self._albums:
+            return None
+        return self._album_tracks.get(album_id, [])
+
+    def album_key(self, album_id):
+        """
+        Returns the key of an album by id, which is the id itself, or None if it does not exist.
+        """
+        return album_id if album_id in self._albums else None
+
+    def track_key(self, track_id):
+        """
+        Returns the key of a track by id, which is the id itself, or None if it does not exist.
+        """
+        return track_id if track_id in self._tracks else None
+
+    def track(self, key):
+        """
+        Returns a tuple of the Track, Album, and Artist objects for a track id. Albums and
+        artists missing from the export are filled in with placeholder names.
+        """
+        track = self._tracks[key]
+        album = self.album(track.album_id)
+        return track, album, self.artist_of(album)
+
+    def album(self, key):
+        """
+        Returns the Album object for an album id.
+        """
+        return self._albums.get(key) or Album(key, "Unknown", "unknown")
+
+    def artist_of(self, album):
+        """
+        Returns the Artist object of an album.
+        """
+        return self._artists.get(album.artist_id) or Artist(album.artist_id, "Unknown")
+
+
+def artist_json(artist):
+    """
+    Returns the simplified artist object for an Artist.
+    """
+    return {"id": artist.id, "name": artist.name, "type": "artist"}
+
+
+def full_artist_json(artist):
+    """
+    Returns the full artist object for an Artist. The genres, popularity, and followers are
+    generated from the artist id, so they are the same on every request.
+    """
+    rng = random.Random(artist.id)
+    return {
+        **artist_json(artist),
+        "genres": rng.sample(GENRES, rng.randrange(1, 3)),
+        "popularity": rng.randrange(101),
+        "followers": {"href": None, "total": rng.randrange(1_000_000)},
+    }
+
+
+def album_json(album, artist):
+    """
+    Returns the simplified album object for an Album and its Artist.
+    """
+    return {
+        "id": album.id,
+        "name": album.name,
+        "type": "album",
+        "artists": [artist_json(artist)],
+    }
+
+
+def track_json(track):
+    """
+    Returns the simplified track object for a Track.
+    """
+    return {"id": track.id, "name": track.name, "type": "track"}
+
+
+def audio_features_json(track_id):
+    """
+    Returns the audio features object for a track. The features are generated from the track
+    id, so they are the same on every request.
+    """
+    rng = random.Random(track_id)
+    return {
+        "id": track_id,
+        "type": "audio_features",
+        "danceability": round(rng.random(), 3),
+        "energy": round(rng.random(), 3),
+        "key": rng.randrange(12),
+        "loudness": round(rng.uniform(-30, 0), 3),
+        "mode": rng.randrange(2),
+        "speechiness": round(rng.random() / 2, 3),
+        "acousticness": round(rng.random(), 3),
+        "instrumentalness": round(rng.random(), 3),
+        "liveness": round(rng.random(), 3),
+        "valence": round(rng.random(), 3),
+        "tempo": round(rng.uniform(60, 200), 3),
+        "duration_ms": rng.randrange(60000, 420000),
+        "time_signature": rng.choice([3, 4, 4, 4, 5]),
+    }
+
+
+class FakeSpotifyServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Spotify Web API that serves a catalog over HTTP. Every request waits
+    for the configured latency plus uniform jitter. A fraction of requests given by
+    `throttle_rate` is rejected with status 429 and a `Retry-After` header. Playlists of the
+    catalog can be edited, and edited playlists are kept in memory for the life of the server.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        catalog,
+        latency=0.0,
+        jitter=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        seed=None,
+    ):
+        super().__init__(address, FakeSpotifyHandler)
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # Track keys of edited playlists by id, and a counter for their snapshot ids.
+        self.playlists = {}
+        self._num_snapshots = 0
+
+        # Counters for inspecting a run.
+        self.num_requests = 0
+        self.num_throttled = 0
+
+    @property
+    def api_url(self):
+        """
+        Returns the base URL to pass to the Spotify interface.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_delay_and_throttle(self):
+        """
+        Returns the delay for the next request and whether it should be throttled.
+        """
+        with self._lock:
+            self.num_requests += 1
+            jitter = self._random.uniform(-self.jitter, self.jitter)
+            throttle = self._random.random() < self.throttle_rate
+            if throttle:
+                self.num_throttled += 1
+        return max(0.0, self.latency + jitter), throttle
+
+    def playlist_tracks(self, playlist_id):
+        """
+        Returns a sequence of track keys in a playlist, or None if it does not exist.
+        """
+        with self._lock:
+            if playlist_id in self.playlists:
+                return list(self.playlists[playlist_id])
+        return self.catalog.playlist_tracks(playlist_id)
+
+    def edit_playlist(self, playlist_id, edit):
+        """
+        Apply a function to the list of track keys in a playlist, which it changes in place.
+        Returns the new snapshot id, or None if the playlist does not exist.
+        """
+        with self._lock:
+            keys = self.playlists.get(playlist_id)
+            if keys is None:
+                keys = self.catalog.playlist_tracks(playlist_id)
+                if keys is None:
+                    return None
+                keys = list(keys)
+            edit(keys)
+            self.playlists[playlist_id] = keys
+            self._num_snapshots += 1
+            return f"snapshot{self._num_snapshots}"
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for FakeSpotifyServer.
+    """
+
+    # Keep connections open between requests like the real API.
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        (re.compile(r"/v1/playlists/([^/]+)/tracks"), "playlist_tracks"),
+        (re.compile(r"/v1/artists"), "artists"),
+        (re.compile(r"/v1/artists/([^/]+)/albums"), "artist_albums"),
+        (re.compile(r"/v1/artists/([^/]+)/related-artists"), "related_artists"),
+        (re.compile(r"/v1/albums/([^/]+)/tracks"), "album_tracks"),
+        (re.compile(r"/v1/albums/([^/]+)"), "album"),
+        (re.compile(r"/v1/audio-features"), "audio_features"),
+    ]
+
+    def log_message(self, format, *args):
+        """
+        Log requests at the debug level instead of writing every request to stderr.
+        """
+        logging.debug(f"Fake API: {format % args}")
+
+    def send_json(self, status, data, headers=None):
+        """
+        Send a JSON response with optional extra headers.
+        """
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        """
+        Send an error object like the ones returned by the Spotify Web API.
+        """
+        self.send_json(
+            status, {"error": {"status": status, "message": message}}, headers
+        )
+
+    # Routes of the requests that write data, which are dispatched by method.
+    WRITE_ROUTES = [
+        (re.compile(r"/v1/playlists/([^/]+)/tracks"), "playlist_tracks"),
+    ]
+
+    def do_GET(self):
+        """
+        Dispatch a request that reads data.
+        """
+        self.dispatch("get", self.ROUTES)
+
+    def do_POST(self):
+        """
+        Dispatch a request that adds data.
+        """
+        self.dispatch("post", self.WRITE_ROUTES)
+
+    def do_DELETE(self):
+        """
+        Dispatch a request that removes data.
+        """
+        self.dispatch("delete", self.WRITE_ROUTES)
+
+    def dispatch(self, method, routes):
+        """
+        Simulate latency and throttling, then dispatch the request to its endpoint. Requests
+        other than GET requests are passed their JSON body.
+        """
+        # Read the body first, so the connection can be reused after an error.
+        body = None
+        if method != "get":
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"null")
+            except ValueError:
+                body = None
+
+        delay, throttle = self.server.next_delay_and_throttle()
+        time.sleep(delay)
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send_error_json(401, "No token provided")
+            return
+
+        if throttle:
+            headers = {"Retry-After": str(self.server.retry_after)}
+            self.send_error_json(429, "API rate limit exceeded", headers)
+            return
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        for pattern, name in routes:
+            match = pattern.fullmatch(url.path)
+            if match is not None:
+                args = (query,) if method == "get" else (query, body)
+                getattr(self, f"{method}_{name}")(*match.groups(), *args)
+                return
+
+        self.send_error_json(404, "Service not found")
+
+    def page(self, keys, query, to_json):
+        """
+        Send a page of items selected by the `offset` and `limit` parameters.
+        """
+        try:
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 20))
+        except ValueError:
+            self.send_error_json(400, "Invalid offset or limit")
+            return
+        if offset < 0 or not 0 < limit <= MAX_LIMIT:
+            self.send_error_json(400, "Invalid offset or limit")
+            return
+
+        items = [to_json(key) for key in keys[offset : offset + limit]]
+        path = urlparse(self.path).path
+        self.send_json(200, self.page_json(path, items, len(keys), offset, limit))
+
+    def page_json(self, path, items, total, offset, limit):
+        """
+        Returns a paging object like the ones returned by the Spotify Web API.
+        """
+        next_offset = offset + limit
+        if next_offset < total:
+            next_url = f"http://{self.headers.get('Host')}{path}?offset={next_offset}&limit={limit}"
+        else:
+            next_url = None
+        return {
+            "items": items,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next": next_url,
+        }
+
+    def get_playlist_tracks(self, playlist_id, query):
+        """
+        Send a page of playlist items, each with the track, its album, and the album artist.
+        """
+        keys = self.server.playlist_tracks(playlist_id)
+        if keys is None:
+            self.send_error_json(404, "Resource not found")
+            return
+
+        def to_json(key):
+            track, album, artist = self.server.catalog.track(key)
+            return {"track": {**track_json(track), "album": album_json(album, artist)}}
+
+        self.page(keys, query, to_json)
+
+    def track_keys(self, uris):
+        """
+        Returns a list of the track keys of Spotify track URIs, or None if there are more than
+        100 or any of them are unknown.
+        """
+        if not isinstance(uris, list) or not 0 < len(uris) <= MAX_IDS:
+            return None
+        keys = []
+        for uri in uris:
+            prefix, _, track_id = str(uri).rpartition(":")
+            key = self.server.catalog.track_key(track_id)
+            if prefix != "spotify:track" or key is None:
+                return None
+            keys.append(key)
+        return keys
+
+    def post_playlist_tracks(self, playlist_id, query, body):
+        """
+        Append up to 100 tracks given by the `uris` field of the body to a playlist.
+        """
+        keys = self.track_keys((body or {}).get("uris"))
+        if keys is None:
+            self.send_error_json(400, "Invalid track uris")
+            return
+
+        snapshot_id = self.server.edit_playlist(
+            playlist_id, lambda items: items.extend(keys)
+        )
+        if snapshot_id is None:
+            self.send_error_json(404, "Resource not found")
+            return
+        self.send_json(201, {"snapshot_id": snapshot_id})
+
+    def delete_playlist_tracks(self, playlist_id, query, body):
+        """
+        Remove every occurrence of up to 100 tracks given by the `tracks` field of the body
+        from a playlist.
+        """
+        tracks = (body or {}).get("tracks")
+        uris = None
+        if isinstance(tracks, list):
+            uris = [
+                track.get("uri") if isinstance(track, dict) else None
+                for track in tracks
+            ]
+        keys = self.track_keys(uris)
+        if keys is None:
+            self.send_error_json(400, "Invalid track uris")
+            return
+
+        def remove(items):
+            removed = set(keys)
+            items[:] = [key for key in items if key not in removed]
+
+        snapshot_id = self.server.edit_playlist(playlist_id, remove)
+        if snapshot_id is None:
+            self.send_error_json(404, "Resource not found")
+            return
+        self.send_json(200, {"snapshot_id": snapshot_id})
+
+    def get_artist_albums(self, artist_id, query):
+        """
+        Send a page of albums of an artist.
+        """
+        catalog = self.server.catalog
+        keys = catalog.artist_albums(artist_id)
+        if keys is None:
+            self.send_error_json(404, "Resource not found")
+            return
+
+        def to_json(key):
+            album = catalog.album(key)
+            return album_json(album, catalog.artist_of(album))
+
+        self.page(keys, query, to_json)
+
+    def get_artists(self, query):
+        """
+        Send the full artist objects of up to 50 artists given by the `ids` parameter. Unknown
+        ids are returned as null.
+        """
+        ids = [id_ for id_ in query.get("ids", "").split(",") if id_]
+        if not 0 < len(ids) <= MAX_ARTIST_IDS:
+            self.send_error_json(400, "Invalid ids")
+            return
+
+        artists = [self.server.catalog.artist(id_) for id_ in ids]
+        items = [
+            None if artist is None else full_artist_json(artist) for artist in artists
+        ]
+        self.send_json(200, {"artists": items})
+
+    def get_related_artists(self, artist_id, query):
+        """
+        Send the artists related to an artist, which are not paginated.
+        """
+        artists = self.server.catalog.related_artists(artist_id)
+        if artists is None:
+            self.send_error_json(404, "Resource not found")
+            return
+
+        self.send_json(200, {"artists": [artist_json(artist) for artist in artists]})
+
+    def get_album_tracks(self, album_id, query):
+        """
+        Send a page of tracks of an album.
+        """
+        catalog = self.server.catalog
+        keys = catalog.album_tracks(album_id)
+        if keys is None:
+            self.send_error_json(404, "Resource not found")
+            return
+
+        self.page(keys, query, lambda key: track_json(catalog.track(key)[0]))
+
+    def get_album(self, album_id, query):
+        """
+        Send an album object, which embeds the first page of its tracks.
+        """
+        catalog = self.server.catalog
+        key = catalog.album_key(album_id)
+        if key is None:
+            self.send_error_json(404, "Resource not found")
+            return
+
+        album = catalog.album(key)
+        keys = catalog.album_tracks(album_id)
+        tracks = [track_json(catalog.track(k)[0]) for k in keys[:MAX_LIMIT]]
+        path = f"/v1/albums/{album_id}/tracks"
+        data = {
+            **album_json(album, catalog.artist_of(album)),
+            "tracks": self.page_json(path, tracks, len(keys), 0, MAX_LIMIT),
+        }
+        self.send_json(200, data)
+
+    def get_audio_features(self, query):
+        """
+        Send the audio features of up to 100 tracks given by the `ids` parameter. Every id has
+        features, except ids starting with `nofeatures`, which are returned as null like tracks
+        that Spotify has not analyzed.
+        """
+        ids = [id_ for id_ in query.get("ids", "").split(",") if id_]
+        if not 0 < len(ids) <= MAX_IDS:
+            self.send_error_json(400, "Invalid ids")
+            return
+
+        items = [
+            None if id_.startswith("nofeatures") else audio_features_json(id_)
+            for id_ in ids
+        ]
+        self.send_json(200, {"audio_features": items})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Spotify Web API"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        help="Directory of a library exported as JSON Lines to serve instead of a generated one",
+    )
+    parser.add_argument(
+        "--tracks", type=int, default=10000, help="Number of tracks to generate"
+    )
+    parser.add_argument(
+        "--playlist-size",
+        type=int,
+        default=100,
+        help="Number of tracks in each generated playlist",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to wait per request"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Maximum seconds of uniform jitter added to the latency",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests to reject with status 429",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        default=1,
+        help="Seconds sent in the Retry-After header of throttled requests",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.catalog is not None:
+        catalog = RecordedCatalog(args.catalog)
+    else:
+        catalog = SyntheticCatalog(
+            SyntheticLibrary(args.tracks), playlist_size=args.playlist_size
+        )
+
+    server = FakeSpotifyServer(
+        (args.host, args.port),
+        catalog,
+        latency=args.latency,
+        jitter=args.jitter,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    logging.info(f"Serving the fake Spotify API at {server.api_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
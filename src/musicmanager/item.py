@@ -113,3 +113,94 @@ class Playlist:
         Add a single artist to the playlist.
         """
         self._artists[artist.id] = artist
+
+
+class RatingSummary:
+    """
+    Rating counts for a group of tracks, such as the tracks of an album or an artist.
+    """
+
+    def __init__(self, num_tracks=0, num_liked=0, num_neutral=0, num_disliked=0):
+        self.num_tracks = num_tracks
+        self.num_liked = num_liked
+        self.num_neutral = num_neutral
+        self.num_disliked = num_disliked
+
+    @property
+    def num_rated(self):
+        """
+        Returns the number of rated tracks.
+        """
+        return self.num_liked + self.num_neutral + self.num_disliked
+
+    @property
+    def num_unrated(self):
+        """
+        Returns the number of unrated tracks.
+        """
+        return self.num_tracks - self.num_rated
+
+    @property
+    def mean_rating(self):
+        """
+        Returns the mean rating of the rated tracks, or None if no tracks are rated.
+        """
+        if self.num_rated == 0:
+            return None
+        return (self.num_liked - self.num_disliked) / self.num_rated
+
+    def __repr__(self):
+        return f"RatingSummary({repr(self.num_tracks)}, {repr(self.num_liked)}, {repr(self.num_neutral)}, {repr(self.num_disliked)})"
+
+
+class Run:
+    """
+    Record of one command that sent requests to the Spotify API, with the counts of what it did.
+    """
+
+    def __init__(
+        self,
+        id_,
+        command,
+        time_started,
+        time_finished=None,
+        status="running",
+        num_requests=0,
+        num_bytes=0,
+        num_rate_limited=0,
+        num_items_fetched=0,
+        num_rows_inserted=0,
+        num_failures=0,
+    ):
+        self.id = id_
+        self.command = command
+        self.time_started = time_started
+        self.time_finished = time_finished
+        self.status = status
+        self.num_requests = num_requests
+        self.num_bytes = num_bytes
+        self.num_rate_limited = num_rate_limited
+        self.num_items_fetched = num_items_fetched
+        self.num_rows_inserted = num_rows_inserted
+        self.num_failures = num_failures
+
+    @property
+    def duration(self):
+        """
+        Returns the number of seconds the run took, or None if it has not finished.
+        """
+        if self.time_finished is None:
+            return None
+        return self.time_finished - self.time_started
+
+    @property
+    def items_per_second(self):
+        """
+        Returns the number of items fetched per second, or None if it has not finished.
+        """
+        if not self.duration:
+            return None
+        return self.num_items_fetched / self.duration
+
+    def __repr__(self):
+        return f"Run({repr(self.id)}, {repr(self.command)}, {repr(self.time_started)}, status={repr(self.status)})"
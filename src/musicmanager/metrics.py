@@ -0,0 +1,299 @@
+import bisect
+import threading
+
+# Default histogram bucket upper bounds in seconds.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labelnames, values, extra=None):
+    """
+    Returns the Prometheus label set for the given label names and values.
+    """
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    """
+    Returns a sample value in the Prometheus text format.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing value for each combination of label values.
+    """
+
+    type_ = "counter"
+
+    def __init__(self, name, help_, labelnames=()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the value for the given labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Returns the value for the given labels. Labels that are not given are summed over.
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return sum(
+            value
+            for key, value in items
+            if all(
+                str(labels[n]) == v for n, v in zip(self.labelnames, key) if n in labels
+            )
+        )
+
+    def samples(self):
+        """
+        Yield tuples of the sample name, label set, and value.
+        """
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets for each combination of label values.
+    """
+
+    type_ = "histogram"
+
+    def __init__(self, name, help_, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        """
+        Add an observation for the given labels.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        """
+        Returns the number of observations for the given labels. Labels that are not given are
+        summed over.
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return sum(
+            sum(counts)
+            for key, (counts, _) in items
+            if all(
+                str(labels[n]) == v for n, v in zip(self.labelnames, key) if n in labels
+            )
+        )
+
+    def samples(self):
+        """
+        Yield tuples of the sample name, label set, and value for the buckets, sum, and count.
+        """
+        with self._lock:
+            items = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            )
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = format_labels(
+                    self.labelnames, key, ("le", format_value(float(bound)))
+                )
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """
+    Collection of metrics that can be rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_, labelnames=()):
+        """
+        Returns the counter with the given name, creating it if needed.
+        """
+        return self._register(Counter(name, help_, labelnames))
+
+    def histogram(self, name, help_, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Returns the histogram with the given name, creating it if needed.
+        """
+        return self._register(Histogram(name, help_, labelnames, buckets))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write all metrics in the Prometheus text format to a file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve all metrics over HTTP from a background thread and return the server. Call
+        `shutdown` on the server to stop it.
+        """
+        # Import here, since the HTTP server is rarely used and slow to import.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+# Registry shared by the whole application.
+REGISTRY = Registry()
+
+# Metrics of requests to the Spotify API.
+REQUESTS = REGISTRY.counter(
+    "musicmanager_requests_total",
+    "Spotify API responses by endpoint and status",
+    ["endpoint", "status"],
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "musicmanager_request_duration_seconds",
+    "Latency of Spotify API requests by endpoint",
+    ["endpoint"],
+)
+RESPONSE_BYTES = REGISTRY.counter(
+    "musicmanager_response_bytes_total",
+    "Bytes of Spotify API response bodies by endpoint",
+    ["endpoint"],
+)
+RETRIES = REGISTRY.counter(
+    "musicmanager_request_retries_total",
+    "Spotify API requests retried after being rate limited by endpoint",
+    ["endpoint"],
+)
+ITEMS_FETCHED = REGISTRY.counter(
+    "musicmanager_items_fetched_total",
+    "Items parsed from Spotify API responses by kind",
+    ["kind"],
+)
+FAILURES = REGISTRY.counter(
+    "musicmanager_failures_total",
+    "Items that could not be fetched from the Spotify API by kind",
+    ["kind"],
+)
+
+# Metrics of database writes.
+ROWS_WRITTEN = REGISTRY.counter(
+    "musicmanager_rows_written_total",
+    "Rows inserted or updated by table",
+    ["table"],
+)
+ROWS_INSERTED = REGISTRY.counter(
+    "musicmanager_rows_inserted_total",
+    "New rows inserted by table",
+    ["table"],
+)
+ROWS_SKIPPED = REGISTRY.counter(
+    "musicmanager_rows_skipped_total",
+    "Rows skipped before insertion because their ids are known, by table",
+    ["table"],
+)
+TRANSACTIONS = REGISTRY.counter(
+    "musicmanager_transactions_total",
+    "Database transactions by result",
+    ["result"],
+)
+COMMIT_DURATION = REGISTRY.histogram(
+    "musicmanager_commit_duration_seconds",
+    "Duration of database commits",
+)
+
+# Metrics of the query server.
+QUERY_CACHE = REGISTRY.counter(
+    "musicmanager_query_cache_total",
+    "Query server cache lookups by result",
+    ["result"],
+)
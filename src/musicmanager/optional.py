@@ -0,0 +1,13 @@
+import importlib
+
+
+def import_optional(name, feature):
+    """
+    Import and return a module that is only needed for an optional feature. A RuntimeError
+    naming the feature is raised if the module is not installed.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as ex:
+        package = name.split(".")[0]
+        raise RuntimeError(f"{feature} requires the {repr(package)} package") from ex
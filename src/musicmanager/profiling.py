@@ -0,0 +1,155 @@
+import io
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Supported profiler modes.
+MODES = ("cprofile", "sampling")
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that periodically samples the call stack of one thread from a
+    background thread. Samples are counted by their collapsed stack, which is the format read by
+    flame graph tools.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = Counter()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start sampling in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the background thread to finish.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        """
+        Sample the stack of the profiled thread until stopped.
+        """
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            # Walk from the innermost frame outward, then reverse to get root first.
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def write_collapsed(self, path):
+        """
+        Write the samples as collapsed stacks with one stack and its count per line.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def summary(self, top=20):
+        """
+        Returns a summary of the functions with the most samples, both where the samples were
+        taken (self) and anywhere on the stack (total).
+        """
+        total = sum(self.stacks.values())
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            names = stack.split(";")
+            own[names[-1]] += count
+            for name in set(names):
+                inclusive[name] += count
+
+        lines = [f"{total} samples"]
+        for title, counter in [("self", own), ("total", inclusive)]:
+            lines.append(f"Top {top} functions by {title} samples:")
+            for name, count in counter.most_common(top):
+                lines.append(f"{count:>8} {100 * count / max(total, 1):6.1f}%  {name}")
+        return "\n".join(lines) + "\n"
+
+
+def memory_summary(snapshot, top=20):
+    """
+    Returns a summary of the allocation sites with the most memory in a tracemalloc snapshot.
+    """
+    statistics = snapshot.statistics("lineno")
+    lines = [f"Top {top} allocation sites:"]
+    for stat in statistics[:top]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  "
+            f"{frame.filename}:{frame.lineno}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def profile(func, path=None, mode="cprofile", memory=False, top=20, stream=None):
+    """
+    Call a function under a profiler and return its result. With a path, the cProfile mode
+    writes pstats data and the sampling mode writes collapsed stacks. A summary of the top
+    functions, and of the top allocation sites when `memory` is set, is written to the stream,
+    which defaults to stderr.
+    """
+    # Import here, since pstats is slow to import and most commands are not profiled.
+    import cProfile
+    import pstats
+
+    stream = stream if stream is not None else sys.stderr
+
+    if memory:
+        tracemalloc.start()
+
+    profiler = None
+    if path is not None and mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif path is not None and mode == "sampling":
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    start = time.perf_counter()
+    try:
+        return func()
+    finally:
+        elapsed = time.perf_counter() - start
+
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            profiler.dump_stats(path)
+            text = io.StringIO()
+            stats = pstats.Stats(profiler, stream=text)
+            stats.sort_stats("cumulative").print_stats(top)
+            stream.write(text.getvalue())
+        elif isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+            profiler.write_collapsed(path)
+            stream.write(profiler.summary(top))
+
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            stream.write(f"Peak traced memory: {peak / 2**20:.1f} MiB\n")
+            stream.write(memory_summary(snapshot, top))
+
+        stream.write(f"Finished in {elapsed:.3f} seconds\n")
@@ -0,0 +1,95 @@
+import sys
+import time
+
+
+def format_duration(seconds):
+    """
+    Returns a duration in seconds formatted as hours, minutes, and seconds.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+class Progress:
+    """
+    Live progress of a loop over a known number of items with the rate and estimated time
+    remaining. On a terminal the line is redrawn in place, otherwise a new line is written at
+    a slower interval so logs stay readable.
+    """
+
+    def __init__(self, total, description, stream=None, interval=None):
+        self.total = total
+        self.description = description
+        self.stream = stream if stream is not None else sys.stderr
+        self.count = 0
+
+        self._tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+        if interval is None:
+            interval = 0.5 if self._tty else 10.0
+        self.interval = interval
+
+        self._start = time.perf_counter()
+        self._last_write = None
+
+    @property
+    def elapsed(self):
+        """
+        Returns the number of seconds since the progress started.
+        """
+        return time.perf_counter() - self._start
+
+    @property
+    def rate(self):
+        """
+        Returns the number of items per second so far.
+        """
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        Returns the estimated number of seconds remaining, or None before the first item.
+        """
+        rate = self.rate
+        if rate == 0:
+            return None
+        return (self.total - self.count) / rate
+
+    def format(self):
+        """
+        Returns the progress line.
+        """
+        percent = 100 * self.count / self.total if self.total else 100.0
+        eta = "?" if self.eta is None else format_duration(self.eta)
+        return (
+            f"{self.description}: {self.count}/{self.total} ({percent:.0f}%) "
+            f"{self.rate:.1f} items/s, elapsed {format_duration(self.elapsed)}, ETA {eta}"
+        )
+
+    def _write(self, end=""):
+        if self._tty:
+            self.stream.write(f"\r\033[K{self.format()}{end}")
+        else:
+            self.stream.write(f"{self.format()}\n")
+        self.stream.flush()
+        self._last_write = time.perf_counter()
+
+    def update(self, count=1):
+        """
+        Mark items as done and redraw the progress if the interval has passed.
+        """
+        self.count += count
+        now = time.perf_counter()
+        if self._last_write is None or now - self._last_write >= self.interval:
+            self._write()
+
+    def close(self):
+        """
+        Write the final progress.
+        """
+        if self.total or self.count:
+            self._write(end="\n")
@@ -0,0 +1,171 @@
+import logging
+
+from musicmanager import similarity
+from musicmanager.optional import import_optional
+
+# Number of rated tracks counted as neutral that are added to every album and artist, which keeps
+# a single liked track from giving its whole album the top score.
+PRIOR = 2
+
+# Number of nearest rated tracks whose ratings give the similarity score.
+NUM_NEIGHBORS = 10
+
+# Weights of the scores combined into the recommendation score. Tracks without audio features
+# are scored from the album and artist scores alone.
+WEIGHTS = {
+    "album": 0.4,
+    "artist": 0.3,
+    "similarity": 0.3,
+}
+
+
+def similarity_scores(index, rated, ratings, candidates):
+    """
+    Returns arrays of the similarity score and neighbor radius of each candidate row of the
+    feature index. The score is the mean rating of the nearest rated rows weighted by closeness,
+    and the radius is the distance to the farthest of them. A rated row farther away than the
+    radius cannot change the score, which is what makes updates incremental. The radius is
+    infinite while there are fewer rated rows than neighbors.
+    """
+    np = import_optional("numpy", "Recommendations")
+
+    scores = np.full(len(candidates), np.nan)
+    radii = np.full(len(candidates), np.nan)
+    if not len(rated) or not len(candidates):
+        return scores, radii
+
+    k = min(NUM_NEIGHBORS, len(rated))
+    rated_vectors = index.vectors[rated]
+    chunk_size = max(1, similarity.MAX_DISTANCE_ELEMENTS // len(rated))
+    for start in range(0, len(candidates), chunk_size):
+        end = start + chunk_size
+        distances = similarity.pairwise_distances(
+            index.vectors[candidates[start:end]], rated_vectors
+        )
+
+        # Select the nearest rated rows of each candidate without sorting all of them.
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        weights = 1.0 / (1.0 + nearest_distances)
+        scores[start:end] = (weights * ratings[nearest]).sum(axis=1) / weights.sum(
+            axis=1
+        )
+        radii[start:end] = nearest_distances.max(axis=1)
+
+    if len(rated) < NUM_NEIGHBORS:
+        radii[:] = np.inf
+    return scores, radii
+
+
+def affected_by_changes(db, index, changed_ids):
+    """
+    Returns the set of ids of scored tracks whose similarity score may depend on the changed
+    tracks, which are those with a changed track within their neighbor radius.
+    """
+    np = import_optional("numpy", "Recommendations")
+
+    changed = [index.position(id_) for id_ in changed_ids]
+    changed = np.array([position for position in changed if position is not None])
+    if not len(changed):
+        return set()
+
+    rows = [
+        (id_, position, radius)
+        for id_, radius in db.get_neighbor_radii()
+        if (position := index.position(id_)) is not None
+    ]
+    if not rows:
+        return set()
+    positions = np.array([row[1] for row in rows])
+    radii = np.array([row[2] for row in rows])
+
+    affected = np.zeros(len(rows), dtype=bool)
+    changed_vectors = index.vectors[changed]
+    chunk_size = max(1, similarity.MAX_DISTANCE_ELEMENTS // len(changed))
+    for start in range(0, len(rows), chunk_size):
+        end = start + chunk_size
+        distances = similarity.pairwise_distances(
+            index.vectors[positions[start:end]], changed_vectors
+        )
+        affected[start:end] = (distances <= radii[start:end, None]).any(axis=1)
+
+    return {rows[i][0] for i in np.flatnonzero(affected)}
+
+
+def update_recommendations(db, full=False, cache=True):
+    """
+    Score unrated tracks and store the scores in the recommendations table. Only tracks that
+    are new or affected by rating changes since the last update are scored, unless `full` is set,
+    nothing has been scored yet, or the feature scaling changed. Every stored similarity score
+    and neighbor radius depends on the scaling, so new or replaced audio features rescore all
+    tracks. Returns the number of tracks scored.
+    """
+    np = import_optional("numpy", "Recommendations")
+
+    path = similarity.cache_path(db) if cache else None
+    index = similarity.FeatureIndex.load(db, path)
+
+    scaling = index.scaling
+    with db.transaction():
+        if (
+            full
+            or db.count_rows("recommendations") == 0
+            or db.get_feature_scaling() != scaling
+        ):
+            db.clear_recommendations()
+            track_ids = None
+        else:
+            track_ids = set(db.get_recommendation_candidates())
+            track_ids |= affected_by_changes(db, index, db.get_rating_changes())
+            if not track_ids:
+                db.delete_rating_changes()
+                return 0
+
+        rows = db.get_rating_scores(PRIOR, track_ids)
+        ids = [row[0] for row in rows]
+        album_scores = np.array([row[1] for row in rows], dtype=np.float64)
+        artist_scores = np.array([row[2] for row in rows], dtype=np.float64)
+
+        # Score the candidates with features from the ratings of their nearest rated tracks.
+        feature_rows = db.get_feature_ratings()
+        rated, found = index.positions([row[0] for row in feature_rows])
+        ratings = np.array([row[1] for row in feature_rows], dtype=np.float64)[found]
+        positions = np.array([index.position(id_) for id_ in ids], dtype=object)
+        has_features = np.array([p is not None for p in positions], dtype=bool)
+        similarity_scores_ = np.full(len(ids), np.nan)
+        radii = np.full(len(ids), np.nan)
+        if has_features.any():
+            candidates = positions[has_features].astype(np.int64)
+            similarity_scores_[has_features], radii[has_features] = similarity_scores(
+                index, rated, ratings, candidates
+            )
+
+        # Combine the scores, leaving out the similarity score where it is missing.
+        has_similarity = ~np.isnan(similarity_scores_)
+        total = (
+            WEIGHTS["album"] * album_scores
+            + WEIGHTS["artist"] * artist_scores
+            + WEIGHTS["similarity"] * np.where(has_similarity, similarity_scores_, 0.0)
+        )
+        weight = WEIGHTS["album"] + WEIGHTS["artist"]
+        scores = total / (weight + WEIGHTS["similarity"] * has_similarity)
+
+        db.insert_recommendations(
+            (
+                id_,
+                float(score),
+                float(album_score),
+                float(artist_score),
+                None if np.isnan(similarity_score) else float(similarity_score),
+                None if np.isnan(radius) else float(radius),
+            )
+            for id_, score, album_score, artist_score, similarity_score, radius in zip(
+                ids, scores, album_scores, artist_scores, similarity_scores_, radii
+            )
+        )
+        db.delete_rating_changes()
+        db.set_feature_scaling(scaling)
+
+    mode = "all" if track_ids is None else "changed"
+    logging.info(f"Scored {len(ids)} {mode} unrated tracks")
+    return len(ids)
@@ -0,0 +1,104 @@
+import gzip
+import json
+import threading
+from collections import defaultdict, deque
+
+import requests
+
+# Response headers kept in recordings. The rest do not affect how responses are handled.
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+
+def request_key(path, params, method="GET", body=None):
+    """
+    Returns the key identifying a request by its API path and parameters. Requests other than
+    GET requests are also identified by their method and JSON body.
+    """
+    params = {key: str(value) for key, value in (params or {}).items()}
+    if method == "GET":
+        return json.dumps([path, params], sort_keys=True)
+    return json.dumps([method, path, params, body], sort_keys=True)
+
+
+class Recorder:
+    """
+    Writes request and response pairs to a gzip compressed JSON Lines archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, path, params, response, method="GET", body=None):
+        """
+        Append a request and its response to the archive.
+        """
+        headers = {
+            name: response.headers[name]
+            for name in RECORDED_HEADERS
+            if name in response.headers
+        }
+        entry = {
+            "path": path,
+            "params": params,
+            "status": response.status_code,
+            "headers": headers,
+            "body": response.text,
+        }
+        # Only requests that write data have a method and request body to tell them apart.
+        if method != "GET":
+            entry["method"] = method
+            entry["request_body"] = body
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        """
+        Finish writing the archive.
+        """
+        with self._lock:
+            self._file.close()
+
+
+class Replayer:
+    """
+    Serves responses from an archive written by Recorder. Identical requests are served their
+    recorded responses in order, and the last one is repeated once the others are used up.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._responses = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                key = request_key(
+                    entry["path"],
+                    entry["params"],
+                    entry.get("method", "GET"),
+                    entry.get("request_body"),
+                )
+                self._responses[key].append(entry)
+
+    def get(self, path, params=None, method="GET", body=None):
+        """
+        Returns the recorded response for a request as a `requests.Response`.
+        """
+        key = request_key(path, params, method, body)
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                raise RuntimeError(f"No recorded response for {path} with {params}")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers.update(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = path
+        return response
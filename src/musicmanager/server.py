@@ -0,0 +1,303 @@
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
+
+from musicmanager import metrics
+from musicmanager.database import Database
+
+# Largest number of results returned by the endpoints that take a limit.
+MAX_LIMIT = 1000
+
+
+class DatabasePool:
+    """
+    Fixed pool of read-only database interfaces shared by the threads of the server. Each
+    request takes an interface for its whole duration, so requests beyond the size of the pool
+    wait for one to be returned.
+    """
+
+    def __init__(self, database_path, size):
+        self._databases = queue.Queue()
+        for _ in range(size):
+            self._databases.put(Database(database_path, read_only=True))
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def database(self):
+        """
+        Context of a database interface taken from the pool, which is returned on exit. An
+        interface returned after the pool was closed is closed instead.
+        """
+        db = self._databases.get()
+        try:
+            yield db
+        finally:
+            with self._lock:
+                if self._closed:
+                    db.close()
+                else:
+                    self._databases.put(db)
+
+    def close(self):
+        """
+        Close the connections of the interfaces in the pool without waiting for those still
+        in use, which are closed when they are returned.
+        """
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    db = self._databases.get_nowait()
+                except queue.Empty:
+                    break
+                db.close()
+
+
+class QueryCache:
+    """
+    Least recently used cache of response bodies by query. The cache is cleared whenever the
+    data version of its own connection changes, which happens when any other connection commits
+    a write to the database. A size of 0 disables the cache.
+    """
+
+    def __init__(self, db, size):
+        self._db = db
+        self.size = size
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Returns the cached value of the key, or computes, caches, and returns it.
+        """
+        if self.size <= 0:
+            return compute()
+
+        with self._lock:
+            version = self._db.data_version()
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.QUERY_CACHE.inc(result="hit")
+                return self._entries[key]
+        metrics.QUERY_CACHE.inc(result="miss")
+
+        # Compute outside the lock so slow queries do not block the other threads. A value
+        # computed after a newer write is still dropped by the next lookup that sees the write.
+        value = compute()
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        """
+        Close the connection used to watch for writes.
+        """
+        with self._lock:
+            self._db.close()
+
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    Local HTTP server answering read-only JSON queries about the library. Queries run on a pool
+    of read-only connections and their responses are cached until the database is written.
+    The database should be in write-ahead logging mode, so writers and readers do not block each
+    other.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, database_path, connections=4, cache_size=256):
+        super().__init__(address, QueryHandler)
+        self.pool = DatabasePool(database_path, connections)
+        self.cache = QueryCache(Database(database_path, read_only=True), cache_size)
+
+    @property
+    def url(self):
+        """
+        Returns the base URL of the server.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def server_close(self):
+        """
+        Close the socket and the database connections.
+        """
+        super().server_close()
+        self.pool.close()
+        self.cache.close()
+
+
+def item_json(item):
+    """
+    Returns a dictionary of the attributes of a Track, Album, or Artist object, or None.
+    """
+    if item is None:
+        return None
+    return dict(vars(item))
+
+
+def parse_limit(query, default=20):
+    """
+    Returns the `limit` parameter of a query. Raises ValueError if it is not a positive integer
+    within the maximum.
+    """
+    limit = int(query.get("limit", default))
+    if not 0 < limit <= MAX_LIMIT:
+        raise ValueError(f"Limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for QueryServer.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        (re.compile(r"/summary"), "summary"),
+        (re.compile(r"/search"), "search"),
+        (re.compile(r"/tracks"), "tracks"),
+        (re.compile(r"/recommendations"), "recommendations"),
+    ]
+
+    def log_message(self, format, *args):
+        """
+        Log requests at the debug level instead of writing every request to stderr.
+        """
+        logging.debug(f"Query server: {format % args}")
+
+    def send_body(self, status, body):
+        """
+        Send a response with a body that is already encoded as JSON.
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        """
+        Send an error object with the status and a message.
+        """
+        body = json.dumps({"error": {"status": status, "message": message}}).encode()
+        self.send_body(status, body)
+
+    def do_GET(self):
+        """
+        Dispatch a query to its endpoint, answering from the cache where possible.
+        """
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        for pattern, name in self.ROUTES:
+            if pattern.fullmatch(url.path) is not None:
+                break
+        else:
+            self.send_error_json(404, "Endpoint not found")
+            return
+
+        def compute():
+            with self.server.pool.database() as db:
+                data = getattr(self, f"get_{name}")(db, query)
+            return json.dumps(data).encode()
+
+        key = (name, tuple(sorted(query.items())))
+        try:
+            body = self.server.cache.get(key, compute)
+        except ValueError as ex:
+            self.send_error_json(400, str(ex))
+            return
+        except sqlite3.Error as ex:
+            logging.error(f"Query server: {ex}")
+            self.send_error_json(500, "Database error")
+            return
+        self.send_body(200, body)
+
+    def get_summary(self, db, query):
+        """
+        Returns the numbers of tracks by rating, albums, and artists.
+        """
+        return db.get_summary()
+
+    def get_search(self, db, query):
+        """
+        Returns the best matches of the `q` parameter among the names of all items, each with
+        its kind and the album and artist it belongs to.
+        """
+        text = query.get("q")
+        if not text:
+            raise ValueError("Missing search text")
+        return [
+            {
+                "kind": type(item).__name__.lower(),
+                "item": item_json(item),
+                "album": item_json(album),
+                "artist": item_json(artist),
+            }
+            for item, album, artist in db.search(text, limit=parse_limit(query))
+        ]
+
+    def get_tracks(self, db, query):
+        """
+        Returns tracks filtered by the `artist` id or name, an exact `rating`, or whether they
+        are `rated`.
+        """
+        rating = query.get("rating")
+        if rating is not None:
+            rating = int(rating)
+        rated = query.get("rated")
+        if rated is not None:
+            if rated not in ("true", "false"):
+                raise ValueError("Rated must be true or false")
+            rated = rated == "true"
+
+        tracks = db.query_tracks(artist=query.get("artist"), rating=rating, rated=rated)
+        return [item_json(track) for track in islice(tracks, parse_limit(query))]
+
+    def get_recommendations(self, db, query):
+        """
+        Returns the best scored unrated tracks with their scores and the track, album, and
+        artist they belong to. Scores are read as last stored by the `recommend` command.
+        """
+        rows = db.query_recommendations(limit=parse_limit(query))
+        details = db.get_tracks_by_id(row[0] for row in rows)
+        results = []
+        for id_, score, album_score, artist_score, similarity_score in rows:
+            if id_ not in details:
+                continue
+            track, album, artist = details[id_]
+            results.append(
+                {
+                    "score": score,
+                    "album_score": album_score,
+                    "artist_score": artist_score,
+                    "similarity_score": similarity_score,
+                    "track": item_json(track),
+                    "album": item_json(album),
+                    "artist": item_json(artist),
+                }
+            )
+        return results
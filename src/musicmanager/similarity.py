@@ -0,0 +1,247 @@
+import logging
+from pathlib import Path
+
+from musicmanager.optional import import_optional
+
+# Audio features compared by the similarity search. The categorical features are left out, since
+# distances between keys or time signatures are not meaningful.
+FEATURES = [
+    "danceability",
+    "energy",
+    "loudness",
+    "speechiness",
+    "acousticness",
+    "instrumentalness",
+    "liveness",
+    "valence",
+    "tempo",
+]
+
+# Version of the cache layout. Caches with another version are rebuilt.
+CACHE_VERSION = 1
+
+# Largest number of elements in the distance matrix computed at once.
+MAX_DISTANCE_ELEMENTS = 4_000_000
+
+
+def pairwise_distances(a, b):
+    """
+    Returns the matrix of Euclidean distances between the rows of two matrices.
+    """
+    np = import_optional("numpy", "Similarity search")
+
+    # Expand |a - b|^2 into |a|^2 - 2 a.b + |b|^2 to use one matrix product.
+    squared = (a**2).sum(axis=1)[:, None] - 2 * a @ b.T + (b**2).sum(axis=1)[None, :]
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def cache_path(db):
+    """
+    Returns the default path of the feature cache of a database.
+    """
+    path = db.database_path
+    return path.with_name(f"{path.name}.features.npz")
+
+
+class FeatureIndex:
+    """
+    Audio features of every track that has them, standardized to zero mean and unit variance
+    per feature, for nearest neighbor search. Rows are in the rowid order of the audio features
+    table.
+    """
+
+    def __init__(self, rowids, ids, features):
+        np = import_optional("numpy", "Similarity search")
+
+        self.rowids = rowids
+        self.ids = ids
+        self.features = features
+
+        # Standardize so that features with large ranges, like tempo, do not dominate.
+        if len(features):
+            mean = features.mean(axis=0)
+            std = features.std(axis=0)
+            std[std == 0] = 1.0
+        else:
+            mean = np.zeros(features.shape[1])
+            std = np.ones(features.shape[1])
+        self.mean = mean
+        self.std = std
+        self.vectors = (features - mean) / std
+        self._norms = (self.vectors**2).sum(axis=1)
+
+        self._positions = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def scaling(self):
+        """
+        Returns a dictionary of feature names to a tuple of the mean and standard deviation
+        used to standardize them.
+        """
+        return dict(zip(FEATURES, zip(self.mean.tolist(), self.std.tolist())))
+
+    @classmethod
+    def load(cls, db, path=None):
+        """
+        Load the index from the database. With a cache path, the features are read from the
+        cache and only rows added to the table since the cache was written are loaded. The cache
+        is rebuilt when rows it holds were replaced or deleted, or when its first and last rowids
+        now hold other tracks, as after the table is recreated. It is written back when it
+        changed.
+        """
+        np = import_optional("numpy", "Similarity search")
+
+        rowids = np.empty(0, dtype=np.int64)
+        ids = np.empty(0, dtype=str)
+        features = np.empty((0, len(FEATURES)))
+
+        if path is not None and Path(path).exists():
+            with np.load(path) as cache:
+                if int(cache["version"]) == CACHE_VERSION and list(
+                    cache["names"]
+                ) == list(FEATURES):
+                    rowids = cache["rowids"]
+                    ids = cache["ids"]
+                    features = cache["features"]
+
+            # New rows always get a larger rowid, so the cache is only stale if a row up to its
+            # last rowid is gone. A recreated table numbers its rows from 1 again, which the
+            # track ids at the ends of the cache tell apart.
+            last = int(rowids[-1]) if len(rowids) else 0
+            ends = {}
+            if len(rowids):
+                ends = {int(rowids[0]): str(ids[0]), last: str(ids[-1])}
+            if (
+                db.count_audio_features(FEATURES, until=last) != len(rowids)
+                or db.get_audio_feature_track_ids(ends) != ends
+            ):
+                logging.info("Feature cache is out of date and will be rebuilt")
+                rowids = rowids[:0]
+                ids = ids[:0]
+                features = features[:0]
+
+        last = int(rowids[-1]) if len(rowids) else 0
+        new_rowids, new_ids, new_features = db.load_audio_features(FEATURES, after=last)
+        logging.debug(f"Loaded {len(new_rowids)} new rows of audio features")
+
+        index = cls(
+            np.concatenate([rowids, new_rowids]),
+            np.concatenate([ids, new_ids]),
+            np.concatenate([features, new_features]),
+        )
+        if path is not None and (len(new_rowids) or not Path(path).exists()):
+            index.save(path)
+        return index
+
+    def save(self, path):
+        """
+        Write the raw features to a cache file.
+        """
+        np = import_optional("numpy", "Similarity search")
+
+        # Write through a file object, since `savez` appends a suffix to other paths.
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                version=CACHE_VERSION,
+                names=np.array(FEATURES),
+                rowids=self.rowids,
+                ids=self.ids,
+                features=self.features,
+            )
+
+    def position(self, track_id):
+        """
+        Returns the row of a track, or None if it has no features.
+        """
+        if self._positions is None:
+            self._positions = {id_: i for i, id_ in enumerate(self.ids.tolist())}
+        return self._positions.get(track_id)
+
+    def positions(self, rowids):
+        """
+        Returns the rows of the given audio features rowids, and a mask of which rowids were
+        found.
+        """
+        np = import_optional("numpy", "Similarity search")
+
+        rowids = np.asarray(rowids, dtype=np.int64)
+        positions = np.searchsorted(self.rowids, rowids)
+        found = positions < len(self.rowids)
+        found[found] = self.rowids[positions[found]] == rowids[found]
+        return positions[found], found
+
+    def distances(self, queries):
+        """
+        Returns the Euclidean distance from every row to the nearest of the query vectors. The
+        queries are compared in chunks, so the distance matrix stays bounded in size.
+        """
+        np = import_optional("numpy", "Similarity search")
+
+        best = np.full(len(self), np.inf)
+        chunk_size = max(1, MAX_DISTANCE_ELEMENTS // max(len(self), 1))
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start : start + chunk_size]
+            # Expand |v - q|^2 into |v|^2 - 2 v.q + |q|^2 to use one matrix product.
+            squared = (
+                self._norms[:, None]
+                - 2 * self.vectors @ chunk.T
+                + (chunk**2).sum(axis=1)[None, :]
+            )
+            np.minimum(best, squared.min(axis=1), out=best)
+        return np.sqrt(np.maximum(best, 0.0))
+
+    def nearest(self, queries, exclude=None, limit=20):
+        """
+        Returns a list of tuples of the track id and distance of the rows nearest to any of the
+        query vectors, from nearest to farthest. Rows set in the boolean `exclude` mask are
+        skipped.
+        """
+        np = import_optional("numpy", "Similarity search")
+
+        distances = self.distances(queries)
+        if exclude is not None:
+            distances[exclude] = np.inf
+
+        # Select the nearest rows without sorting all of them.
+        limit = min(limit, int(np.isfinite(distances).sum()))
+        if limit <= 0:
+            return []
+        candidates = np.argpartition(distances, limit - 1)[:limit]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(str(self.ids[i]), float(distances[i])) for i in candidates]
+
+
+def similar_tracks(db, index, track_id=None, limit=20, include_rated=False):
+    """
+    Returns a list of tuples of the track id and distance of the tracks most similar to a track,
+    or to any liked track when no track is given. Rated tracks are skipped unless
+    `include_rated` is set. A ValueError is raised if there is nothing to compare against.
+    """
+    np = import_optional("numpy", "Similarity search")
+
+    rows = db.get_feature_ratings()
+    rowids = np.array([row[0] for row in rows], dtype=np.int64)
+    ratings = np.array([row[1] for row in rows], dtype=np.int64)
+    rated, found = index.positions(rowids)
+    ratings = ratings[found]
+
+    if track_id is not None:
+        position = index.position(track_id)
+        if position is None:
+            raise ValueError(f"Track {repr(track_id)} has no audio features")
+        queries = np.array([position])
+    else:
+        queries = rated[ratings > 0]
+        if not len(queries):
+            raise ValueError("No liked tracks have audio features")
+
+    exclude = np.zeros(len(index), dtype=bool)
+    exclude[queries] = True
+    if not include_rated:
+        exclude[rated] = True
+
+    return index.nearest(index.vectors[queries], exclude=exclude, limit=limit)
@@ -1,8 +1,24 @@
 import logging
+import time
 
 import requests
 
+from musicmanager import metrics, tracing
 from musicmanager.item import Album, Artist, Playlist, Track
+from musicmanager.recording import Recorder, Replayer
+
+# Base URL of the Spotify Web API.
+API_URL = "https://api.spotify.com/v1"
+
+
+def endpoint_label(path):
+    """
+    Returns the API path with its ids replaced by a placeholder, which groups the metrics of
+    requests to the same endpoint. Spotify paths alternate between a resource name and an id.
+    """
+    parts = path.strip("/").split("/")
+    parts = [part if i % 2 == 0 else "{id}" for i, part in enumerate(parts)]
+    return "/" + "/".join(parts)
 
 
 class Spotify:
@@ -10,8 +26,29 @@ class Spotify:
     Interface to the Spotify API.
     """
 
-    def __init__(self, token):
+    def __init__(self, token, api_url=API_URL, max_retries=5, record=None, replay=None):
+        """
+        Initialize the interface. When `record` is a path, every request and response is saved
+        to an archive at that path. When `replay` is a path, responses are served from an
+        archive at that path instead of sending any requests.
+        """
         self.token = token
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+
+        # Reuse connections across requests.
+        self._session = requests.Session()
+
+        self._recorder = Recorder(record) if record is not None else None
+        self._replayer = Replayer(replay) if replay is not None else None
+
+    def close(self):
+        """
+        Close the connections and finish writing any recording.
+        """
+        self._session.close()
+        if self._recorder is not None:
+            self._recorder.close()
 
     def get_request_headers(self):
         """
@@ -24,15 +61,67 @@ class Spotify:
         }
         return headers
 
-    def get_playlist(self, id_, limit=50):
+    def _get(self, path, params=None):
+        """
+        Execute a GET request for an API path and return the response.
+        """
+        return self._request("GET", path, params=params)
+
+    def _request(self, method, path, params=None, body=None):
+        """
+        Execute a request for an API path with an optional JSON body and return the response.
+        Requests that are rate limited are retried after the delay given by the `Retry-After`
+        header, up to `max_retries` times.
         """
-        Fetch a Spotify playlist by id.
+        url = f"{self.api_url}{path}"
+        headers = self.get_request_headers()
+        endpoint = endpoint_label(path)
+
+        for attempt in range(self.max_retries + 1):
+            with tracing.span(
+                "http", endpoint=endpoint, path=path, attempt=attempt, method=method
+            ) as span:
+                start = time.perf_counter()
+                if self._replayer is not None:
+                    response = self._replayer.get(path, params, method, body)
+                else:
+                    response = self._session.request(
+                        method, url, headers=headers, params=params, json=body
+                    )
+                span["status"] = response.status_code
+
+            metrics.REQUEST_DURATION.observe(
+                time.perf_counter() - start, endpoint=endpoint
+            )
+            metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            metrics.RESPONSE_BYTES.inc(len(response.content), endpoint=endpoint)
+
+            if self._recorder is not None:
+                self._recorder.record(path, params, response, method, body)
+
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+
+            metrics.RETRIES.inc(endpoint=endpoint)
+
+            delay = float(response.headers.get("Retry-After", 1))
+            logging.warning(f"Rate limited on {path}, retrying in {delay} seconds")
+
+            # Replays do not wait, since no requests are sent.
+            if self._replayer is None:
+                time.sleep(delay)
+
+    def get_playlist(self, id_, limit=50, skip_track_ids=None):
+        """
+        Fetch a Spotify playlist by id. `skip_track_ids` is an optional function called with the
+        track ids of each page, which returns the set of those to leave out without parsing
+        their album and artist.
         Returns a Playlist object.
         """
         playlist = Playlist()
 
         # API endpoint to get tracks from a playlist.
-        endpoint = f"https://api.spotify.com/v1/playlists/{id_}/tracks"
+        endpoint = f"/playlists/{id_}/tracks"
 
         market = "US"
         fields = "items(track(name,id,album(name,id,artists(name,id)))),total"
@@ -51,8 +140,7 @@ class Spotify:
             offset += limit
 
             # Execute the GET request.
-            headers = self.get_request_headers()
-            response = requests.get(endpoint, headers=headers, params=params)
+            response = self._get(endpoint, params=params)
 
             if response.status_code != 200:
                 logging.error(f"Request responded with status {response.status_code}")
@@ -65,24 +153,128 @@ class Spotify:
                 logging.debug(f"Playlist has {total} tracks")
 
             # Parse the response data.
-            for item in data["items"]:
-                track_data = item["track"]
-                album_data = track_data["album"]
-                # Assume the artist listed first is the main artist.
-                artist_data = album_data["artists"][0]
-
-                # Create items from the data.
-                artist = Artist(artist_data["id"], artist_data["name"])
-                album = Album(album_data["id"], album_data["name"], artist_data["id"])
-                track = Track(track_data["id"], track_data["name"], album_data["id"])
-
-                # Add the items to the playlist.
-                playlist.add_artist(artist)
-                playlist.add_album(album)
-                playlist.add_track(track)
+            with tracing.span("parse", path=endpoint):
+                skip = set()
+                if skip_track_ids is not None:
+                    skip = skip_track_ids(
+                        [item["track"]["id"] for item in data["items"]]
+                    )
+                for item in data["items"]:
+                    track_data = item["track"]
+                    if track_data["id"] in skip:
+                        continue
+                    album_data = track_data["album"]
+                    # Assume the artist listed first is the main artist.
+                    artist_data = album_data["artists"][0]
+
+                    # Create items from the data.
+                    artist = Artist(artist_data["id"], artist_data["name"])
+                    album = Album(
+                        album_data["id"], album_data["name"], artist_data["id"]
+                    )
+                    track = Track(
+                        track_data["id"], track_data["name"], album_data["id"]
+                    )
+
+                    # Add the items to the playlist.
+                    playlist.add_artist(artist)
+                    playlist.add_album(album)
+                    playlist.add_track(track)
+
+            metrics.ITEMS_FETCHED.inc(len(data["items"]), kind="track")
 
         return playlist
 
+    def get_playlist_track_ids(self, id_, limit=50):
+        """
+        Fetch the ids of the tracks in a Spotify playlist in playlist order, without the album
+        and artist data of `get_playlist`. Items that are not tracks, such as local files, are
+        skipped.
+        Returns a list of track ids.
+        """
+        track_ids = []
+
+        # API endpoint to get tracks from a playlist.
+        endpoint = f"/playlists/{id_}/tracks"
+
+        fields = "items(track(id)),total"
+        offset = 0
+
+        # Iterate requests until we get all tracks.
+        total = None
+        while total is None or offset < total:
+            params = {
+                "fields": fields,
+                "limit": limit,
+                "offset": offset,
+            }
+            offset += limit
+
+            # Execute the GET request.
+            response = self._get(endpoint, params=params)
+
+            if response.status_code != 200:
+                logging.error(f"Request responded with status {response.status_code}")
+                return None
+
+            data = response.json()
+
+            if total is None:
+                total = data["total"]
+
+            with tracing.span("parse", path=endpoint):
+                for item in data["items"]:
+                    track = item.get("track")
+                    if track is not None and track.get("id") is not None:
+                        track_ids.append(track["id"])
+
+            metrics.ITEMS_FETCHED.inc(len(data["items"]), kind="playlist_item")
+
+        return track_ids
+
+    def add_playlist_tracks(self, id_, track_ids):
+        """
+        Append up to 100 tracks to a Spotify playlist with a single request.
+        Returns the snapshot id of the playlist after the change, or None if the request fails.
+        """
+        # API endpoint to add items to a playlist.
+        endpoint = f"/playlists/{id_}/tracks"
+
+        body = {
+            "uris": [f"spotify:track:{track_id}" for track_id in track_ids],
+        }
+
+        # Execute the POST request.
+        response = self._request("POST", endpoint, body=body)
+
+        if response.status_code not in (200, 201):
+            logging.error(f"Request responded with status {response.status_code}")
+            return None
+
+        return response.json()["snapshot_id"]
+
+    def remove_playlist_tracks(self, id_, track_ids):
+        """
+        Remove every occurrence of up to 100 tracks from a Spotify playlist with a single
+        request.
+        Returns the snapshot id of the playlist after the change, or None if the request fails.
+        """
+        # API endpoint to remove items from a playlist.
+        endpoint = f"/playlists/{id_}/tracks"
+
+        body = {
+            "tracks": [{"uri": f"spotify:track:{track_id}"} for track_id in track_ids],
+        }
+
+        # Execute the DELETE request.
+        response = self._request("DELETE", endpoint, body=body)
+
+        if response.status_code != 200:
+            logging.error(f"Request responded with status {response.status_code}")
+            return None
+
+        return response.json()["snapshot_id"]
+
     def get_artist_albums(self, artist, limit=50):
         """
         Request all albums for a Spotify artist.
@@ -91,7 +283,7 @@ class Spotify:
         albums = []
 
         # API endpoint to get albums from an artist.
-        endpoint = f"https://api.spotify.com/v1/artists/{artist.id}/albums"
+        endpoint = f"/artists/{artist.id}/albums"
 
         market = "US"
         offset = 0
@@ -114,8 +306,7 @@ class Spotify:
             offset += limit
 
             # Execute the GET request.
-            headers = self.get_request_headers()
-            response = requests.get(endpoint, headers=headers, params=params)
+            response = self._get(endpoint, params=params)
 
             if response.status_code != 200:
                 logging.error(f"Request responded with status {response.status_code}")
@@ -128,14 +319,45 @@ class Spotify:
                 logging.debug(f"Artist {repr(artist.name)} has {total} albums")
 
             # Parse the data to create an album list.
-            for item in data["items"]:
-                album_id = item["id"]
-                album_name = item["name"]
-                album = Album(album_id, album_name, artist.id)
-                albums.append(album)
+            with tracing.span("parse", path=endpoint):
+                for item in data["items"]:
+                    album_id = item["id"]
+                    album_name = item["name"]
+                    album = Album(album_id, album_name, artist.id)
+                    albums.append(album)
+
+            metrics.ITEMS_FETCHED.inc(len(data["items"]), kind="album")
 
         return albums
 
+    def get_related_artists(self, artist):
+        """
+        Request the artists that Spotify relates to an artist by the listening history of its
+        fans.
+        Returns a list of Artist objects.
+        """
+        # API endpoint to get the related artists of an artist. This returns up to 20 artists
+        # with a single request.
+        endpoint = f"/artists/{artist.id}/related-artists"
+
+        # Execute the GET request.
+        response = self._get(endpoint)
+
+        if response.status_code != 200:
+            logging.error(f"Request responded with status {response.status_code}")
+            return None
+
+        data = response.json()
+
+        # Parse the data to create an artist list.
+        with tracing.span("parse", path=endpoint):
+            artists = [Artist(item["id"], item["name"]) for item in data["artists"]]
+
+        metrics.ITEMS_FETCHED.inc(len(artists), kind="artist")
+        logging.debug(f"Artist {repr(artist.name)} has {len(artists)} related artists")
+
+        return artists
+
     def get_album_tracks(self, album):
         """
         Request all tracks for a Spotify album.
@@ -144,7 +366,7 @@ class Spotify:
         tracks = []
 
         # API endpoint to get tracks from an album.
-        endpoint = f"https://api.spotify.com/v1/albums/{album.id}"
+        endpoint = f"/albums/{album.id}"
 
         market = "US"
 
@@ -158,8 +380,7 @@ class Spotify:
         }
 
         # Execute the GET request.
-        headers = self.get_request_headers()
-        response = requests.get(endpoint, headers=headers, params=params)
+        response = self._get(endpoint, params=params)
 
         if response.status_code != 200:
             logging.error(f"Request responded with status {response.status_code}")
@@ -177,8 +398,82 @@ class Spotify:
         logging.debug(f"Album {repr(album.name)} has {total} tracks")
 
         # Create the track list.
-        for track in track_data["items"]:
-            track = Track(track["id"], track["name"], album.id)
-            tracks.append(track)
+        with tracing.span("parse", path=endpoint):
+            for track in track_data["items"]:
+                track = Track(track["id"], track["name"], album.id)
+                tracks.append(track)
+
+        metrics.ITEMS_FETCHED.inc(len(track_data["items"]), kind="track")
 
         return tracks
+
+    def get_artists(self, artist_ids):
+        """
+        Request the full artist objects for up to 50 Spotify artists with a single request.
+        Returns a dictionary of each artist id to the artist object, which has the name, genres,
+        popularity, and followers, or to None if the artist was not found. Returns None if the
+        request fails.
+        """
+        # API endpoint to get several artists.
+        endpoint = "/artists"
+
+        params = {
+            "ids": ",".join(artist_ids),
+        }
+
+        # Execute the GET request.
+        response = self._get(endpoint, params=params)
+
+        if response.status_code != 200:
+            logging.error(f"Request responded with status {response.status_code}")
+            return None
+
+        data = response.json()
+
+        # Artists that are not found are returned as null, so start from every requested id.
+        artists = dict.fromkeys(artist_ids)
+        with tracing.span("parse", path=endpoint):
+            for item in data["artists"]:
+                if item is not None:
+                    artists[item["id"]] = item
+
+        num_found = sum(item is not None for item in artists.values())
+        metrics.ITEMS_FETCHED.inc(num_found, kind="artist_metadata")
+        logging.debug(f"Found {num_found} of {len(artists)} artists")
+
+        return artists
+
+    def get_audio_features(self, track_ids):
+        """
+        Request audio features for up to 100 Spotify tracks with a single request.
+        Returns a dictionary of each track id to a dictionary of its features, or to None if the
+        track has no features. Returns None if the request fails.
+        """
+        # API endpoint to get audio features for several tracks.
+        endpoint = "/audio-features"
+
+        params = {
+            "ids": ",".join(track_ids),
+        }
+
+        # Execute the GET request.
+        response = self._get(endpoint, params=params)
+
+        if response.status_code != 200:
+            logging.error(f"Request responded with status {response.status_code}")
+            return None
+
+        data = response.json()
+
+        # Tracks without features are returned as null, so start from every requested id.
+        features = dict.fromkeys(track_ids)
+        with tracing.span("parse", path=endpoint):
+            for item in data["audio_features"]:
+                if item is not None:
+                    features[item["id"]] = item
+
+        num_found = sum(values is not None for values in features.values())
+        metrics.ITEMS_FETCHED.inc(num_found, kind="audio_features")
+        logging.debug(f"Found audio features for {num_found} of {len(features)} tracks")
+
+        return features
@@ -0,0 +1,198 @@
+import hashlib
+
+from musicmanager.database import BASE62
+from musicmanager.item import Album, Artist, Track
+
+# Generated ratings are picked from this list by hash, so about 40% of tracks are rated and liked
+# tracks are twice as common as neutral or disliked tracks.
+RATINGS = [1, 1, 0, -1, None, None, None, None, None, None]
+
+
+def encode_base62(value, length=22):
+    """
+    Returns the base62 string of an integer, left padded with zeros to the given length.
+    """
+    chars = []
+    while value > 0:
+        value, remainder = divmod(value, 62)
+        chars.append(BASE62[remainder])
+    return "".join(reversed(chars)).rjust(length, "0")
+
+
+class SyntheticLibrary:
+    """
+    Deterministic library of generated artists, albums, and tracks. Items are computed from their
+    index on demand, so libraries of any size can be iterated without holding them in memory.
+    Track `i` belongs to album `i // tracks_per_album`, which belongs to artist
+    `album // albums_per_artist`.
+    """
+
+    def __init__(self, num_tracks, tracks_per_album=10, albums_per_artist=5, seed=0):
+        self.num_tracks = num_tracks
+        self.tracks_per_album = tracks_per_album
+        self.albums_per_artist = albums_per_artist
+        self.seed = seed
+
+        # Round up so every track has an album and every album has an artist.
+        self.num_albums = -(-num_tracks // tracks_per_album)
+        self.num_artists = -(-self.num_albums // albums_per_artist)
+
+    def _hash(self, kind, index):
+        """
+        Returns a 128-bit integer derived from the seed, item kind, and index.
+        """
+        key = f"{self.seed}:{kind}:{index}".encode()
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return int.from_bytes(digest, "big")
+
+    def artist_id(self, index):
+        """
+        Returns the id of the artist with the given index.
+        """
+        return encode_base62(self._hash("artist", index))
+
+    def album_id(self, index):
+        """
+        Returns the id of the album with the given index.
+        """
+        return encode_base62(self._hash("album", index))
+
+    def track_id(self, index):
+        """
+        Returns the id of the track with the given index.
+        """
+        return encode_base62(self._hash("track", index))
+
+    def track_rating(self, index):
+        """
+        Returns the generated rating of a track.
+        """
+        return RATINGS[self._hash("rating", index) % len(RATINGS)]
+
+    def artist(self, index):
+        """
+        Returns the Artist object with the given index.
+        """
+        return Artist(self.artist_id(index), f"Artist {index}")
+
+    def album(self, index):
+        """
+        Returns the Album object with the given index.
+        """
+        artist = index // self.albums_per_artist
+        return Album(self.album_id(index), f"Album {index}", self.artist_id(artist))
+
+    def track(self, index, rated=False):
+        """
+        Returns the Track object with the given index. The generated rating is only set when
+        `rated` is set.
+        """
+        album = index // self.tracks_per_album
+        rating = self.track_rating(index) if rated else None
+        return Track(
+            self.track_id(index), f"Track {index}", self.album_id(album), rating=rating
+        )
+
+    def iter_artists(self):
+        """
+        Yield all artists in index order.
+        """
+        for index in range(self.num_artists):
+            yield self.artist(index)
+
+    def iter_albums(self):
+        """
+        Yield all albums in index order.
+        """
+        for index in range(self.num_albums):
+            yield self.album(index)
+
+    def iter_tracks(self, rated=False):
+        """
+        Yield all tracks in index order.
+        """
+        for index in range(self.num_tracks):
+            yield self.track(index, rated=rated)
+
+    def album_indexes(self, artist_index):
+        """
+        Returns the range of album indexes of an artist.
+        """
+        start = artist_index * self.albums_per_artist
+        return range(start, min(start + self.albums_per_artist, self.num_albums))
+
+    def related_artist_indexes(self, artist_index, count=4):
+        """
+        Returns a list of up to `count` indexes of the artists related to an artist. Artists
+        are related to their nearest neighbors by index, wrapping around at the ends, so the
+        related artists form a connected graph.
+        """
+        related = []
+        for offset in range(1, count + 1):
+            # Alternate between the next and previous artists.
+            step = (offset + 1) // 2 if offset % 2 else -(offset // 2)
+            index = (artist_index + step) % self.num_artists
+            if index != artist_index and index not in related:
+                related.append(index)
+        return related
+
+    def track_indexes(self, album_index):
+        """
+        Returns the range of track indexes of an album.
+        """
+        start = album_index * self.tracks_per_album
+        return range(start, min(start + self.tracks_per_album, self.num_tracks))
+
+
+def chunked(items, size):
+    """
+    Yield lists of up to `size` items from an iterable.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SyntheticSpotify:
+    """
+    Stand-in for the Spotify interface that serves a SyntheticLibrary without any requests.
+    """
+
+    def __init__(self, library):
+        self.library = library
+
+        # Map ids back to indexes, since ids are one-way hashes.
+        self._artist_indexes = {
+            library.artist_id(index): index for index in range(library.num_artists)
+        }
+        self._album_indexes = {
+            library.album_id(index): index for index in range(library.num_albums)
+        }
+
+    def get_artist_albums(self, artist):
+        """
+        Returns a list of Album objects for an artist of the library.
+        """
+        index = self._artist_indexes[artist.id]
+        return [self.library.album(i) for i in self.library.album_indexes(index)]
+
+    def get_related_artists(self, artist):
+        """
+        Returns a list of Artist objects related to an artist of the library.
+        """
+        index = self._artist_indexes[artist.id]
+        return [
+            self.library.artist(i) for i in self.library.related_artist_indexes(index)
+        ]
+
+    def get_album_tracks(self, album):
+        """
+        Returns a list of Track objects for an album of the library.
+        """
+        index = self._album_indexes[album.id]
+        return [self.library.track(i) for i in self.library.track_indexes(index)]
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Tracer that records spans, or None when tracing is disabled.
+_tracer = None
+
+
+class Tracer:
+    """
+    Records nested spans of work from any thread. Spans are exported as complete events in the
+    Chrome trace format, which is read by chrome://tracing, Perfetto, and speedscope.
+    """
+
+    def __init__(self):
+        self.events = []
+
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        """
+        Returns the stack of open span names for the current thread.
+        """
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, /, **attributes):
+        """
+        Context to record a span. The context value is the dictionary of attributes, which can
+        be added to before the span ends.
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        stack.append(name)
+
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+
+            args = {
+                key: value for key, value in attributes.items() if value is not None
+            }
+            if parent is not None:
+                args["parent"] = parent
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def write(self, path):
+        """
+        Write the recorded spans to a JSON file in the Chrome trace format.
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+def set_tracer(tracer):
+    """
+    Set the tracer that records spans, or None to disable tracing.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def span(name, /, **attributes):
+    """
+    Context to record a span with the active tracer. This does nothing when tracing is disabled,
+    but the context value is still a dictionary of attributes.
+    """
+    if _tracer is None:
+        return nullcontext(attributes)
+    return _tracer.span(name, **attributes)
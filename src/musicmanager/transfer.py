@@ -0,0 +1,184 @@
+import csv
+import itertools
+import json
+import logging
+from pathlib import Path
+
+from musicmanager.database import SCHEMA
+from musicmanager.optional import import_optional
+
+# Supported file formats. Each table is stored in its own file named after the table.
+FORMATS = ("jsonl", "csv", "parquet")
+
+# Number of rows read or written at a time.
+CHUNK_SIZE = 10000
+
+
+def is_integer_column(table, column):
+    """
+    Returns True if the column of the table stores integers.
+    """
+    return SCHEMA[table][column].startswith("int")
+
+
+def is_nullable_column(table, column):
+    """
+    Returns True if the column of the table accepts NULL values.
+    """
+    return "NOT NULL" not in SCHEMA[table][column]
+
+
+def write_jsonl(path, table, chunks):
+    """
+    Write chunks of rows to a JSON Lines file with one object per row.
+    """
+    columns = list(SCHEMA[table])
+    with open(path, "w", encoding="utf-8") as file:
+        for rows in chunks:
+            lines = [json.dumps(dict(zip(columns, row))) + "\n" for row in rows]
+            file.writelines(lines)
+
+
+def read_jsonl(path, table, chunk_size):
+    """
+    Yield chunks of rows from a JSON Lines file with one object per row.
+    """
+    columns = list(SCHEMA[table])
+    with open(path, encoding="utf-8") as file:
+        while lines := list(itertools.islice(file, chunk_size)):
+            objects = [json.loads(line) for line in lines if line.strip()]
+            yield [tuple(data.get(column) for column in columns) for data in objects]
+
+
+def write_csv(path, table, chunks):
+    """
+    Write chunks of rows to a CSV file with a header row. NULL values are written as empty
+    fields.
+    """
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(SCHEMA[table])
+        for rows in chunks:
+            writer.writerows(rows)
+
+
+def read_csv(path, table, chunk_size):
+    """
+    Yield chunks of rows from a CSV file with a header row. Empty fields of nullable and
+    integer columns are read as NULL, while empty fields of other text columns are read as
+    empty strings. Integer columns are converted from text.
+    """
+    columns = list(SCHEMA[table])
+    integers = [is_integer_column(table, column) for column in columns]
+    nulls = [
+        is_integer_column(table, column) or is_nullable_column(table, column)
+        for column in columns
+    ]
+
+    def convert(value, integer, null):
+        if value == "":
+            return None if null else value
+        return int(value) if integer else value
+
+    with open(path, encoding="utf-8", newline="") as file:
+        reader = csv.DictReader(file)
+        while records := list(itertools.islice(reader, chunk_size)):
+            yield [
+                tuple(
+                    convert(record[column], integer, null)
+                    for column, integer, null in zip(columns, integers, nulls)
+                )
+                for record in records
+            ]
+
+
+def parquet_schema(table):
+    """
+    Returns the Arrow schema for a table.
+    """
+    pa = import_optional("pyarrow", "Parquet support")
+    fields = []
+    for column in SCHEMA[table]:
+        type_ = pa.int64() if is_integer_column(table, column) else pa.string()
+        fields.append(pa.field(column, type_))
+    return pa.schema(fields)
+
+
+def write_parquet(path, table, chunks):
+    """
+    Write chunks of rows to a Parquet file with one row group per chunk.
+    """
+    pa = import_optional("pyarrow", "Parquet support")
+    pq = import_optional("pyarrow.parquet", "Parquet support")
+
+    schema = parquet_schema(table)
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            columns = [list(values) for values in zip(*rows)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+
+def read_parquet(path, table, chunk_size):
+    """
+    Yield chunks of rows from a Parquet file.
+    """
+    pq = import_optional("pyarrow.parquet", "Parquet support")
+
+    columns = list(SCHEMA[table])
+    file = pq.ParquetFile(path)
+    for batch in file.iter_batches(batch_size=chunk_size, columns=columns):
+        values = [batch.column(column).to_pylist() for column in columns]
+        yield list(zip(*values))
+
+
+WRITERS = {
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
+
+READERS = {
+    "jsonl": read_jsonl,
+    "csv": read_csv,
+    "parquet": read_parquet,
+}
+
+
+def export_library(db, directory, fmt="jsonl", chunk_size=CHUNK_SIZE):
+    """
+    Export the tracks, albums, and artists tables to files in a directory. Rows are streamed
+    from the database in chunks, so memory use does not grow with the size of the library.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    for table in SCHEMA:
+        path = directory / f"{table}.{fmt}"
+        WRITERS[fmt](path, table, db.iter_rows(table, chunk_size=chunk_size))
+        logging.info(f"Exported {table} to {path}")
+
+
+def import_library(db, directory, fmt="jsonl", chunk_size=CHUNK_SIZE):
+    """
+    Import the tracks, albums, and artists tables from files in a directory written by
+    `export_library`. The tables must be empty. Rows are inserted in chunks through the bulk
+    load path, which builds the indexes once all rows are loaded.
+    """
+    directory = Path(directory)
+
+    # Create any missing tables and make sure nothing would be overwritten.
+    db.create_tables()
+    for table in SCHEMA:
+        if db.count_rows(table) > 0:
+            raise RuntimeError(f"Cannot import into non-empty table {repr(table)}")
+
+    with db.bulk_load():
+        for table in SCHEMA:
+            path = directory / f"{table}.{fmt}"
+            if not path.exists():
+                logging.warning(f"Skipping {table} since {path} does not exist")
+                continue
+
+            for rows in READERS[fmt](path, table, chunk_size):
+                db.insert_rows(table, rows)
+            logging.info(f"Imported {table} from {path}")
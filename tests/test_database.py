@@ -1,7 +1,25 @@
 import pytest
 
 from musicmanager import database as dut
-from musicmanager.item import Album, Artist, Track
+from musicmanager import metrics
+from musicmanager.item import Album, Artist, Playlist, Track
+
+
+def test_database_inMemory(tmp_path, monkeypatch):
+    """
+    Test an in-memory database holds data without creating a file.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    # Function under test.
+    db = dut.Database(":memory:")
+    db.create_tables()
+    with db.transaction():
+        db.insert_artists([Artist("a0", "Artist 0")])
+
+    # Verify the data and that no file was created.
+    assert [artist.id for artist in db.get_artists()] == ["a0"]
+    assert list(tmp_path.iterdir()) == []
 
 
 def test_transaction(tmp_path):
@@ -445,3 +463,702 @@ def test_printSummary(tmp_path, capsys):
     # Verify the output.
     captured = capsys.readouterr()
     assert captured.out == expected
+
+
+def insert_rated_library(cur):
+    """
+    Insert a small library of artists, albums, and rated tracks for the query tests.
+    """
+    artists = [
+        ("7z9n8Q0icbgvXqx1RWoGrd", "FRCTRD"),
+        ("7bDLHytU8vohbiWbePGrRU", "Falsifier"),
+        ("4UgQ3EFa8fEeaIEg54uV5b", "Chelsea Grin"),
+    ]
+    cur.executemany("INSERT INTO artists(id, name) VALUES (?, ?)", artists)
+
+    albums = [
+        ("1GLmxzF8g5p0fcdAatGq5Y", "Fractured", "7z9n8Q0icbgvXqx1RWoGrd"),
+        ("0a40snAsSiU0fSBrba93YB", "World Demise", "7bDLHytU8vohbiWbePGrRU"),
+        ("0a40snAsSiU0fSBrba93YB2", "World Demise 2", "7bDLHytU8vohbiWbePGrRU"),
+        ("7hkhFnClNPmRXL20KqdzSO", "Bleeding Sun", "4UgQ3EFa8fEeaIEg54uV5b"),
+    ]
+    cur.executemany("INSERT INTO albums(id, name, artist_id) VALUES (?, ?, ?)", albums)
+
+    tracks = [
+        ("15eQh5ZLBoMReY20MDG37T", "Breathless", "1GLmxzF8g5p0fcdAatGq5Y", 1),
+        ("15eQh5ZLBoMReY20MDG37T2", "Breathless 2", "1GLmxzF8g5p0fcdAatGq5Y", 1),
+        ("2GDX9DpZgXsLAkXhHBQU1Q", "Choke", "0a40snAsSiU0fSBrba93YB", None),
+        ("2GDX9DpZgXsLAkXhHBQU1Q2", "Choke 2", "0a40snAsSiU0fSBrba93YB", 0),
+        ("2GDX9DpZgXsLAkXhHBQU1Q3", "Choke 3", "0a40snAsSiU0fSBrba93YB2", 1),
+        ("2GDX9DpZgXsLAkXhHBQU1Q4", "Choke 4", "0a40snAsSiU0fSBrba93YB2", -1),
+        ("6bsxDgpU5nlcHNZYtsfZG8", "Bleeding Sun", "7hkhFnClNPmRXL20KqdzSO", -1),
+    ]
+    cur.executemany(
+        "INSERT INTO tracks(id, name, album_id, rating) VALUES (?, ?, ?, ?)",
+        tracks,
+    )
+
+
+def test_queryTracks(tmp_path):
+    """
+    Test `query_tracks` by filtering on artist and rating.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Select all tracks by artist id.
+    tracks = list(db.query_tracks("7bDLHytU8vohbiWbePGrRU"))
+    assert sorted(track.name for track in tracks) == [
+        "Choke",
+        "Choke 2",
+        "Choke 3",
+        "Choke 4",
+    ]
+
+    # Select tracks by artist name, which gives the same result.
+    tracks = list(db.query_tracks("Falsifier"))
+    assert len(tracks) == 4
+
+    # Select liked tracks by the artist.
+    tracks = list(db.query_tracks("Falsifier", rating=1))
+    assert [track.name for track in tracks] == ["Choke 3"]
+
+    # Select rated and unrated tracks by the artist.
+    tracks = list(db.query_tracks("Falsifier", rated=True))
+    assert sorted(track.name for track in tracks) == ["Choke 2", "Choke 3", "Choke 4"]
+    tracks = list(db.query_tracks("Falsifier", rated=False))
+    assert [track.name for track in tracks] == ["Choke"]
+
+    # Select disliked tracks across all artists.
+    tracks = list(db.query_tracks(rating=-1))
+    assert sorted(track.name for track in tracks) == ["Bleeding Sun", "Choke 4"]
+
+    # Verify liked tracks are in the order they were added, across the rating index.
+    tracks = list(db.query_tracks(rating=1))
+    assert [track.name for track in tracks] == ["Breathless", "Breathless 2", "Choke 3"]
+
+    # An unknown artist has no tracks.
+    assert list(db.query_tracks("Unknown")) == []
+
+
+def test_queryAlbums(tmp_path):
+    """
+    Test `query_albums` by checking the rating counts of an artist's albums.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Function under test.
+    rows = sorted(db.query_albums("Falsifier"), key=lambda row: row[0].name)
+
+    # Verify the albums and their counts.
+    assert len(rows) == 2
+    album, summary = rows[0]
+    assert album.name == "World Demise"
+    assert summary.num_tracks == 2
+    assert summary.num_rated == 1
+    assert summary.num_neutral == 1
+    album, summary = rows[1]
+    assert album.name == "World Demise 2"
+    assert summary.num_liked == 1
+    assert summary.num_disliked == 1
+    assert summary.mean_rating == 0
+
+    # All albums are returned without an artist.
+    assert len(list(db.query_albums())) == 4
+
+
+def test_queryArtists(tmp_path):
+    """
+    Test `query_artists` by ranking artists by their ratings.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Function under test.
+    rows = list(db.query_artists(top_rated=True))
+
+    # Verify the artists are ranked by their ratings.
+    assert [artist.name for artist, _ in rows] == [
+        "FRCTRD",
+        "Falsifier",
+        "Chelsea Grin",
+    ]
+    artist, summary = rows[0]
+    assert summary.num_liked == 2
+    assert summary.mean_rating == 1
+
+    # Verify the limit.
+    rows = list(db.query_artists(top_rated=True, limit=1))
+    assert len(rows) == 1
+
+
+def test_getTracksById(tmp_path):
+    """
+    Test `get_tracks_by_id` with more ids than fit in a single query.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+    ids = [f"{i:022d}" for i in range(2 * dut.MAX_VARIABLES + 1)]
+    with db.transaction():
+        db.insert_tracks([Track(id_, "Filler", "unknown") for id_ in ids])
+
+    # Function under test.
+    results = db.get_tracks_by_id(["missing", "2GDX9DpZgXsLAkXhHBQU1Q", *ids])
+
+    # Verify every known track is found with its album and artist.
+    assert len(results) == len(ids) + 1
+    track, album, artist = results["2GDX9DpZgXsLAkXhHBQU1Q"]
+    assert track.name == "Choke"
+    assert album.name == "World Demise"
+    assert artist.name == "Falsifier"
+    assert results[ids[-1]][1:] == (None, None)
+    assert db.get_tracks_by_id([]) == {}
+
+
+def test_search(tmp_path):
+    """
+    Test `search` by matching names of tracks, albums, and artists.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Add the items inserted outside of a transaction to the search index.
+    with db.transaction():
+        db.index_queued_items()
+
+    # Search for a word prefix shared by tracks and albums.
+    results = list(db.search("bleed"))
+    assert len(results) == 2
+    kinds = sorted(type(item).__name__ for item, _, _ in results)
+    assert kinds == ["Album", "Track"]
+    for item, album, artist in results:
+        assert artist.name == "Chelsea Grin"
+        if isinstance(item, Track):
+            assert album.name == "Bleeding Sun"
+        else:
+            assert album is None
+
+    # Search for an artist.
+    results = list(db.search("falsif"))
+    assert len(results) == 1
+    assert isinstance(results[0][0], Artist)
+
+    # Verify the ordering puts the closest match first and the limit is applied.
+    results = list(db.search("choke", limit=2))
+    assert len(results) == 2
+    assert results[0][0].name == "Choke"
+
+    # Verify characters with a meaning in the query syntax are ignored.
+    assert len(list(db.search('"world" (demise'))) == 2
+    assert list(db.search("*")) == []
+
+
+def test_search_rebuild(tmp_path):
+    """
+    Test the search index is filled from existing items and kept in sync with inserts.
+    """
+    # Create a database with items but without the search index, like an older database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    with db.transaction():
+        for name in dut.TRIGGERS:
+            db._execute(f"DROP TRIGGER {name}")
+        db.drop_table("search_index")
+    insert_rated_library(db._con.cursor())
+
+    # Create the search index.
+    db.create_tables()
+    assert len(list(db.search("choke"))) == 4
+
+    # Insert another track and verify it is searchable.
+    with db.transaction():
+        db.insert_tracks([Track("3GDX9DpZgXsLAkXhHBQU1Q", "Chokehold", "unknown")])
+    results = list(db.search("chokehold"))
+    assert len(results) == 1
+    track, album, artist = results[0]
+    assert track.id == "3GDX9DpZgXsLAkXhHBQU1Q"
+    assert album is None
+    assert artist is None
+
+
+def test_indexQueuedItems(tmp_path):
+    """
+    Test inserted items are queued and added to the search index when the transaction is
+    committed.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+
+    with db.transaction():
+        db.insert_artists([Artist("7bDLHytU8vohbiWbePGrRU", "Falsifier")])
+        db.insert_tracks(
+            [
+                Track("2GDX9DpZgXsLAkXhHBQU1Q", "Choke", "0a40snAsSiU0fSBrba93YB"),
+                Track("2GDX9DpZgXsLAkXhHBQU1Q2", "Choke 2", "0a40snAsSiU0fSBrba93YB"),
+            ]
+        )
+
+        # Verify the items are queued rather than indexed.
+        rows = db._con.execute("SELECT kind FROM search_queue").fetchall()
+        assert sorted(rows) == [("artist",), ("track",), ("track",)]
+        assert list(db.search("choke")) == []
+
+        # Verify a rename before the commit indexes the new name.
+        db._execute(
+            "UPDATE artists SET name = 'Falsifier 2' WHERE id = '7bDLHytU8vohbiWbePGrRU'"
+        )
+
+    # Function under test.
+    assert len(list(db.search("choke"))) == 2
+    results = list(db.search("falsifier"))
+    assert [artist.name for artist, _, _ in results] == ["Falsifier 2"]
+    assert db._con.execute("SELECT COUNT() FROM search_queue").fetchone() == (0,)
+
+    # Verify items inserted by a transaction that is rolled back are not indexed.
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_tracks([Track("3GDX9DpZgXsLAkXhHBQU1Q", "Chokehold", "unknown")])
+            raise RuntimeError
+    assert list(db.search("chokehold")) == []
+    assert db._con.execute("SELECT COUNT() FROM search_queue").fetchone() == (0,)
+
+
+def test_loadArrays(tmp_path):
+    """
+    Test `load_arrays` by checking the dictionary encoded and nullable columns.
+    """
+    np = pytest.importorskip("numpy")
+
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Function under test with a small chunk size to cover multiple chunks.
+    arrays, dictionaries = db.load_arrays(
+        "tracks", ["id", "album_id", "rating"], chunk_size=3
+    )
+
+    # Verify the text columns decode to the original values in table order.
+    ids = dictionaries["id"][arrays["id"]]
+    assert ids[0] == "15eQh5ZLBoMReY20MDG37T"
+    assert len(ids) == 7
+    assert len(dictionaries["album_id"]) == 4
+    assert arrays["album_id"].dtype == np.int32
+    assert list(arrays["album_id"][:2]) == [0, 0]
+
+    # Verify NULL ratings are loaded as NaN.
+    assert arrays["rating"].dtype == np.float64
+    assert np.isnan(arrays["rating"][2])
+    assert np.nansum(arrays["rating"]) == 1
+
+    # Verify the non-null integer columns keep their type.
+    arrays, dictionaries = db.load_arrays("albums", ["time_fetched"])
+    assert arrays["time_fetched"].dtype == np.int64
+    assert dictionaries == {}
+
+    # Verify unknown columns are rejected.
+    with pytest.raises(ValueError):
+        db.load_arrays("tracks", ["id; DROP TABLE tracks"])
+
+
+def test_loadArrow(tmp_path):
+    """
+    Test `load_arrow` by checking the types and values of the Arrow table.
+    """
+    pa = pytest.importorskip("pyarrow")
+
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+
+    # Function under test.
+    table = db.load_arrow("tracks", ["album_id", "rating"])
+
+    # Verify the types and values.
+    assert pa.types.is_dictionary(table.schema.field("album_id").type)
+    assert table.schema.field("rating").type == pa.int64()
+    assert table.column("rating").null_count == 1
+    assert table.column("rating").to_pylist()[:3] == [1, 1, None]
+    assert table.column("album_id").to_pylist()[0] == "1GLmxzF8g5p0fcdAatGq5Y"
+
+
+def test_ratingSummaries(tmp_path):
+    """
+    Test the rating summaries are maintained incrementally and match a full rebuild.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    cur = db._con.cursor()
+
+    def read_summaries():
+        albums = cur.execute("SELECT * FROM album_ratings ORDER BY album_id").fetchall()
+        artists = cur.execute(
+            "SELECT * FROM artist_ratings ORDER BY artist_id"
+        ).fetchall()
+        return albums, artists
+
+    # Insert tracks before their albums, like `insert_items_from_playlist`.
+    tracks = [
+        Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg"),
+        Track("5xyv86cHra90", "Auctioneer", "1B5sG6YCOqg"),
+        Track("IpSypn32TH6uCi", "End", "lv5djSYqp0X"),
+    ]
+    with db.transaction():
+        db.insert_tracks(tracks, rating=1)
+        db.insert_albums([Album("1B5sG6YCOqg", "The Beginning", "0gJ0dOw0r6d")])
+
+    # Verify only the album that is known counts toward the artist.
+    album_rows = cur.execute(
+        "SELECT num_tracks, num_liked FROM album_ratings"
+    ).fetchall()
+    assert sorted(album_rows) == [(1, 1), (2, 2)]
+    cmd = "SELECT num_tracks, num_liked, mean_rating FROM artist_ratings"
+    assert cur.execute(cmd).fetchall() == [(2, 2, 1.0)]
+
+    # Insert the other album and change some ratings.
+    with db.transaction():
+        db.insert_albums([Album("lv5djSYqp0X", "The End", "0gJ0dOw0r6d")])
+        db.insert_tracks(tracks[:1], rating=-1)
+        db.insert_tracks(tracks[1:2], rating=0)
+        db.insert_tracks([Track("a90CtItbROxdl", "Depravity", "lv5djSYqp0X")])
+    cmd = """
+    SELECT num_tracks, num_rated, num_liked, num_neutral, num_disliked, score
+      FROM artist_ratings
+    """
+    assert cur.execute(cmd).fetchall() == [(4, 3, 1, 1, 1, 0)]
+
+    # Delete a track.
+    cur.execute("DELETE FROM tracks WHERE id = 'IpSypn32TH6uCi'")
+
+    # Verify the incremental summaries match a full rebuild.
+    incremental = read_summaries()
+    with db.transaction():
+        db.rebuild()
+    assert read_summaries() == incremental
+
+
+def test_audioFeatures(tmp_path):
+    """
+    Test tracks without audio features are read in batches and skipped once inserted.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+    assert db.count_tracks_without_features() == 7
+
+    # Function under test with a small batch size to cover multiple batches.
+    batches = list(db.iter_tracks_without_features(batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+    # Insert features for the first batch, with one track without features.
+    features = {track_id: {"tempo": 120.0, "energy": 0.5} for track_id in batches[0]}
+    features[batches[0][0]] = None
+    with db.transaction():
+        db.insert_audio_features(features)
+
+    # Verify only the other tracks are left, and the missing features are stored as NULL.
+    assert db.count_tracks_without_features() == 4
+    remaining = [id_ for batch in db.iter_tracks_without_features() for id_ in batch]
+    assert remaining == batches[1] + batches[2]
+    cmd = "SELECT tempo, key, time_fetched FROM audio_features WHERE track_id = ?"
+    assert db._con.execute(cmd, (batches[0][0],)).fetchone()[:2] == (None, None)
+    tempo, key, time_fetched = db._con.execute(cmd, (batches[0][1],)).fetchone()
+    assert (tempo, key) == (120.0, None)
+    assert time_fetched > 0
+
+
+def test_getItemsToFetch(tmp_path):
+    """
+    Test artists and albums to fetch are ordered by their liked tracks and recency.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+    with db.transaction():
+        db.insert_artists([Artist("new", "New")])
+        db.insert_albums([Album("new_album", "New Album", "new")])
+        db.update_artist_time_fetched(Artist("7bDLHytU8vohbiWbePGrRU", "Falsifier"))
+
+    # Function under test for artists. The artist without ratings ranks above the disliked
+    # artist, and fetched artists are skipped.
+    artists = db.get_artists_to_fetch()
+    assert [artist.id for artist in artists] == [
+        "7z9n8Q0icbgvXqx1RWoGrd",
+        "new",
+        "4UgQ3EFa8fEeaIEg54uV5b",
+    ]
+    assert [artist.id for artist in db.get_artists_to_fetch(limit=1)] == [
+        "7z9n8Q0icbgvXqx1RWoGrd"
+    ]
+
+    # Function under test for albums. Albums of the same artist are ordered by their own
+    # liked tracks.
+    albums = db.get_albums_to_fetch()
+    assert [album.id for album in albums] == [
+        "1GLmxzF8g5p0fcdAatGq5Y",
+        "0a40snAsSiU0fSBrba93YB2",
+        "0a40snAsSiU0fSBrba93YB",
+        "new_album",
+        "7hkhFnClNPmRXL20KqdzSO",
+    ]
+    assert len(db.get_albums_to_fetch(limit=2)) == 2
+
+
+def test_knownIds(tmp_path):
+    """
+    Test inserts skip items with known ids before reaching the database, looking up only the
+    ids of each batch, and the known ids follow commits and rollbacks.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    with db.transaction():
+        db.insert_artists([Artist("a0", "Artist 0")])
+    assert db.known_ids("artists", ["a0", "a1"]) == {"a0"}
+
+    # Function under test. Known artists are skipped, including those inserted earlier in the
+    # transaction.
+    rows = []
+    executemany = db._executemany
+
+    def spy(cmd, data):
+        rows.append(list(data))
+        return executemany(cmd, rows[-1])
+
+    db._executemany = spy
+    with db.transaction():
+        db.insert_artists([Artist("a0", "Artist 0"), Artist("a1", "Artist 1")])
+        db.insert_artists([Artist("a1", "Artist 1")])
+        assert db.known_ids("artists", ["a0", "a1"]) == {"a0", "a1"}
+    assert rows == [[("a1", "Artist 1")]]
+
+    # Verify ids of a rolled back transaction are inserted again.
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_artists([Artist("a2", "Artist 2")])
+            raise RuntimeError
+    assert db.known_ids("artists", ["a2"]) == set()
+    with db.transaction():
+        db.insert_artists([Artist("a2", "Artist 2")])
+    assert [artist.id for artist in db.get_artists()] == ["a0", "a1", "a2"]
+
+    # Verify lookups of more ids than the variable limit are split.
+    ids = [f"a{i}" for i in range(2 * dut.MAX_VARIABLES)]
+    assert db.known_ids("artists", ids) == {"a0", "a1", "a2"}
+
+    # Verify rated tracks are always written, since their rating is updated.
+    rows.clear()
+    inserted = metrics.ROWS_INSERTED.value(table="tracks")
+    with db.transaction():
+        db.insert_tracks([Track("t0", "Track 0", "album")])
+        db.insert_tracks([Track("t0", "Track 0", "album")], rating=1)
+        db.insert_tracks([Track("t0", "Track 0", "album")])
+        db.insert_tracks([Track("t1", "Track 1", "album")], rating=1)
+    assert len(rows) == 3
+    assert db.get_tracks()[0].rating == 1
+
+    # Verify only new rows are counted as inserted, not updated ratings.
+    assert metrics.ROWS_INSERTED.value(table="tracks") - inserted == 2
+
+
+def test_encodeId():
+    """
+    Test `encode_id` and `decode_id` round trip Spotify ids and other ids.
+    """
+    # Spotify ids are stored in 16 bytes.
+    for id_ in [
+        "15eQh5ZLBoMReY20MDG37T",
+        "0000000000000000000000",
+        "7N2pMTgPDbqMxXxz1ASQSa",
+    ]:
+        value = dut.encode_id(id_)
+        assert len(value) == 16
+        assert dut.decode_id(value) == id_
+
+    # Other ids, including those that are too large for 16 bytes, are stored in any other
+    # length.
+    for id_ in [
+        "t0",
+        "x" * 15,
+        "x" * 16,
+        "15eQh5ZLBoMReY20MDG37T2",
+        "Z" * 22,
+        "ünïcode",
+    ]:
+        value = dut.encode_id(id_)
+        assert len(value) != 16
+        assert dut.decode_id(value) == id_
+
+    # Text ids are returned unchanged.
+    assert dut.decode_id("t0") == "t0"
+
+
+def get_library_state(db):
+    """
+    Returns the representation of the results of queries over the library, which should not
+    depend on the id format.
+    """
+    state = {
+        "tracks": db.get_tracks(),
+        "albums": list(db.query_albums("Falsifier")),
+        "artists": list(db.query_artists(top_rated=True)),
+        "by_artist": list(db.query_tracks("7bDLHytU8vohbiWbePGrRU")),
+        "by_id": db.get_tracks_by_id(["2GDX9DpZgXsLAkXhHBQU1Q", "missing"]),
+        "search": list(db.search("choke")),
+        "rows": next(db.iter_rows("albums")),
+    }
+    return repr(state)
+
+
+def test_migrateIds(tmp_path):
+    """
+    Test `migrate_ids` converts the ids of all tables to binary and back without changing the
+    results of queries.
+    """
+    # Create a new temporary database with text ids.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    insert_rated_library(db._con.cursor())
+    with db.transaction():
+        db.index_queued_items()
+    assert db.id_format == "text"
+    expected = get_library_state(db)
+
+    # Function under test.
+    assert db.migrate_ids("binary")
+
+    # Verify the ids are stored as BLOBs and read back as text.
+    assert db.id_format == "binary"
+    assert db.get_column_types("tracks")["album_id"] == (dut.BINARY_ID_TYPE, False)
+    types = db._con.execute("SELECT DISTINCT typeof(id) FROM tracks").fetchall()
+    assert types == [("blob",)]
+    assert get_library_state(db) == expected
+    assert db.migrate_ids("binary") is False
+
+    # Verify inserts and the triggers use the binary ids.
+    with db.transaction():
+        db.insert_tracks(
+            [Track("3GDX9DpZgXsLAkXhHBQU1Q", "Chokehold", "0a40snAsSiU0fSBrba93YB")]
+        )
+        db.update_album_time_fetched(
+            Album("0a40snAsSiU0fSBrba93YB", "World Demise", "")
+        )
+    assert len(list(db.search("chokehold"))) == 1
+    albums = [album.id for album in db.get_albums_to_fetch()]
+    assert "0a40snAsSiU0fSBrba93YB" not in albums
+    assert len(albums) == 3
+    counts = {
+        album.id: summary.num_tracks for album, summary in db.query_albums("Falsifier")
+    }
+    assert counts["0a40snAsSiU0fSBrba93YB"] == 3
+
+    # Verify a new database cannot be initialized in another format.
+    with pytest.raises(ValueError):
+        db.create_tables(id_format="text")
+
+    # Verify converting back gives text ids.
+    assert db.migrate_ids("text")
+    types = db._con.execute("SELECT DISTINCT typeof(id) FROM tracks").fetchall()
+    assert types == [("text",)]
+    assert db.get_tracks_by_id(["3GDX9DpZgXsLAkXhHBQU1Q"])
+
+
+def test_createTables_binaryIds(tmp_path):
+    """
+    Test a database created with binary ids stores items through every insert.
+    """
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables(id_format="binary")
+
+    with db.transaction():
+        db.insert_artists([Artist("7bDLHytU8vohbiWbePGrRU", "Falsifier")])
+        db.insert_albums([Album("a0", "Album", "7bDLHytU8vohbiWbePGrRU")])
+        db.insert_tracks([Track("t0", "Track 0", "a0")], rating=1)
+        db.insert_audio_features({"t0": {"tempo": 120.0}})
+        db.insert_artist_metadata({"7bDLHytU8vohbiWbePGrRU": {"name": "Falsifier"}})
+        db.push_frontier([Artist("7z9n8Q0icbgvXqx1RWoGrd", "FRCTRD")], 1, 0.5)
+
+    # Verify the items read back with their ids.
+    assert dut.Database(tmp_path / "test.db").id_format == "binary"
+    assert [track.id for track in db.get_tracks()] == ["t0"]
+    assert db.get_rating_changes() == ["t0"]
+    assert db.get_artist_score("7bDLHytU8vohbiWbePGrRU", 0) == 1.0
+    assert db.get_artist_metadata("7bDLHytU8vohbiWbePGrRU")["name"] == "Falsifier"
+    artist, depth, _ = db.get_frontier_head(2)
+    assert (artist.id, depth) == ("7z9n8Q0icbgvXqx1RWoGrd", 1)
+    playlist = Playlist()
+    playlist.add_track(Track("t0", "Track 0", "a0"))
+    with db.transaction():
+        assert db.get_rating_scores(0, ["t0"]) == []
+        counts, tracks = db.diff_playlist(playlist, category="rated")
+    assert counts["num_rated_tracks"] == 1
+    assert [track.id for track in tracks] == ["t0"]
+
+
+def test_changes(tmp_path):
+    """
+    Test the journal of changes records inserts, value updates, and renames in order, and
+    compaction keeps the latest change of each item.
+    """
+    # Create a new temporary database.
+    db = dut.Database(tmp_path / "test.db")
+    db.create_tables()
+    with db.transaction():
+        db.insert_artists([Artist("a0", "Artist 0")])
+        db.insert_albums([Album("b0", "Album 0", "a0")])
+        db.insert_tracks([Track("t0", "Track 0", "b0")])
+        db.insert_tracks([Track("t0", "Track 0", "b0")], rating=1)
+        db.insert_tracks([Track("t0", "Track 0", "b0")], rating=1)
+        db.update_album_time_fetched(Album("b0", "Album 0", "a0"))
+        db.insert_artist_metadata({"a0": {"name": "Renamed"}})
+
+    # Function under test.
+    changes = [row for rows in db.iter_changes(chunk_size=2) for row in rows]
+
+    # Verify each change and that unchanged ratings are not recorded.
+    assert [row[:7] for row in changes] == [
+        (1, "artist", "a0", "insert", "Artist 0", None, 0),
+        (2, "album", "b0", "insert", "Album 0", "a0", 0),
+        (3, "track", "t0", "insert", "Track 0", "b0", None),
+        (4, "track", "t0", "update", None, None, 1),
+        (5, "album", "b0", "update", None, None, changes[4][6]),
+        (6, "artist", "a0", "rename", "Renamed", None, None),
+    ]
+    assert changes[4][6] > 0
+
+    # Verify reading from a sequence number with a limit.
+    changes = [row for rows in db.iter_changes(since=2, limit=3) for row in rows]
+    assert [row[0] for row in changes] == [3, 4, 5]
+
+    # Function under test for compaction.
+    with db.transaction():
+        db.insert_tracks([Track("t0", "Track 0", "b0")], rating=-1)
+        db.insert_tracks([Track("t0", "Track 0", "b0")], rating=0)
+        assert db.compact_changes(until=7) == 2
+        assert db.compact_changes() == 0
+
+    # Verify the superseded updates were deleted and numbering continues after them.
+    changes = [row for rows in db.iter_changes() for row in rows]
+    assert [row[0] for row in changes] == [1, 2, 3, 5, 6, 8]
+    assert changes[-1][6] == 0
+    with db.transaction():
+        db.compact_changes()
+        db.insert_artists([Artist("a1", "Artist 1")])
+    assert [row[0] for rows in db.iter_changes(since=8) for row in rows] == [9]
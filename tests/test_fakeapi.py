@@ -0,0 +1,415 @@
+import threading
+
+import pytest
+import requests
+
+from musicmanager import fakeapi as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Artist, Track
+from musicmanager.spotify import Spotify
+from musicmanager.synthetic import SyntheticLibrary
+from musicmanager.transfer import export_library
+
+
+@pytest.fixture
+def start_server():
+    """
+    Fixture to start fake API servers on free ports. The servers are shut down after the test.
+    """
+    servers = []
+
+    def start(catalog, **kwargs):
+        server = dut.FakeSpotifyServer(("127.0.0.1", 0), catalog, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_getPlaylist(start_server):
+    """
+    Test the playlist endpoint through `Spotify.get_playlist` across several pages.
+    """
+    library = SyntheticLibrary(500, tracks_per_album=10, albums_per_artist=5)
+    catalog = dut.SyntheticCatalog(library, playlist_size=120)
+    server = start_server(catalog)
+    api = Spotify("sample", api_url=server.api_url)
+
+    # Function under test.
+    playlist = api.get_playlist("playlist1")
+
+    # Verify the second playlist was fetched in three pages.
+    assert [track.id for track in playlist.tracks] == [
+        library.track_id(i) for i in range(120, 240)
+    ]
+    assert len(playlist.albums) == 12
+    assert playlist.artists[0].id == library.artist_id(2)
+    assert server.num_requests == 3
+
+    # Verify tracks to skip are left out with their albums and artists.
+    skip = {library.track_id(i) for i in range(120, 230)}
+    playlist = api.get_playlist("playlist1", skip_track_ids=skip.intersection)
+    assert [track.id for track in playlist.tracks] == [
+        library.track_id(i) for i in range(230, 240)
+    ]
+    assert [album.id for album in playlist.albums] == [library.album_id(23)]
+
+    # Verify unknown playlists are not found.
+    assert api.get_playlist("unknown") is None
+
+
+def test_getArtistAlbums(start_server):
+    """
+    Test the artist albums endpoint through `Spotify.get_artist_albums` across several pages.
+    """
+    library = SyntheticLibrary(1200, tracks_per_album=10, albums_per_artist=120)
+    server = start_server(dut.SyntheticCatalog(library))
+    api = Spotify("sample", api_url=server.api_url)
+
+    albums = api.get_artist_albums(Artist(library.artist_id(0), "Artist 0"))
+
+    assert [album.id for album in albums] == [library.album_id(i) for i in range(120)]
+    assert server.num_requests == 3
+
+
+def test_paginationLimits(start_server):
+    """
+    Test the server rejects requests without a token or with a limit above the maximum.
+    """
+    library = SyntheticLibrary(100)
+    server = start_server(dut.SyntheticCatalog(library))
+    url = f"{server.api_url}/playlists/playlist0/tracks"
+    headers = {"Authorization": "Bearer sample"}
+
+    assert requests.get(url).status_code == 401
+    assert requests.get(url, headers=headers, params={"limit": 51}).status_code == 400
+
+    response = requests.get(url, headers=headers, params={"offset": 90, "limit": 50})
+    data = response.json()
+    assert len(data["items"]) == 10
+    assert data["total"] == 100
+    assert data["next"] is None
+
+
+def test_throttling(start_server):
+    """
+    Test throttled requests are retried by the Spotify interface until they succeed.
+    """
+    library = SyntheticLibrary(200, tracks_per_album=10, albums_per_artist=2)
+    catalog = dut.SyntheticCatalog(library, playlist_size=200)
+    server = start_server(catalog, throttle_rate=0.5, retry_after=0, seed=1)
+    api = Spotify("sample", api_url=server.api_url, max_retries=20)
+
+    playlist = api.get_playlist("playlist0")
+
+    assert len(playlist.tracks) == 200
+    assert server.num_throttled > 0
+    assert server.num_requests == 4 + server.num_throttled
+
+
+@pytest.mark.parametrize("id_format", ["text", "binary"])
+def test_fetch(start_server, tmp_path, id_format):
+    """
+    Test the `add` and `fetch` commands end to end against the fake server, with ids stored in
+    each format.
+    """
+    library = SyntheticLibrary(100, tracks_per_album=10, albums_per_artist=5)
+    catalog = dut.SyntheticCatalog(library, playlist_size=10)
+    server = start_server(catalog, latency=0.001, jitter=0.001)
+
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init", "--id-format", id_format])
+    args = ["--token", "sample", "--api-url", server.api_url]
+    app.run(["add", "--playlist-id", "playlist0", *args])
+    app.run(["fetch", *args])
+
+    # The first playlist is one album, which leads to the other albums of its artist.
+    assert len(app.db.get_artists()) == 1
+    assert len(app.db.get_albums()) == 5
+    assert len(app.db.get_tracks()) == 50
+    assert app.db.get_tracks()[0].id == library.track_id(0)
+
+
+def test_recordedCatalog(start_server, tmp_path):
+    """
+    Test serving a library exported as JSON Lines.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    app.db.create_tables()
+    library = SyntheticLibrary(30, tracks_per_album=10, albums_per_artist=3)
+    with app.db.transaction():
+        app.db.insert_tracks(list(library.iter_tracks())[:5], rating=1)
+        app.db.insert_tracks(list(library.iter_tracks())[5:])
+        app.db.insert_albums(list(library.iter_albums()))
+        app.db.insert_artists(list(library.iter_artists()))
+    export_library(app.db, tmp_path / "export")
+
+    server = start_server(dut.RecordedCatalog(tmp_path / "export"))
+    api = Spotify("sample", api_url=server.api_url)
+
+    assert len(api.get_playlist("library").tracks) == 30
+    assert len(api.get_playlist("liked").tracks) == 5
+    album = api.get_artist_albums(library.artist(0))[1]
+    assert [track.id for track in api.get_album_tracks(album)] == [
+        library.track_id(i) for i in range(10, 20)
+    ]
+
+
+def test_fetchFeatures(start_server, tmp_path):
+    """
+    Test the `fetch-features` command requests batches of tracks and only fetches tracks
+    without features.
+    """
+    library = SyntheticLibrary(250, tracks_per_album=10, albums_per_artist=5)
+    catalog = dut.SyntheticCatalog(library, playlist_size=250)
+    server = start_server(catalog, latency=0.001)
+
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    args = ["--token", "sample", "--api-url", server.api_url]
+    app.run(["add", "--playlist-id", "playlist0", *args])
+    with app.db.transaction():
+        app.db.insert_tracks([Track("nofeatures0", "Unanalyzed", library.album_id(0))])
+
+    # Function under test with 251 tracks in 3 batches.
+    num_requests = server.num_requests
+    app.run(["fetch-features", "--workers", "2", *args])
+    assert server.num_requests - num_requests == 3
+
+    # Verify every track has a row and the unanalyzed track has no features.
+    rows = dict(
+        app.db._con.execute("SELECT track_id, tempo FROM audio_features").fetchall()
+    )
+    assert len(rows) == 251
+    assert rows["nofeatures0"] is None
+    expected = dut.audio_features_json(library.track_id(0))["tempo"]
+    assert rows[library.track_id(0)] == expected
+
+    # Verify nothing is requested again.
+    num_requests = server.num_requests
+    app.run(["fetch-features", *args])
+    assert server.num_requests == num_requests
+
+
+def test_discover(start_server, tmp_path):
+    """
+    Test the `discover` command crawls related artists in order of priority within the depth
+    and budget limits, and continues from the frontier on the next run.
+    """
+    library = SyntheticLibrary(200, tracks_per_album=10, albums_per_artist=2)
+    server = start_server(dut.SyntheticCatalog(library))
+
+    # Start from a liked artist and a disliked artist of the library.
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    with app.db.transaction():
+        for index, rating in [(0, 1), (5, -1)]:
+            album = library.album(library.album_indexes(index)[0])
+            app.db.insert_artists([library.artist(index)])
+            app.db.insert_albums([album])
+            app.db.insert_tracks(
+                [Track(f"track{index}", "Track", album.id)], rating=rating
+            )
+    args = ["--token", "sample", "--api-url", server.api_url]
+
+    def crawled():
+        cmd = "SELECT artist_id FROM crawled_artists ORDER BY time_crawled, rowid"
+        return [row[0] for row in app.db._con.execute(cmd)]
+
+    def priorities():
+        cmd = "SELECT artist_id, priority FROM frontier"
+        return dict(app.db._con.execute(cmd).fetchall())
+
+    # Function under test with a budget of one artist, which crawls the liked artist first.
+    app.run(["discover", "--depth", "1", "--budget", "1", *args])
+    assert crawled() == [library.artist_id(0)]
+    assert server.num_requests == 1
+    assert app.db.count_rows("artists") == 6
+
+    # Function under test with a depth of one, which only crawls the library artists.
+    app.run(["discover", "--depth", "1", "--budget", "10", *args])
+    assert crawled() == [library.artist_id(0), library.artist_id(5)]
+    assert server.num_requests == 2
+    assert app.db.count_rows("artists") == 10
+
+    # Verify related artists rank by the scores of the artists that led to them.
+    frontier = priorities()
+    assert frontier[library.artist_id(1)] == pytest.approx(1 / 3)
+    assert frontier[library.artist_id(4)] == pytest.approx(-1 / 3)
+
+    # Function under test with a larger depth, which crawls the best related artist. Its
+    # priority is passed on with decay, since it has no ratings.
+    app.run(["discover", "--depth", "2", "--budget", "1", *args])
+    assert crawled()[-1] == library.artist_id(1)
+    frontier = priorities()
+    assert library.artist_id(0) not in frontier
+    assert frontier[library.artist_id(2)] == pytest.approx(1 / 3 + 1 / 6)
+    assert frontier[library.artist_id(3)] == pytest.approx(-1 / 3 + 1 / 6)
+
+
+def test_fetch_budget(start_server, tmp_path):
+    """
+    Test the `fetch` command with a budget only fetches the artist and album with the most
+    liked tracks.
+    """
+    library = SyntheticLibrary(100, tracks_per_album=10, albums_per_artist=2)
+    server = start_server(dut.SyntheticCatalog(library))
+
+    # Add every artist, and like a track of one that is neither first nor last.
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    album = library.album_indexes(2)[1]
+    with app.db.transaction():
+        app.db.insert_artists(library.iter_artists())
+        app.db.insert_albums([library.album(album)])
+        app.db.insert_tracks([library.track(library.track_indexes(album)[0])], rating=1)
+
+    # Function under test.
+    args = ["--token", "sample", "--api-url", server.api_url]
+    app.run(["fetch", "--budget", "1", *args])
+
+    # Verify one request for the liked artist and one for its unfetched album.
+    assert server.num_requests == 2
+    fetched = [artist.id for artist in app.db.get_artists() if artist.time_fetched]
+    assert fetched == [library.artist_id(2)]
+    albums = [album for album in app.db.get_albums() if album.time_fetched]
+    assert [album.artist_id for album in albums] == [library.artist_id(2)]
+
+
+def test_refreshArtists(start_server, tmp_path):
+    """
+    Test the `refresh-artists` command fetches metadata in batches, updates names, and marks
+    only changed artists to have their albums fetched again.
+    """
+    library = SyntheticLibrary(600, tracks_per_album=10, albums_per_artist=1)
+    server = start_server(dut.SyntheticCatalog(library))
+
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    with app.db.transaction():
+        app.db.insert_artists([Artist(library.artist_id(0), "Old Name")])
+        app.db.insert_artists(library.iter_artists())
+        app.db.insert_artists([Artist("unknown", "Unknown")])
+        for index in (0, 1):
+            app.db.update_artist_time_fetched(library.artist(index))
+    args = ["--token", "sample", "--api-url", server.api_url]
+
+    # Function under test with 61 artists in 2 batches.
+    app.run(["refresh-artists", *args])
+    assert server.num_requests == 2
+
+    # Verify the metadata and the refreshed name.
+    expected = dut.full_artist_json(library.artist(0))
+    assert app.db.get_artist_metadata(library.artist_id(0)) == {
+        "name": library.artist(0).name,
+        "genres": sorted(expected["genres"]),
+        "popularity": expected["popularity"],
+        "followers": expected["followers"]["total"],
+    }
+    assert app.db.get_artist_metadata("unknown")["name"] is None
+    names = {artist.id: artist.name for artist in app.db.get_artists()}
+    assert names[library.artist_id(0)] == library.artist(0).name
+    assert names["unknown"] == "Unknown"
+
+    # Verify recent metadata is not requested again.
+    app.run(["refresh-artists", *args])
+    assert server.num_requests == 2
+
+    # Make the metadata of every artist stale, the genres of the first artist different, and
+    # the popularity of the second artist different.
+    with app.db.transaction():
+        app.db._execute(
+            "UPDATE artist_metadata SET genres = '[]' WHERE artist_id = ?",
+            (library.artist_id(0),),
+        )
+        app.db._execute(
+            "UPDATE artist_metadata SET popularity = -1 WHERE artist_id = ?",
+            (library.artist_id(1),),
+        )
+        app.db._execute("UPDATE artist_metadata SET time_fetched = 1")
+
+    # Function under test. Only the artist with changed genres is marked to be fetched again.
+    app.run(["refresh-artists", "--batch-size", "40", *args])
+    assert server.num_requests == 4
+    fetched = {artist.id: artist.time_fetched for artist in app.db.get_artists()}
+    assert fetched[library.artist_id(0)] == 0
+    assert fetched[library.artist_id(1)] > 0
+
+
+def test_exportPlaylist(start_server, tmp_path):
+    """
+    Test the `export-playlist` command only writes the difference in batches of 100 tracks and
+    keeps the liked tracks in order.
+    """
+    library = SyntheticLibrary(300, tracks_per_album=10, albums_per_artist=5)
+    server = start_server(dut.SyntheticCatalog(library, playlist_size=150))
+
+    # Like tracks that overlap the second part of the playlist.
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    with app.db.transaction():
+        tracks = [library.track(i) for i in range(100, 280)]
+        app.db.insert_tracks(tracks, rating=1)
+    args = ["--token", "sample", "--api-url", server.api_url]
+    argv = ["export-playlist", "--playlist-id", "playlist0", "--workers", "2", *args]
+
+    # Function under test, which reads 3 pages, removes 100 tracks, and adds 130 tracks.
+    app.run(argv)
+    assert server.num_requests == 3 + 1 + 2
+    assert server.playlists["playlist0"] == list(range(100, 280))
+
+    # Verify nothing is written when the playlist is up to date.
+    num_requests = server.num_requests
+    app.run(argv)
+    assert server.num_requests - num_requests == 4
+    assert server.playlists["playlist0"] == list(range(100, 280))
+
+    # Verify a limit removes the tracks past it.
+    app.run([*argv, "--limit", "10"])
+    assert server.playlists["playlist0"] == list(range(100, 110))
+
+
+def test_run_diff(start_server, tmp_path, capsys):
+    """
+    Test the `diff` command counts the new and known items of a playlist without adding them.
+    """
+    library = SyntheticLibrary(300, tracks_per_album=10, albums_per_artist=5)
+    server = start_server(dut.SyntheticCatalog(library, playlist_size=150))
+
+    # Add the first 100 tracks of the playlist, of which 10 are rated.
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    with app.db.transaction():
+        app.db.insert_tracks([library.track(i) for i in range(10)], rating=1)
+        app.db.insert_tracks([library.track(i) for i in range(10, 100)])
+        app.db.insert_albums([library.album(i) for i in range(10)])
+        app.db.insert_artists([library.artist(i) for i in range(2)])
+
+    # Function under test.
+    args = ["--token", "sample", "--api-url", server.api_url]
+    app.run(["diff", "--playlist-id", "playlist0", "--list", "rated", *args])
+
+    # Verify the counts and the listed tracks.
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:9] == [
+        "150 tracks",
+        "    50 new",
+        "    100 in library",
+        "        10 rated",
+        "        90 unrated",
+        "15 albums",
+        "    5 new",
+        "3 artists",
+        "    1 new",
+    ]
+    assert lines[9:] == [f"{library.track_id(i)}\t1\tTrack {i}" for i in range(10)]
+
+    # Verify nothing was added.
+    assert app.db.count_rows("tracks") == 100
+    assert app.db.count_rows("albums") == 10
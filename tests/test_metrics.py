@@ -0,0 +1,136 @@
+import urllib.request
+
+import requests_mock
+
+from musicmanager import metrics as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.database import Database
+from musicmanager.item import Artist
+from musicmanager.spotify import Spotify, endpoint_label
+
+
+def test_registry_render():
+    """
+    Test `render` writes counters and histograms in the Prometheus text format.
+    """
+    registry = dut.Registry()
+    counter = registry.counter("test_total", "Test counter", ["kind"])
+    histogram = registry.histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+
+    # Record some values.
+    counter.inc(kind="a")
+    counter.inc(2, kind="b")
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    # Function under test.
+    text = registry.render()
+
+    # Verify the metadata and samples.
+    lines = text.splitlines()
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{kind="a"} 1' in lines
+    assert 'test_total{kind="b"} 2' in lines
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_seconds_sum 5.55" in lines
+    assert "test_seconds_count 3" in lines
+
+    # Values are summed over labels that are not given.
+    assert counter.value() == 3
+    assert counter.value(kind="b") == 2
+    assert histogram.count() == 3
+
+
+def test_registry_serve():
+    """
+    Test `serve` responds with the rendered metrics.
+    """
+    registry = dut.Registry()
+    registry.counter("test_total", "Test counter").inc()
+
+    # Function under test on an ephemeral port.
+    server = registry.serve(0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert "test_total 1" in text.splitlines()
+
+
+def test_spotify_metrics():
+    """
+    Test requests are counted by endpoint and status, including retries.
+    """
+    api = Spotify("sample")
+    artist = Artist("artist", "Artist")
+    endpoint = "/artists/{id}/albums"
+    assert endpoint_label("/artists/artist/albums") == endpoint
+
+    requests_before = dut.REQUESTS.value(endpoint=endpoint)
+    retries_before = dut.RETRIES.value(endpoint=endpoint)
+    bytes_before = dut.RESPONSE_BYTES.value(endpoint=endpoint)
+    duration_before = dut.REQUEST_DURATION.count(endpoint=endpoint)
+
+    with requests_mock.Mocker() as mock:
+        mock.get(
+            "https://api.spotify.com/v1/artists/artist/albums",
+            [
+                {"status_code": 429, "headers": {"Retry-After": "0"}},
+                {"json": {"items": [], "total": 0}},
+            ],
+        )
+        # Function under test.
+        api.get_artist_albums(artist)
+
+    # Verify both responses were counted and one retry.
+    assert dut.REQUESTS.value(endpoint=endpoint) - requests_before == 2
+    assert dut.REQUESTS.value(endpoint=endpoint, status=429) >= 1
+    assert dut.RETRIES.value(endpoint=endpoint) - retries_before == 1
+    assert dut.RESPONSE_BYTES.value(endpoint=endpoint) > bytes_before
+    assert dut.REQUEST_DURATION.count(endpoint=endpoint) - duration_before == 2
+
+
+def test_database_metrics(tmp_path):
+    """
+    Test rows written and commits are counted.
+    """
+    db = Database(tmp_path / "test.db")
+    db.create_tables()
+
+    rows_before = dut.ROWS_WRITTEN.value(table="artists")
+    commits_before = dut.TRANSACTIONS.value(result="commit")
+    durations_before = dut.COMMIT_DURATION.count()
+
+    # Function under test. The duplicate artist is not written.
+    with db.transaction():
+        db.insert_artists([Artist("a", "A"), Artist("b", "B"), Artist("a", "A")])
+
+    assert dut.ROWS_WRITTEN.value(table="artists") - rows_before == 2
+    assert dut.TRANSACTIONS.value(result="commit") - commits_before == 1
+    assert dut.COMMIT_DURATION.count() - durations_before == 1
+
+
+def test_run_metrics(tmp_path, capsys):
+    """
+    Test the `--metrics` option writes the metrics at the end of any command.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+
+    # Function under test writing to a file.
+    path = tmp_path / "metrics.prom"
+    app.run(["--metrics", str(path), "init"])
+    assert "# TYPE musicmanager_commit_duration_seconds histogram" in path.read_text()
+
+    # Function under test printing.
+    app.run(["--metrics", "-", "show"])
+    captured = capsys.readouterr()
+    assert "0 tracks" in captured.out
+    assert "# TYPE musicmanager_requests_total counter" in captured.out
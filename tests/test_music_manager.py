@@ -1,7 +1,12 @@
+import json
+import os
+import subprocess
+import sys
+
 import requests_mock
 
 from musicmanager import core as dut
-from musicmanager.item import Album, Artist
+from musicmanager.item import Album, Artist, Track
 from musicmanager.spotify import Spotify
 
 
@@ -274,10 +279,11 @@ def test_fetchAlbums(tmp_path):
     app.api = Spotify("sample_token")
     app.db.create_tables()
 
-    # Populate artists, so we can fetch albums for these.
+    # Populate artists, so we can fetch albums for these. Without ratings, the most recently
+    # added artist is fetched first.
     artists = [Artist("0gJ0dOw0r6d", "Abyss"), Artist("aBMmJr6ROvQ", "Walker")]
     with app.db.transaction():
-        app.db.insert_artists(artists)
+        app.db.insert_artists(reversed(artists))
 
     # Limited response data for the first artist.
     response_data_1 = {
@@ -382,14 +388,15 @@ def test_fetchTracks(tmp_path):
     app.api = Spotify("sample_token")
     app.db.create_tables()
 
-    # Add some albums to the database. We will fetch tracks for these.
+    # Add some albums to the database. We will fetch tracks for these. Without ratings, the
+    # most recently added album is fetched first.
     artist_id = "0gJ0dOw0r6d"
     albums = [
         Album("1B5sG6YCOqg", "The Beginning", artist_id),
         Album("lv5djSYqp0X", "The End", artist_id),
     ]
     with app.db.transaction():
-        app.db.insert_albums(albums)
+        app.db.insert_albums(reversed(albums))
 
     # Limited response data for the first album.
     response_data_1 = {
@@ -484,3 +491,155 @@ def test_fetchTracks(tmp_path):
         assert mock.call_count == 2
         app.fetch_tracks()
         assert mock.call_count == 2
+
+
+def test_run_tracks(tmp_path, capsys):
+    """
+    Test the `tracks` command by listing the liked tracks of an artist.
+    """
+    # Create a new temporary database.
+    database_path = tmp_path / "test.db"
+    app = dut.SpotifyManager(database_path)
+    app.db.create_tables()
+
+    # Populate an album with rated tracks.
+    with app.db.transaction():
+        app.db.insert_artists([Artist("0gJ0dOw0r6d", "Abyss")])
+        app.db.insert_albums([Album("1B5sG6YCOqg", "The Beginning", "0gJ0dOw0r6d")])
+        app.db.insert_tracks([Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg")], 1)
+        app.db.insert_tracks([Track("5xyv86cHra90", "Auctioneer", "1B5sG6YCOqg")], -1)
+
+    # Function under test.
+    app.run(["tracks", "--artist", "Abyss", "--rating", "1"])
+
+    # Verify the output.
+    captured = capsys.readouterr()
+    assert captured.out == "55Ps7eQ0IpSy\t1\tBeginning\n"
+
+
+def test_run_fetch_runs(tmp_path, capsys):
+    """
+    Test `fetch` records a run with its counts, skips failed items, and the `runs` command
+    lists it.
+    """
+    # Create a new temporary database.
+    database_path = tmp_path / "test.db"
+    app = dut.SpotifyManager(database_path)
+    app.db.create_tables()
+
+    # Populate an artist that succeeds and one that fails.
+    with app.db.transaction():
+        app.db.insert_artists(
+            [Artist("0gJ0dOw0r6d", "Abyss"), Artist("missing", "Gone")]
+        )
+
+    with requests_mock.mock() as mock:
+        mock.get(
+            "https://api.spotify.com/v1/artists/0gJ0dOw0r6d/albums",
+            json={
+                "items": [{"id": "1B5sG6YCOqg", "name": "The Beginning"}],
+                "total": 1,
+            },
+        )
+        mock.get("https://api.spotify.com/v1/artists/missing/albums", status_code=404)
+        mock.get(
+            "https://api.spotify.com/v1/albums/1B5sG6YCOqg",
+            json={
+                "id": "1B5sG6YCOqg",
+                "tracks": {
+                    "items": [{"id": "55Ps7eQ0IpSy", "name": "Beginning"}],
+                    "total": 1,
+                },
+            },
+        )
+
+        # Function under test.
+        app.run(["fetch", "--token", "sample"])
+
+    # Verify the failed artist is fetched again by the next run.
+    artists = app.db.get_artists()
+    assert [artist.time_fetched > 0 for artist in artists] == [True, False]
+
+    # Verify the recorded run.
+    (run,) = app.db.query_runs()
+    assert run.command == "fetch"
+    assert run.status == "completed"
+    assert run.num_requests == 3
+    assert run.num_items_fetched == 2
+    assert run.num_rows_inserted == 2
+    assert run.num_failures == 1
+    assert run.num_rate_limited == 0
+    assert run.duration >= 0
+
+    # Verify the runs are listed individually and per week.
+    capsys.readouterr()
+    app.run(["runs"])
+    fields = capsys.readouterr().out.strip().split("\t")
+    assert fields[:2] == ["1", "fetch"]
+    assert fields[3] == "completed"
+    assert fields[6:] == ["2", "2", "3", "1", "0"]
+    app.run(["runs", "--weekly", "--command", "fetch"])
+    fields = capsys.readouterr().out.strip().split("\t")
+    assert fields[1:3] == ["fetch", "1"]
+    assert fields[4:] == ["2", "2", "3", "1", "0"]
+
+
+def test_run_lazyImports(tmp_path):
+    """
+    Test commands that do not send requests neither import `requests` nor connect to the
+    database before it is used.
+    """
+    script = """
+import sys
+from musicmanager.core import SpotifyManager
+app = SpotifyManager(sys.argv[1])
+assert app.db._connection is None
+app.run(["init"])
+app.run(["show"])
+try:
+    app.run(["--help"])
+except SystemExit:
+    pass
+print("requests" in sys.modules)
+"""
+    env = dict(
+        os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path)
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, str(tmp_path / "test.db")],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.splitlines()[-1] == "False"
+
+
+def test_run_changes(tmp_path, capsys):
+    """
+    Test the `changes` command streams changes as JSON Lines and compacts them.
+    """
+    # Create a new temporary database.
+    app = dut.SpotifyManager(tmp_path / "test.db")
+    app.db.create_tables()
+    with app.db.transaction():
+        app.db.insert_tracks([Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg")])
+        app.db.insert_tracks([Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg")], 1)
+        app.db.insert_tracks([Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg")], -1)
+
+    # Function under test.
+    app.run(["changes", "--since", "1"])
+
+    # Verify the output.
+    lines = capsys.readouterr().out.splitlines()
+    changes = [json.loads(line) for line in lines]
+    assert [change["seq"] for change in changes] == [2, 3]
+    assert changes[1]["item_id"] == "55Ps7eQ0IpSy"
+    assert changes[1]["operation"] == "update"
+    assert changes[1]["value"] == -1
+
+    # Verify compaction drops the first rating update.
+    app.run(["changes", "--compact"])
+    app.run(["changes"])
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)["seq"] for line in lines] == [1, 3]
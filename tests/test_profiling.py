@@ -0,0 +1,71 @@
+import io
+import pstats
+import time
+
+from musicmanager import profiling as dut
+from musicmanager.core import SpotifyManager
+
+
+def busy(seconds):
+    """
+    Spin for the given number of seconds so the sampling profiler has something to sample.
+    """
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    return "done"
+
+
+def test_profile_cprofile(tmp_path):
+    """
+    Test `profile` writes pstats data and a summary in the cProfile mode.
+    """
+    path = tmp_path / "run.prof"
+    stream = io.StringIO()
+
+    # Function under test.
+    result = dut.profile(lambda: busy(0.01), path, stream=stream, top=5)
+
+    # Verify the result, profile data, and summary.
+    assert result == "done"
+    stats = pstats.Stats(str(path))
+    assert any(function[2] == "busy" for function in stats.stats)
+    assert "busy" in stream.getvalue()
+
+
+def test_profile_sampling(tmp_path):
+    """
+    Test `profile` writes collapsed stacks and a summary in the sampling mode.
+    """
+    path = tmp_path / "run.collapsed"
+    stream = io.StringIO()
+
+    # Function under test with memory tracing.
+    dut.profile(lambda: busy(0.2), path, mode="sampling", memory=True, stream=stream)
+
+    # Verify each line is a stack ending with the busy function and a count.
+    lines = path.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert stack.split(";")[-1].startswith("busy ")
+    assert "Top 20 functions by self samples" in stream.getvalue()
+    assert "Top 20 allocation sites" in stream.getvalue()
+
+
+def test_run_profile(tmp_path, capsys):
+    """
+    Test the `--profile` option wraps any command.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+
+    # Function under test.
+    path = tmp_path / "show.prof"
+    app.run(["--profile", str(path), "--profile-top", "3", "show"])
+
+    # Verify the command ran and the profile was written.
+    captured = capsys.readouterr()
+    assert "0 tracks" in captured.out
+    assert "print_summary" in captured.err
+    assert path.exists()
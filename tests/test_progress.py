@@ -0,0 +1,32 @@
+import io
+
+from musicmanager import progress as dut
+
+
+def test_formatDuration():
+    """
+    Test `format_duration` with and without hours.
+    """
+    assert dut.format_duration(5) == "0:05"
+    assert dut.format_duration(125.7) == "2:05"
+    assert dut.format_duration(3725) == "1:02:05"
+
+
+def test_progress():
+    """
+    Test `Progress` writes lines with the count, rate, and ETA when not on a terminal.
+    """
+    stream = io.StringIO()
+    progress = dut.Progress(4, "Fetching", stream=stream, interval=3600)
+
+    # Function under test. Only the first update and the final progress are written.
+    for _ in range(4):
+        progress.update()
+    progress.close()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith("Fetching: 1/4 (25%) ")
+    assert lines[1].startswith("Fetching: 4/4 (100%) ")
+    assert "items/s" in lines[1]
+    assert lines[1].endswith("ETA 0:00")
@@ -0,0 +1,150 @@
+import pytest
+
+from musicmanager import recommend as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Album, Artist, Track
+from musicmanager.similarity import FEATURES
+
+pytest.importorskip("numpy")
+
+
+def create_library(db):
+    """
+    Insert tracks on a line in feature space, where the tempo and energy of track `i` grow with
+    `i`, of which the first is liked and the second disliked. A second artist has tracks without
+    features, of which the first is liked.
+    """
+    db.create_tables()
+    with db.transaction():
+        db.insert_artists([Artist("artist", "Artist")])
+        db.insert_albums([Album("album", "Album", "artist")])
+        db.insert_tracks([Track("t0", "Track 0", "album")], rating=1)
+        db.insert_tracks([Track("t1", "Track 1", "album")], rating=-1)
+        db.insert_tracks([Track(f"t{i}", f"Track {i}", "album") for i in range(2, 8)])
+        features = {}
+        for i in range(8):
+            values = {name: 0.5 for name in FEATURES}
+            values.update(tempo=100.0 + 10 * i, energy=0.1 * i)
+            features[f"t{i}"] = values
+        db.insert_audio_features(features)
+
+        db.insert_artists([Artist("other", "Other")])
+        db.insert_albums([Album("other_album", "Other Album", "other")])
+        db.insert_tracks([Track("u0", "Other 0", "other_album")], rating=1)
+        db.insert_tracks([Track(f"u{i}", f"Other {i}", "other_album") for i in (1, 2)])
+
+
+def get_scores(db):
+    """
+    Returns a dictionary of track ids to the score of their recommendation.
+    """
+    return {row[0]: row[1] for row in db.query_recommendations(limit=100)}
+
+
+def test_updateRecommendations(tmp_path):
+    """
+    Test `update_recommendations` scores all unrated tracks and combines the scores.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+
+    # Function under test.
+    assert dut.update_recommendations(app.db) == 8
+
+    # Verify each unrated track is scored and rated tracks are not.
+    rows = {row[0]: row for row in app.db.query_recommendations(limit=100)}
+    assert set(rows) == {f"t{i}" for i in range(2, 8)} | {"u1", "u2"}
+
+    # The album of the similar tracks has one liked and one disliked track, so only the
+    # similarity score sets them apart. The nearest track is closest to the disliked track.
+    assert rows["t2"][2] == pytest.approx(0.0)
+    assert rows["t2"][4] < rows["t7"][4] < 0
+
+    # Tracks without features are scored from their album and artist alone.
+    assert rows["u1"][2] == pytest.approx(1 / 3)
+    assert rows["u1"][4] is None
+    assert rows["u1"][1] == pytest.approx(1 / 3)
+    assert list(rows)[0] == "u1"
+
+
+def test_updateRecommendations_incremental(tmp_path, monkeypatch):
+    """
+    Test `update_recommendations` only scores tracks affected by rating changes and gives the
+    same scores as scoring all tracks.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+    dut.update_recommendations(app.db)
+
+    # Rate a track of the first album.
+    with app.db.transaction():
+        app.db.insert_tracks([Track("t2", "Track 2", "album")], rating=1)
+    assert app.db.get_rating_changes() == ["t2"]
+    assert "t2" not in get_scores(app.db)
+
+    # Function under test.
+    scored = []
+    get_rating_scores = app.db.get_rating_scores
+
+    def spy(prior, track_ids=None):
+        scored.append(track_ids)
+        return get_rating_scores(prior, track_ids)
+
+    monkeypatch.setattr(app.db, "get_rating_scores", spy)
+    assert dut.update_recommendations(app.db) == 5
+
+    # Verify only the rest of the album is scored again and the changes are consumed.
+    assert scored == [{f"t{i}" for i in range(3, 8)}]
+    assert app.db.get_rating_changes() == []
+    incremental = get_scores(app.db)
+
+    # Verify a full update gives the same scores.
+    dut.update_recommendations(app.db, full=True)
+    assert get_scores(app.db) == pytest.approx(incremental)
+
+    # Verify nothing is scored without changes.
+    assert dut.update_recommendations(app.db) == 0
+
+
+def test_updateRecommendations_newFeatures(tmp_path):
+    """
+    Test `update_recommendations` scores all tracks again when new audio features change the
+    feature scaling, and gives the same scores as scoring all tracks.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+    dut.update_recommendations(app.db)
+
+    # Add features for a track of the second artist, far from the other tracks.
+    with app.db.transaction():
+        values = {name: 0.5 for name in FEATURES}
+        values.update(tempo=300.0, energy=1.0)
+        app.db.insert_audio_features({"u1": values})
+
+    # Function under test.
+    assert dut.update_recommendations(app.db) == 8
+    incremental = get_scores(app.db)
+
+    # Verify a full update gives the same scores.
+    dut.update_recommendations(app.db, full=True)
+    assert get_scores(app.db) == pytest.approx(incremental)
+
+    # Verify nothing is scored once the scaling is stored.
+    assert dut.update_recommendations(app.db) == 0
+
+
+def test_run_recommend(tmp_path, capsys):
+    """
+    Test the `recommend` command lists tracks with their scores and names.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+
+    # Function under test.
+    app.run(["recommend", "--limit", "1"])
+
+    # Verify the output.
+    fields = capsys.readouterr().out.strip().split("\t")
+    assert fields[0] == "u1"
+    assert fields[1:4] == ["0.333", "0.333", "0.333"]
+    assert fields[4:] == ["", "Other 1", "Other Album", "Other"]
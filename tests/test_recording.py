@@ -0,0 +1,120 @@
+import pytest
+import requests_mock
+
+from musicmanager import recording as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Album
+from musicmanager.spotify import Spotify
+
+
+def test_recordReplay(tmp_path):
+    """
+    Test a Spotify interface replays the responses saved by a recording interface.
+    """
+    archive = tmp_path / "archive.jsonl.gz"
+    endpoint = "https://api.spotify.com/v1/albums/1B5sG6YCOqg"
+    response_data = {
+        "id": "1B5sG6YCOqg",
+        "name": "The Beginning",
+        "tracks": {
+            "items": [{"id": "55Ps7eQ0IpSy", "name": "Beginning"}],
+            "total": 1,
+        },
+    }
+    album = Album("1B5sG6YCOqg", "The Beginning", "0gJ0dOw0r6d")
+
+    # Record a rate limited request followed by a successful one.
+    api = Spotify("sample", record=archive)
+    with requests_mock.mock() as mock:
+        mock.get(
+            endpoint,
+            [
+                {"status_code": 429, "headers": {"Retry-After": "0"}},
+                {"status_code": 200, "json": response_data},
+            ],
+        )
+        tracks = api.get_album_tracks(album)
+    api.close()
+    assert [track.id for track in tracks] == ["55Ps7eQ0IpSy"]
+
+    # Replay without any mocked requests, so sending a request would fail.
+    api = Spotify(None, replay=archive)
+    with requests_mock.mock():
+        tracks = api.get_album_tracks(album)
+        assert [track.id for track in tracks] == ["55Ps7eQ0IpSy"]
+
+        # The last response is repeated for identical requests.
+        tracks = api.get_album_tracks(album)
+        assert [track.id for track in tracks] == ["55Ps7eQ0IpSy"]
+
+        # Requests that were not recorded cannot be served.
+        with pytest.raises(RuntimeError):
+            api.get_album_tracks(Album("lv5djSYqp0X", "The End", "0gJ0dOw0r6d"))
+
+
+def test_requestKey():
+    """
+    Test `request_key` does not depend on the order or type of parameters.
+    """
+    assert dut.request_key("/a", {"x": 1, "y": "2"}) == dut.request_key(
+        "/a", {"y": 2, "x": "1"}
+    )
+    assert dut.request_key("/a", None) == dut.request_key("/a", {})
+    assert dut.request_key("/a", None) != dut.request_key("/b", None)
+
+
+def test_replayFetch(tmp_path):
+    """
+    Test the `fetch` command replays a recorded run into a new database.
+    """
+    archive = tmp_path / "fetch.jsonl.gz"
+    response_data = {
+        "items": [
+            {"id": "55Eath51v7Cj", "name": "Intergalactic"},
+            {"id": "1PGRRV8bSTwi", "name": "Ruff"},
+        ],
+        "total": 2,
+    }
+
+    # Record a run where every album has a single track.
+    app = SpotifyManager(tmp_path / "record.db")
+    app.run(["init"])
+    with app.db.transaction():
+        app.db._execute(
+            "INSERT INTO artists (id, name) VALUES ('0gJ0dOw0r6d', 'Abyss')"
+        )
+    with requests_mock.mock() as mock:
+        mock.get(
+            "https://api.spotify.com/v1/artists/0gJ0dOw0r6d/albums", json=response_data
+        )
+        for item in response_data["items"]:
+            mock.get(
+                f"https://api.spotify.com/v1/albums/{item['id']}",
+                json={
+                    "id": item["id"],
+                    "tracks": {
+                        "items": [{"id": f"t{item['id']}", "name": "T"}],
+                        "total": 1,
+                    },
+                },
+            )
+        app.run(["fetch", "--token", "sample", "--record", str(archive)])
+
+    # Replay into a new database without a token.
+    replay = SpotifyManager(tmp_path / "replay.db")
+    replay.run(["init"])
+    with replay.db.transaction():
+        replay.db._execute(
+            "INSERT INTO artists (id, name) VALUES ('0gJ0dOw0r6d', 'Abyss')"
+        )
+    with requests_mock.mock():
+        replay.run(["fetch", "--replay", str(archive)])
+
+    assert [album.id for album in replay.db.get_albums()] == [
+        album.id for album in app.db.get_albums()
+    ]
+    # The most recently added album is fetched first.
+    assert [track.id for track in replay.db.get_tracks()] == [
+        "t1PGRRV8bSTwi",
+        "t55Eath51v7Cj",
+    ]
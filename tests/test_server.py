@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+
+import pytest
+import requests
+
+from musicmanager import server as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Album, Artist, Track
+
+
+@pytest.fixture
+def start_server():
+    """
+    Fixture to start query servers on free ports. The servers are shut down after the test.
+    """
+    servers = []
+
+    def start(database_path, **kwargs):
+        server = dut.QueryServer(("127.0.0.1", 0), database_path, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def create_library(app, id_format="text"):
+    """
+    Create a library of two artists with one album each, in write-ahead logging mode.
+    """
+    app.db.create_tables(id_format=id_format)
+    assert app.db.enable_wal() == "wal"
+    with app.db.transaction():
+        app.db.insert_artists([Artist("a1", "Tesseract"), Artist("a2", "Periphery")])
+        app.db.insert_albums(
+            [Album("b1", "Polaris", "a1"), Album("b2", "Juggernaut", "a2")]
+        )
+        app.db.insert_tracks([Track("t1", "Dystopia", "b1")], rating=1)
+        app.db.insert_tracks([Track("t2", "Tourniquet", "b1")], rating=-1)
+        app.db.insert_tracks([Track("t3", "Alpha", "b2"), Track("t4", "Omega", "b2")])
+        app.db.insert_recommendations(
+            [
+                ("t3", 0.5, 0.5, 0.5, None, None),
+                ("t4", 0.25, 0.25, 0.25, None, None),
+            ]
+        )
+
+
+@pytest.mark.parametrize("id_format", ["text", "binary"])
+def test_queryServer(tmp_path, start_server, id_format):
+    """
+    Test each endpoint of `QueryServer` on a small library.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app, id_format)
+
+    # Function under test.
+    server = start_server(app.db.database_path, connections=2)
+
+    # Verify the summary.
+    summary = requests.get(f"{server.url}/summary").json()
+    assert summary["num_tracks"] == 4
+    assert summary["num_liked_tracks"] == 1
+    assert summary["num_artists"] == 2
+
+    # Verify the search results include the related items.
+    results = requests.get(f"{server.url}/search", params={"q": "dysto"}).json()
+    assert results == [
+        {
+            "kind": "track",
+            "item": {"id": "t1", "name": "Dystopia", "album_id": "b1", "rating": 1},
+            "album": {
+                "id": "b1",
+                "name": "Polaris",
+                "artist_id": "a1",
+                "time_fetched": 0,
+            },
+            "artist": {"id": "a1", "name": "Tesseract", "time_fetched": 0},
+        }
+    ]
+
+    # Verify tracks are filtered by artist name and rating.
+    tracks = requests.get(f"{server.url}/tracks", params={"artist": "Tesseract"}).json()
+    assert sorted(track["id"] for track in tracks) == ["t1", "t2"]
+    tracks = requests.get(f"{server.url}/tracks", params={"rated": "false"}).json()
+    assert sorted(track["id"] for track in tracks) == ["t3", "t4"]
+    tracks = requests.get(f"{server.url}/tracks", params={"rating": -1}).json()
+    assert sorted(track["id"] for track in tracks) == ["t2"]
+
+    # Verify recommendations are ordered by score and limited.
+    url = f"{server.url}/recommendations"
+    results = requests.get(url, params={"limit": 1}).json()
+    assert len(results) == 1
+    assert results[0]["score"] == 0.5
+    assert results[0]["track"]["id"] == "t3"
+    assert results[0]["artist"]["name"] == "Periphery"
+
+    # Verify invalid queries and unknown endpoints are rejected.
+    response = requests.get(f"{server.url}/tracks", params={"limit": 0})
+    assert response.status_code == 400
+    assert response.json()["error"]["status"] == 400
+    assert requests.get(f"{server.url}/search").status_code == 400
+    assert requests.get(f"{server.url}/unknown").status_code == 404
+
+
+def test_queryServer_cache(tmp_path, start_server):
+    """
+    Test `QueryServer` answers repeated queries from the cache until the database is written.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app)
+    server = start_server(app.db.database_path, cache_size=2)
+    url = f"{server.url}/tracks"
+
+    # Function under test.
+    first = requests.get(url, params={"rated": "true"}).json()
+    assert requests.get(url, params={"rated": "true"}).json() == first
+    assert len(server.cache) == 1
+
+    # Verify the least recently used response is evicted.
+    requests.get(f"{server.url}/summary")
+    requests.get(url, params={"rated": "true"})
+    requests.get(f"{server.url}/search", params={"q": "alpha"})
+    assert len(server.cache) == 2
+    assert ("summary", ()) not in server.cache._entries
+
+    # Verify a write from another connection is seen by the next query.
+    with app.db.transaction():
+        app.db.insert_tracks([Track("t3", "Alpha", "b2")], rating=0)
+    tracks = requests.get(url, params={"rated": "true"}).json()
+    assert sorted(track["id"] for track in tracks) == ["t1", "t2", "t3"]
+    assert len(server.cache) == 1
+
+
+def test_databasePool(tmp_path):
+    """
+    Test `DatabasePool` gives out read-only interfaces and takes them back.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app)
+    pool = dut.DatabasePool(app.db.database_path, 1)
+
+    # Function under test.
+    with pool.database() as db:
+        assert db.get_summary()["num_albums"] == 2
+        with pytest.raises(sqlite3.OperationalError):
+            db._con.execute("DELETE FROM tracks")
+
+    # Verify the interface was returned to the pool.
+    with pool.database() as db2:
+        assert db2 is db
+
+        # Verify closing does not wait for an interface in use, which is closed on return.
+        pool.close()
+        assert db2._connection is not None
+    assert db2._connection is None
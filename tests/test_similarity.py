@@ -0,0 +1,127 @@
+import pytest
+
+from musicmanager import similarity as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Album, Artist, Track
+
+np = pytest.importorskip("numpy")
+
+
+def create_library(db):
+    """
+    Insert tracks on a line in feature space, where the tempo and energy of track `i` grow with
+    `i`. The first track is liked and the second disliked.
+    """
+    db.create_tables()
+    with db.transaction():
+        db.insert_artists([Artist("artist", "Artist")])
+        db.insert_albums([Album("album", "Album", "artist")])
+        db.insert_tracks([Track("t0", "Track 0", "album")], rating=1)
+        db.insert_tracks([Track("t1", "Track 1", "album")], rating=-1)
+        db.insert_tracks([Track(f"t{i}", f"Track {i}", "album") for i in range(2, 8)])
+        insert_features(db, range(8))
+
+
+def insert_features(db, indexes):
+    """
+    Insert the features of the tracks with the given indexes.
+    """
+    features = {}
+    for i in indexes:
+        values = {name: 0.5 for name in dut.FEATURES}
+        values.update(tempo=100.0 + 10 * i, energy=0.1 * i)
+        features[f"t{i}"] = values
+    db.insert_audio_features(features)
+
+
+def test_similarTracks(tmp_path):
+    """
+    Test `similar_tracks` for a single track and for the liked tracks.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+    index = dut.FeatureIndex.load(app.db)
+    assert len(index) == 8
+
+    # Function under test for a track. Rated tracks are skipped by default.
+    results = dut.similar_tracks(app.db, index, "t4", limit=3)
+    # The two neighbors are equally far away.
+    assert {id_ for id_, _ in results[:2]} == {"t3", "t5"}
+    assert results[0][1] == pytest.approx(results[1][1])
+    assert "t4" not in {id_ for id_, _ in results}
+
+    # Function under test for the liked tracks, which skips both rated tracks.
+    results = dut.similar_tracks(app.db, index, limit=2)
+    assert [id_ for id_, _ in results] == ["t2", "t3"]
+    results = dut.similar_tracks(app.db, index, limit=2, include_rated=True)
+    assert [id_ for id_, _ in results] == ["t1", "t2"]
+
+    # Verify tracks without features are rejected.
+    with pytest.raises(ValueError):
+        dut.similar_tracks(app.db, index, "unknown")
+
+
+def test_featureIndex_cache(tmp_path, monkeypatch):
+    """
+    Test the feature cache is extended with new rows and rebuilt when rows are replaced.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+    path = dut.cache_path(app.db)
+
+    # Write the cache with the first rows.
+    index = dut.FeatureIndex.load(app.db, path)
+    assert path.exists()
+    with np.load(path) as cache:
+        assert list(cache["ids"]) == [f"t{i}" for i in range(8)]
+
+    # Add features for a new track and verify only the new row is loaded.
+    with app.db.transaction():
+        app.db.insert_tracks([Track("t8", "Track 8", "album")])
+        insert_features(app.db, [8])
+    loaded = []
+    load = app.db.load_audio_features
+
+    def load_audio_features(columns, after=0):
+        loaded.append(after)
+        return load(columns, after=after)
+
+    monkeypatch.setattr(app.db, "load_audio_features", load_audio_features)
+    index = dut.FeatureIndex.load(app.db, path)
+    assert len(index) == 9
+    assert loaded == [index.rowids[7]]
+
+    # Replace the features of the first track, which moves it to a new rowid.
+    with app.db.transaction():
+        insert_features(app.db, [0])
+    index = dut.FeatureIndex.load(app.db, path)
+    assert loaded[-1] == 0
+    assert list(index.ids) == [f"t{i}" for i in range(1, 9)] + ["t0"]
+
+    # Recreate the tables with the same number of other tracks, which reuses the rowids.
+    app.db.create_tables(force=True)
+    with app.db.transaction():
+        app.db.insert_tracks(
+            [Track(f"t{i}", f"Track {i}", "album") for i in range(9, 18)]
+        )
+        insert_features(app.db, range(9, 18))
+    index = dut.FeatureIndex.load(app.db, path)
+    assert loaded[-1] == 0
+    assert list(index.ids) == [f"t{i}" for i in range(9, 18)]
+
+
+def test_run_similar(tmp_path, capsys):
+    """
+    Test the `similar` command lists tracks with their distance and names.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    create_library(app.db)
+
+    # Function under test.
+    app.run(["similar", "--limit", "1"])
+
+    # Verify the output.
+    fields = capsys.readouterr().out.strip().split("\t")
+    assert fields[0] == "t2"
+    assert float(fields[1]) > 0
+    assert fields[2:] == ["", "Track 2", "Album", "Artist"]
@@ -550,3 +550,95 @@ def test_getAlbumTracks_badResponse():
 
         assert api.get_album_tracks(album) is None
         assert mock.call_count == 1
+
+
+def test_getRelatedArtists():
+    """
+    Test `get_related_artists` by mocking the request and checking the response.
+    """
+    # Set arbitrary values since the request is mocked.
+    token = "sample"
+    api = dut.Spotify(token)
+    artist = Artist("0gJ0dOw0r6daBMbl3ANYwe", "Abyss")
+    endpoint = f"https://api.spotify.com/v1/artists/{artist.id}/related-artists"
+
+    # Limited response data.
+    response_data = {
+        "artists": [
+            {"id": "1Ffb6ejR6Fe5IamqA5oRUF", "name": "Bring Me The Horizon"},
+            {"id": "3f6R4b3dRbhT1hQ3Tw4m8b", "name": "Thy Art Is Murder"},
+        ],
+    }
+
+    # Test that a good response results in a list of artists, and a bad response in None.
+    with requests_mock.mock() as mock:
+        mock.get(endpoint, json=response_data, status_code=200)
+        artists = api.get_related_artists(artist)
+        assert mock.call_count == 1
+        assert [(a.id, a.name) for a in artists] == [
+            ("1Ffb6ejR6Fe5IamqA5oRUF", "Bring Me The Horizon"),
+            ("3f6R4b3dRbhT1hQ3Tw4m8b", "Thy Art Is Murder"),
+        ]
+
+        mock.get(endpoint, json={"fake": "data"}, status_code=400)
+        assert api.get_related_artists(artist) is None
+
+
+def test_writePlaylistTracks():
+    """
+    Test `add_playlist_tracks` and `remove_playlist_tracks` send the track URIs in the body.
+    """
+    # Set arbitrary values since the request is mocked.
+    token = "sample"
+    api = dut.Spotify(token)
+    endpoint = "https://api.spotify.com/v1/playlists/3cEYpjA9oz9GiPac4AsH4n/tracks"
+
+    with requests_mock.mock() as mock:
+        mock.post(endpoint, json={"snapshot_id": "a"}, status_code=201)
+        mock.delete(endpoint, json={"snapshot_id": "b"}, status_code=200)
+
+        # Function under test.
+        assert api.add_playlist_tracks("3cEYpjA9oz9GiPac4AsH4n", ["x", "y"]) == "a"
+        assert api.remove_playlist_tracks("3cEYpjA9oz9GiPac4AsH4n", ["z"]) == "b"
+
+        # Verify the request bodies.
+        add, remove = mock.request_history
+        assert add.method == "POST"
+        assert add.json() == {"uris": ["spotify:track:x", "spotify:track:y"]}
+        assert remove.method == "DELETE"
+        assert remove.json() == {"tracks": [{"uri": "spotify:track:z"}]}
+
+        # Verify a bad response results in None.
+        mock.post(endpoint, json={"fake": "data"}, status_code=403)
+        assert api.add_playlist_tracks("3cEYpjA9oz9GiPac4AsH4n", ["x"]) is None
+
+
+def test_get_rateLimited(monkeypatch):
+    """
+    Test `_get` retries rate limited requests after the `Retry-After` delay.
+    """
+    api = dut.Spotify("sample", max_retries=2)
+    endpoint = "https://api.spotify.com/v1/albums/example"
+
+    # Skip the actual delay but record it.
+    delays = []
+    monkeypatch.setattr(dut.time, "sleep", delays.append)
+
+    with requests_mock.mock() as mock:
+        mock.get(
+            endpoint,
+            [
+                {"status_code": 429, "headers": {"Retry-After": "3"}},
+                {"status_code": 200, "json": {"fake": "data"}},
+            ],
+        )
+        response = api._get("/albums/example")
+        assert response.status_code == 200
+        assert mock.call_count == 2
+        assert delays == [3.0]
+
+        # Verify the last response is returned once the retries run out.
+        mock.get(endpoint, status_code=429, headers={"Retry-After": "1"})
+        response = api._get("/albums/example")
+        assert response.status_code == 429
+        assert mock.call_count == 5
@@ -0,0 +1,57 @@
+from musicmanager import synthetic as dut
+from musicmanager.database import encode_id
+
+
+def test_encodeBase62():
+    """
+    Test `encode_base62` by checking padding and the largest 128-bit value.
+    """
+    assert dut.encode_base62(0) == "0" * 22
+    assert dut.encode_base62(61, length=2) == "0Z"
+    assert len(dut.encode_base62(2**128 - 1)) == 22
+
+    # Verify generated ids use the alphabet of Spotify ids, so they are stored in 16 bytes.
+    library = dut.SyntheticLibrary(1000)
+    for i in range(library.num_tracks):
+        assert len(encode_id(library.track_id(i))) == 16
+
+
+def test_syntheticLibrary():
+    """
+    Test `SyntheticLibrary` by checking the item counts and the links between items.
+    """
+    library = dut.SyntheticLibrary(25, tracks_per_album=10, albums_per_artist=2)
+
+    # Verify the counts round up to cover every track.
+    assert library.num_albums == 3
+    assert library.num_artists == 2
+
+    tracks = list(library.iter_tracks(rated=True))
+    albums = list(library.iter_albums())
+    artists = list(library.iter_artists())
+    assert len(tracks) == 25
+    assert len({track.id for track in tracks}) == 25
+
+    # Verify the last track belongs to the last album, which belongs to the last artist.
+    assert tracks[-1].album_id == albums[-1].id
+    assert albums[-1].artist_id == artists[-1].id
+
+    # Verify the library is deterministic and the seed changes the ids.
+    assert dut.SyntheticLibrary(25).track_id(3) == library.track_id(3)
+    assert dut.SyntheticLibrary(25, seed=1).track_id(3) != library.track_id(3)
+
+
+def test_syntheticSpotify():
+    """
+    Test `SyntheticSpotify` returns the albums of an artist and the tracks of an album.
+    """
+    library = dut.SyntheticLibrary(25, tracks_per_album=10, albums_per_artist=2)
+    api = dut.SyntheticSpotify(library)
+
+    albums = api.get_artist_albums(library.artist(1))
+    assert [album.id for album in albums] == [library.album_id(2)]
+
+    tracks = api.get_album_tracks(albums[0])
+    assert [track.id for track in tracks] == [
+        library.track_id(i) for i in range(20, 25)
+    ]
@@ -0,0 +1,92 @@
+import json
+import threading
+
+import requests_mock
+
+from musicmanager import tracing as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.item import Artist
+
+
+def test_tracer_span(tmp_path):
+    """
+    Test `span` records nested spans per thread and `write` exports them.
+    """
+    tracer = dut.Tracer()
+
+    def other():
+        with tracer.span("other"):
+            pass
+
+    # Function under test with nested spans and a span in another thread.
+    with tracer.span("outer", id="a") as span:
+        with tracer.span("inner"):
+            pass
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        span["status"] = 200
+
+    # Verify the parents and attributes. Each thread has its own stack of spans.
+    events = {event["name"]: event for event in tracer.events}
+    assert set(events) == {"outer", "inner", "other"}
+    assert events["outer"]["args"] == {"id": "a", "status": 200}
+    assert events["inner"]["args"] == {"parent": "outer"}
+    assert events["other"]["args"] == {}
+    assert events["other"]["tid"] != events["outer"]["tid"]
+    assert events["inner"]["ts"] >= events["outer"]["ts"]
+    assert events["inner"]["dur"] <= events["outer"]["dur"]
+
+    # Verify the export is in the Chrome trace format.
+    path = tmp_path / "trace.json"
+    tracer.write(path)
+    data = json.loads(path.read_text())
+    assert [event["name"] for event in data["traceEvents"]][:2] == ["outer", "inner"]
+    assert all(event["ph"] == "X" for event in data["traceEvents"])
+
+
+def test_span_disabled():
+    """
+    Test `span` does nothing without an active tracer.
+    """
+    with dut.span("unused", id="a") as span:
+        span["status"] = 200
+
+
+def test_run_trace(tmp_path):
+    """
+    Test the `--trace` option records a span per artist with child spans.
+    """
+    app = SpotifyManager(tmp_path / "test.db")
+    app.run(["init"])
+    with app.db.transaction():
+        app.db.insert_artists([Artist("0gJ0dOw0r6d", "Abyss")])
+
+    # Function under test.
+    path = tmp_path / "trace.json"
+    with requests_mock.Mocker() as mock:
+        mock.get(
+            "https://api.spotify.com/v1/artists/0gJ0dOw0r6d/albums",
+            json={
+                "items": [{"id": "55Eath51v7Cj", "name": "Intergalactic"}],
+                "total": 1,
+            },
+        )
+        mock.get(
+            "https://api.spotify.com/v1/albums/55Eath51v7Cj",
+            json={"id": "55Eath51v7Cj", "tracks": {"items": [], "total": 0}},
+        )
+        app.run(["--trace", str(path), "fetch", "--token", "sample"])
+
+    # Verify the spans and their parents.
+    events = json.loads(path.read_text())["traceEvents"]
+    parents = {(event["name"], event["args"].get("parent")) for event in events}
+    assert ("command", None) in parents
+    assert ("artist", "command") in parents
+    assert ("album", "command") in parents
+    assert ("http", "artist") in parents
+    assert ("parse", "artist") in parents
+    assert ("transaction", "artist") in parents
+    assert ("commit", "transaction") in parents
+    artist = next(event for event in events if event["name"] == "artist")
+    assert artist["args"]["name"] == "Abyss"
@@ -0,0 +1,121 @@
+import logging
+
+import pytest
+
+from musicmanager import transfer as dut
+from musicmanager.core import SpotifyManager
+from musicmanager.database import INDEXES, TRIGGERS, Database
+from musicmanager.item import Album, Artist, Track
+
+
+def create_library(database_path):
+    """
+    Create a database with a few tracks, albums, and artists.
+    """
+    db = Database(database_path)
+    db.create_tables()
+
+    with db.transaction():
+        db.insert_tracks([Track("55Ps7eQ0IpSy", "Beginning", "1B5sG6YCOqg")], rating=1)
+        db.insert_tracks([Track("5xyv86cHra90", 'Auctioneer, "Live"', "1B5sG6YCOqg")])
+        db.insert_tracks([Track("IpSypn32TH6uCi", "End", "lv5djSYqp0X")], rating=-1)
+        db.insert_albums(
+            [
+                Album("1B5sG6YCOqg", "The Beginning", "0gJ0dOw0r6d"),
+                Album("lv5djSYqp0X", "The End", "0gJ0dOw0r6d"),
+            ]
+        )
+        db.insert_artists([Artist("0gJ0dOw0r6d", "Abyss")])
+        db.update_artist_time_fetched(Artist("0gJ0dOw0r6d", "Abyss"))
+
+    return db
+
+
+@pytest.mark.parametrize("fmt", dut.FORMATS)
+def test_exportImportLibrary(tmp_path, fmt):
+    """
+    Test `export_library` and `import_library` by round-tripping a library through each format.
+    """
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+
+    source = create_library(tmp_path / "source.db")
+
+    # Export with a small chunk size to cover multiple chunks.
+    dut.export_library(source, tmp_path / "export", fmt, chunk_size=2)
+    assert (tmp_path / "export" / f"tracks.{fmt}").exists()
+
+    # Import into a new database.
+    target = Database(tmp_path / "target.db")
+    dut.import_library(target, tmp_path / "export", fmt, chunk_size=2)
+
+    # Verify every table matches.
+    for table in ["tracks", "albums", "artists"]:
+        expected = [row for rows in source.iter_rows(table) for row in rows]
+        actual = [row for rows in target.iter_rows(table) for row in rows]
+        assert actual == expected
+
+    # Verify the indexes and triggers were rebuilt after loading.
+    cmd = "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')"
+    names = {row[0] for row in target._con.execute(cmd)}
+    assert set(INDEXES) <= names
+    assert set(TRIGGERS) <= names
+    assert len(list(target.search("beginning"))) == 2
+
+    # Verify the loaded rows were recorded as inserted in the journal of changes.
+    changes = [row for rows in target.iter_changes() for row in rows]
+    assert [row[1:4] for row in changes[-3:]] == [
+        ("album", "1B5sG6YCOqg", "insert"),
+        ("album", "lv5djSYqp0X", "insert"),
+        ("artist", "0gJ0dOw0r6d", "insert"),
+    ]
+    assert len(changes) == 6
+    assert changes[-1][6] > 0
+
+
+@pytest.mark.parametrize("fmt", dut.FORMATS)
+def test_exportImportLibrary_emptyNames(tmp_path, fmt):
+    """
+    Test items with empty names round-trip through each format, keeping the names empty rather
+    than NULL.
+    """
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+
+    source = Database(tmp_path / "source.db")
+    source.create_tables()
+    with source.transaction():
+        source.insert_tracks([Track("t0", "", "b0")])
+        source.insert_albums([Album("b0", "", "a0")])
+        source.insert_artists([Artist("a0", "")])
+
+    # Function under test.
+    dut.export_library(source, tmp_path / "export", fmt)
+    target = Database(tmp_path / "target.db")
+    dut.import_library(target, tmp_path / "export", fmt)
+
+    # Verify the names are empty and the rating is still NULL.
+    assert target.get_tracks()[0].name == ""
+    assert target.get_tracks()[0].rating is None
+    assert target.get_albums()[0].name == ""
+    assert target.get_artists()[0].name == ""
+
+
+def test_importLibrary_nonEmpty(tmp_path, caplog):
+    """
+    Test `import_library` refuses to load into a database that already has data.
+    """
+    source = create_library(tmp_path / "source.db")
+    dut.export_library(source, tmp_path / "export")
+
+    # Importing into the same database must fail without changing it.
+    with pytest.raises(RuntimeError):
+        dut.import_library(source, tmp_path / "export")
+    assert source.count_rows("tracks") == 3
+
+    # Verify the command logs the error instead of raising it.
+    app = SpotifyManager(source.database_path)
+    with caplog.at_level(logging.ERROR):
+        app.run(["import", str(tmp_path / "export")])
+    assert "non-empty table" in caplog.text
+    assert source.count_rows("tracks") == 3